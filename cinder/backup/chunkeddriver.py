@@ -22,8 +22,12 @@
 """
 
 import abc
+import bisect
+import collections
+import errno
 import hashlib
 import json
+import mmap
 import os
 import sys
 
@@ -36,6 +40,7 @@ from oslo_utils import units
 import six
 
 from cinder.backup import driver
+from cinder import coordination
 from cinder import exception
 from cinder.i18n import _
 from cinder import objects
@@ -52,8 +57,57 @@ chunkedbackup_service_opts = [
                default='zlib',
                choices=['none', 'off', 'no',
                         'zlib', 'gzip',
-                        'bz2', 'bzip2'],
-               help='Compression algorithm (None to disable)'),
+                        'bz2', 'bzip2',
+                        'zstd', 'lz4'],
+               help='Compression algorithm (None to disable). zstd and lz4 '
+                    'require the zstandard and lz4 python packages.'),
+    cfg.IntOpt('backup_compression_level',
+               help='Compression level used by the backup compression '
+                    'algorithm. The valid values depend on the algorithm, '
+                    'when unset the default level of the algorithm is '
+                    'used.'),
+    cfg.IntOpt('backup_compression_threads',
+               default=1,
+               min=1,
+               help='Number of threads used to compress each backup chunk '
+                    'with zstd. Other algorithms always compress each chunk '
+                    'in a single thread, chunks can be compressed in '
+                    'parallel with backup_max_concurrent_uploads.'),
+    cfg.IntOpt('backup_max_concurrent_uploads',
+               default=1,
+               min=1,
+               help='Maximum number of backup chunks that chunked backup '
+                    'drivers compress and upload to the backup repository '
+                    'at the same time. Reading the volume is paused while '
+                    'this many uploads are in flight, so the memory used '
+                    'by a backup is bounded by this value times the size '
+                    'of a chunk. The default of 1 uploads the chunks '
+                    'sequentially.'),
+    cfg.IntOpt('backup_max_concurrent_downloads',
+               default=1,
+               min=1,
+               help='Maximum number of backup objects that chunked backup '
+                    'drivers download and decompress ahead of writing them '
+                    'to the volume during a restore. The memory used by a '
+                    'restore is bounded by this value times the size of a '
+                    'chunk.'),
+    cfg.BoolOpt('backup_enable_deduplication',
+                default=False,
+                help='Store each unique hash block of the backups made by '
+                     'chunked backup drivers only once per container, in a '
+                     'content addressed namespace with reference counting. '
+                     'The hash block size of the driver is the '
+                     'deduplication unit, so it should be increased to a '
+                     'few MiB when this is enabled. Backups created with '
+                     'deduplication cannot be restored by older backup '
+                     'services.'),
+    cfg.BoolOpt('backup_detect_zero_blocks',
+                default=False,
+                help='Detect hash blocks that only contain zeros when '
+                     'creating backups with chunked backup drivers, and '
+                     'record them as holes in the backup metadata instead '
+                     'of storing them. Backups with holes cannot be '
+                     'restored by older backup services.'),
 ]
 
 CONF = cfg.CONF
@@ -65,6 +119,120 @@ CONF.register_opts(chunkedbackup_service_opts)
 # (https://github.com/eventlet/eventlet/issues/432) that would result in
 # failures.
 
+
+class _LeveledCompressor(object):
+    """Compressor of a module using a specific compression level."""
+
+    def __init__(self, module, level):
+        self._module = module
+        self._level = level
+
+    def compress(self, data):
+        return self._module.compress(data, self._level)
+
+    def decompress(self, data):
+        return self._module.decompress(data)
+
+
+class _ZstdCompressor(object):
+    """zstd compressor with the interface of the zlib module."""
+
+    def __init__(self, level=None, threads=1):
+        import zstandard
+        self._zstd = zstandard
+        self._level = 3 if level is None else level
+        self._threads = threads if threads > 1 else 0
+
+    def compress(self, data):
+        # zstd contexts can't be shared among threads, and chunks may be
+        # compressed in parallel, so use a new context for each chunk.
+        compressor = self._zstd.ZstdCompressor(level=self._level,
+                                               threads=self._threads)
+        return compressor.compress(data)
+
+    def decompress(self, data):
+        return self._zstd.ZstdDecompressor().decompress(data)
+
+
+class _ExtentMap(object):
+    """Map volume ranges to the last backup object that wrote them.
+
+    Adding an extent replaces whatever was mapped to that range before, so
+    layering the objects of a backup chain from the full backup to the last
+    incremental gives the object that holds the current data of each range.
+    """
+
+    def __init__(self):
+        self._starts = []
+        self._extents = []
+
+    def add(self, start, end, source):
+        index = max(bisect.bisect_right(self._starts, start) - 1, 0)
+        last = index
+        replacement = []
+        while (last < len(self._extents) and
+               self._extents[last][0] < end):
+            ext_start, ext_end, ext_source = self._extents[last]
+            if ext_end <= start:
+                replacement.append(self._extents[last])
+            else:
+                if ext_start < start:
+                    replacement.append((ext_start, start, ext_source))
+                if ext_end > end:
+                    replacement.append((end, ext_end, ext_source))
+            last += 1
+        replacement.append((start, end, source))
+        replacement.sort(key=lambda extent: extent[0])
+        self._extents[index:last] = replacement
+        self._starts[index:last] = [extent[0] for extent in replacement]
+
+    def __iter__(self):
+        return iter(self._extents)
+
+
+class _ChunkUploader(object):
+    """Run chunk uploads on a bounded pool of greenthreads.
+
+    Submitting an upload blocks once `size` uploads are in flight, which
+    throttles the reading of the volume and bounds the memory in use.
+    """
+
+    def __init__(self, size):
+        self._pool = eventlet.GreenPool(size)
+        self._uploads = []
+
+    def submit(self, func, *args):
+        self._check_failures()
+        self._uploads.append(self._pool.spawn(func, *args))
+
+    def _check_failures(self):
+        pending = []
+        for upload in self._uploads:
+            if upload.dead:
+                # Raises the exception of the upload, if it failed.
+                upload.wait()
+            else:
+                pending.append(upload)
+        self._uploads = pending
+
+    def wait(self, reraise=True):
+        """Wait until all submitted uploads are done.
+
+        The first failure is only raised once every upload has finished, so
+        no upload is left writing to the backup repository afterwards.
+        """
+        failure = None
+        for upload in self._uploads:
+            try:
+                upload.wait()
+            except Exception:
+                if failure is None:
+                    failure = sys.exc_info()
+        self._uploads = []
+        if failure and reraise:
+            six.reraise(*failure)
+
+
 @six.add_metaclass(abc.ABCMeta)
 class ChunkedBackupDriver(driver.BackupDriver):
     """Abstract chunked backup driver.
@@ -79,9 +247,15 @@ class ChunkedBackupDriver(driver.BackupDriver):
     """
 
     DRIVER_VERSION = '1.0.0'
-    DRIVER_VERSION_MAPPING = {'1.0.0': '_restore_v1'}
-
-    def _get_compressor(self, algorithm):
+    SPARSE_DRIVER_VERSION = '1.1.0'
+    DEDUP_DRIVER_VERSION = '2.0.0'
+    DRIVER_VERSION_MAPPING = {'1.0.0': '_restore_v1',
+                              '1.1.0': '_restore_v1',
+                              '2.0.0': '_restore_v2'}
+    DEDUP_OBJECT_PREFIX = 'dedup_block_'
+    DEDUP_INDEX_NAME = 'dedup_index'
+
+    def _get_compressor(self, algorithm, level=None, threads=1):
         try:
             if algorithm.lower() in ('none', 'off', 'no'):
                 return None
@@ -91,8 +265,15 @@ class ChunkedBackupDriver(driver.BackupDriver):
             elif algorithm.lower() in ('bz2', 'bzip2'):
                 import bz2 as compressor
                 result = compressor
+            elif algorithm.lower() == 'zstd':
+                return eventlet.tpool.Proxy(_ZstdCompressor(level, threads))
+            elif algorithm.lower() == 'lz4':
+                import lz4.frame as compressor
+                result = compressor
             else:
                 result = None
+            if result and level is not None:
+                result = _LeveledCompressor(result, level)
             if result:
                 # NOTE(geguileo): Compression/Decompression starves
                 # greenthreads so we use a native thread instead.
@@ -117,7 +298,18 @@ class ChunkedBackupDriver(driver.BackupDriver):
         self.az = CONF.storage_availability_zone
         self.backup_compression_algorithm = CONF.backup_compression_algorithm
         self.compressor = \
-            self._get_compressor(CONF.backup_compression_algorithm)
+            self._get_compressor(CONF.backup_compression_algorithm,
+                                 CONF.backup_compression_level,
+                                 CONF.backup_compression_threads)
+        self.max_concurrent_uploads = CONF.backup_max_concurrent_uploads
+        self.max_concurrent_downloads = CONF.backup_max_concurrent_downloads
+        self.enable_deduplication = CONF.backup_enable_deduplication
+        self.zero_block_sha = None
+        if CONF.backup_detect_zero_blocks:
+            self.zero_block_sha = hashlib.sha256(
+                b'\0' * self.sha_block_size_bytes).hexdigest()
+        # Zeros standing for the holes skipped when reading a volume.
+        self._zero_chunk = None
         self.support_force_delete = True
 
         if sys.platform == 'win32' and self.chunk_size_bytes % 4096:
@@ -243,13 +435,14 @@ class ChunkedBackupDriver(driver.BackupDriver):
         return filename
 
     def _write_metadata(self, backup, volume_id, container, object_list,
-                        volume_meta, extra_metadata=None):
+                        volume_meta, extra_metadata=None, version=None,
+                        holes=None):
         filename = self._metadata_filename(backup)
         LOG.debug('_write_metadata started, container name: %(container)s,'
                   ' metadata filename: %(filename)s.',
                   {'container': container, 'filename': filename})
         metadata = {}
-        metadata['version'] = self.DRIVER_VERSION
+        metadata['version'] = version or self.DRIVER_VERSION
         metadata['backup_id'] = backup['id']
         metadata['volume_id'] = volume_id
         metadata['backup_name'] = backup['display_name']
@@ -260,6 +453,8 @@ class ChunkedBackupDriver(driver.BackupDriver):
         metadata['volume_meta'] = volume_meta
         if extra_metadata:
             metadata['extra_metadata'] = extra_metadata
+        if holes:
+            metadata['holes'] = holes
         metadata_json = json.dumps(metadata, sort_keys=True, indent=2)
         if six.PY3:
             metadata_json = metadata_json.encode('utf-8')
@@ -353,8 +548,13 @@ class ChunkedBackupDriver(driver.BackupDriver):
                 volume_size_bytes)
 
     def _backup_chunk(self, backup, container, data, data_offset,
-                      object_meta, extra_metadata):
-        """Backup data chunk based on the object metadata and offset."""
+                      object_meta, extra_metadata, uploader=None):
+        """Backup data chunk based on the object metadata and offset.
+
+        The object is added to the metadata right away, so the object list
+        keeps the order of the volume even when an uploader is given and the
+        chunk is compressed and uploaded asynchronously.
+        """
         object_prefix = object_meta['prefix']
         object_list = object_meta['list']
 
@@ -364,26 +564,299 @@ class ChunkedBackupDriver(driver.BackupDriver):
         obj[object_name] = {}
         obj[object_name]['offset'] = data_offset
         obj[object_name]['length'] = len(data)
+        object_list.append(obj)
+        object_id += 1
+        object_meta['list'] = object_list
+        object_meta['id'] = object_id
+
+        if uploader is None:
+            self._upload_chunk(container, object_name, obj[object_name],
+                               data, extra_metadata)
+        else:
+            uploader.submit(self._upload_chunk, container, object_name,
+                            obj[object_name], data, extra_metadata)
+
+        LOG.debug('Calling eventlet.sleep(0)')
+        eventlet.sleep(0)
+
+    def _upload_chunk(self, container, object_name, object_info, data,
+                      extra_metadata):
+        """Compress and store a chunk, completing its object metadata."""
         LOG.debug('Backing up chunk of data from volume.')
         algorithm, output_data = self._prepare_output_data(data)
-        obj[object_name]['compression'] = algorithm
+        object_info['compression'] = algorithm
         LOG.debug('About to put_object')
         with self._get_object_writer(
                 container, object_name, extra_metadata=extra_metadata
         ) as writer:
             writer.write(output_data)
         md5 = eventlet.tpool.execute(hashlib.md5, data).hexdigest()
-        obj[object_name]['md5'] = md5
+        object_info['md5'] = md5
         LOG.debug('backup MD5 for %(object_name)s: %(md5)s',
                   {'object_name': object_name, 'md5': md5})
-        object_list.append(obj)
-        object_id += 1
-        object_meta['list'] = object_list
-        object_meta['id'] = object_id
 
-        LOG.debug('Calling eventlet.sleep(0)')
+    def _add_hole(self, object_meta, offset, length):
+        """Record a zero filled range of the volume."""
+        holes = object_meta.setdefault('holes', [])
+        if holes and holes[-1][0] + holes[-1][1] == offset:
+            holes[-1][1] += length
+        else:
+            holes.append([offset, length])
+
+    def _get_hole_length(self, volume_file, offset, length):
+        """Return the length of the hole at offset of the volume file.
+
+        The file is asked with SEEK_HOLE and SEEK_DATA, where it supports
+        them, for a hole covering the length bytes from offset, or the end
+        of the file. Only whole hash blocks are counted, and 0 is returned
+        when there is no such hole.
+        """
+        if not hasattr(os, 'SEEK_DATA') or sys.platform == 'win32':
+            return 0
+        try:
+            fd = volume_file.fileno()
+        except (AttributeError, IOError, ValueError):
+            return 0
+
+        try:
+            end = os.fstat(fd).st_size
+            if os.lseek(fd, offset, os.SEEK_HOLE) != offset:
+                return 0
+            try:
+                data = os.lseek(fd, offset, os.SEEK_DATA)
+            except OSError as e:
+                # There is no data after offset.
+                if e.errno != errno.ENXIO:
+                    raise
+                data = end
+        except OSError:
+            return 0
+        finally:
+            volume_file.seek(offset)
+
+        hole = min(data, end, offset + length) - offset
+        if hole != length and offset + hole != end:
+            return 0
+        return hole - hole % self.sha_block_size_bytes
+
+    def _read_chunk(self, volume_file, data_offset, read_bytes):
+        """Read a chunk of the volume and calculate its hash block shas.
+
+        With zero block detection, holes of the volume file are skipped
+        instead of read and hashed.
+        """
+        hole = 0
+        if self.zero_block_sha:
+            hole = self._get_hole_length(volume_file, data_offset,
+                                         read_bytes)
+        if not hole:
+            data = volume_file.read(read_bytes)
+            if data == b'':
+                return data, []
+            return data, eventlet.tpool.execute(self._calculate_sha, data)
+
+        volume_file.seek(data_offset + hole)
+        if self._zero_chunk is None or len(self._zero_chunk) < hole:
+            self._zero_chunk = memoryview(mmap.mmap(-1, hole))
+        return (self._zero_chunk[:hole],
+                [self.zero_block_sha] * (hole // self.sha_block_size_bytes))
+
+    def _backup_extents(self, backup, container, data, data_offset, shalist,
+                        parent_shalist, object_meta, extra_metadata,
+                        uploader=None):
+        """Backup the extents of a chunk that need to be stored.
+
+        Hash blocks that did not change since the parent backup are skipped,
+        and zero blocks are recorded as holes when zero block detection is
+        enabled.
+        """
+        extent_off = -1
+        for idx, sha in enumerate(shalist):
+            block_off = idx * self.sha_block_size_bytes
+            changed = not parent_shalist or sha != parent_shalist[idx]
+            store = changed and sha != self.zero_block_sha
+            if store:
+                if extent_off == -1:
+                    # Start of new extent.
+                    extent_off = block_off
+                continue
+            if changed:
+                self._add_hole(object_meta, data_offset + block_off,
+                               min(self.sha_block_size_bytes,
+                                   len(data) - block_off))
+            if extent_off != -1:
+                # We've reached the end of extent.
+                self._backup_chunk(backup, container,
+                                   data[extent_off:block_off],
+                                   data_offset + extent_off, object_meta,
+                                   extra_metadata, uploader=uploader)
+                extent_off = -1
+
+        # The last extent extends to the end of data buffer.
+        if extent_off != -1:
+            self._backup_chunk(backup, container, data[extent_off:],
+                               data_offset + extent_off, object_meta,
+                               extra_metadata, uploader=uploader)
+
+    def _backup_dedup_chunk(self, container, data, data_offset, shalist,
+                            parent_shalist, object_meta, extra_metadata,
+                            dedup_blocks, uploader):
+        """Backup the hash blocks of a chunk that changed since the parent."""
+        for idx, sha in enumerate(shalist):
+            if parent_shalist and sha == parent_shalist[idx]:
+                continue
+            block_off = idx * self.sha_block_size_bytes
+            block = data[block_off:block_off + self.sha_block_size_bytes]
+            if sha == self.zero_block_sha:
+                self._add_hole(object_meta, data_offset + block_off,
+                               len(block))
+                continue
+            self._backup_dedup_block(container, block,
+                                     data_offset + block_off, sha,
+                                     object_meta, extra_metadata,
+                                     dedup_blocks, uploader=uploader)
+
+    def _backup_dedup_block(self, container, data, data_offset, sha,
+                            object_meta, extra_metadata, dedup_blocks,
+                            uploader=None):
+        """Backup a hash block to the content addressed namespace.
+
+        Blocks that are already in dedup_blocks, because they are stored in
+        the container or were uploaded earlier in this backup, are only
+        referenced from the metadata.
+        """
+        object_name = self.DEDUP_OBJECT_PREFIX + sha
+        obj = {}
+        obj[object_name] = {}
+        obj[object_name]['offset'] = data_offset
+        obj[object_name]['length'] = len(data)
+        object_meta['list'].append(obj)
+        if sha in dedup_blocks:
+            return
+
+        block_info = dedup_blocks[sha] = {}
+        object_meta['id'] += 1
+        if uploader is None:
+            self._upload_chunk(container, object_name, block_info, data,
+                               extra_metadata)
+        else:
+            uploader.submit(self._upload_chunk, container, object_name,
+                            block_info, data, extra_metadata)
+
         eventlet.sleep(0)
 
+    def _read_dedup_index(self, container):
+        """Return the reference counts of the deduplicated blocks."""
+        if (self.DEDUP_INDEX_NAME not in
+                self.get_container_entries(container, self.DEDUP_INDEX_NAME)):
+            return {'blocks': {}}
+        with self._get_object_reader(container,
+                                     self.DEDUP_INDEX_NAME) as reader:
+            index_json = reader.read()
+        if six.PY3:
+            index_json = index_json.decode('utf-8')
+        return json.loads(index_json)
+
+    def _write_dedup_index(self, container, index):
+        index_json = json.dumps(index, sort_keys=True)
+        if six.PY3:
+            index_json = index_json.encode('utf-8')
+        with self._get_object_writer(container,
+                                     self.DEDUP_INDEX_NAME) as writer:
+            writer.write(index_json)
+
+    def _backups_in_progress(self, container):
+        backups = objects.BackupList.get_all(
+            self.context.elevated(),
+            filters={'container': container,
+                     'status': fields.BackupStatus.CREATING})
+        return len(backups) > 0
+
+    def _collect_dedup_blocks(self, container, index, shas):
+        """Delete the given blocks when no reference to them is left.
+
+        Nothing is deleted while backups are being created in the
+        container, as they may rely on blocks that are not referenced yet.
+        Those blocks stay in the index and are collected on a later delete.
+        """
+        if self._backups_in_progress(container):
+            LOG.debug('Backups in progress in container %s, not deleting '
+                      'unreferenced deduplicated blocks.', container)
+            return
+        for sha in shas:
+            if index['blocks'].get(sha, {}).get('refs', 0) <= 0:
+                self.delete_object(container, self.DEDUP_OBJECT_PREFIX + sha)
+                index['blocks'].pop(sha, None)
+                eventlet.sleep(0)
+
+    @coordination.synchronized('backup-dedup-{container}')
+    def _add_dedup_references(self, container, dedup_blocks, shas):
+        index = self._read_dedup_index(container)
+        for sha in shas:
+            block_info = dedup_blocks[sha]
+            entry = index['blocks'].setdefault(
+                sha, {'refs': 0,
+                      'compression': block_info['compression'],
+                      'md5': block_info['md5']})
+            entry['refs'] += 1
+        self._write_dedup_index(container, index)
+
+    @coordination.synchronized('backup-dedup-{container}')
+    def _remove_dedup_references(self, container, shas):
+        index = self._read_dedup_index(container)
+        for sha in shas:
+            entry = index['blocks'].get(sha)
+            if entry:
+                entry['refs'] = max(entry['refs'] - 1, 0)
+        unreferenced = [sha for sha, block in index['blocks'].items()
+                        if block['refs'] <= 0]
+        self._collect_dedup_blocks(container, index, unreferenced)
+        self._write_dedup_index(container, index)
+
+    @coordination.synchronized('backup-dedup-{container}')
+    def _discard_dedup_blocks(self, container, shas):
+        """Delete blocks uploaded by a backup that was not finalized."""
+        index = self._read_dedup_index(container)
+        self._collect_dedup_blocks(
+            container, index,
+            [sha for sha in shas if sha not in index['blocks']])
+
+    def _finalize_dedup(self, container, object_meta, dedup_blocks):
+        """Reference the blocks of a deduplicated backup.
+
+        Completes the metadata of every object with the compression and MD5
+        of its block and takes a reference on each distinct block.
+        """
+        shas = set()
+        for obj in object_meta['list']:
+            object_name, object_info = list(obj.items())[0]
+            sha = object_name[len(self.DEDUP_OBJECT_PREFIX):]
+            object_info['compression'] = dedup_blocks[sha]['compression']
+            object_info['md5'] = dedup_blocks[sha]['md5']
+            shas.add(sha)
+        self._add_dedup_references(container, dedup_blocks, shas)
+
+    def _release_dedup_references(self, backup):
+        """Drop the block references of a deduplicated backup."""
+        container = backup['container']
+        if (self.DEDUP_INDEX_NAME not in
+                self.get_container_entries(container, self.DEDUP_INDEX_NAME)):
+            return
+        try:
+            metadata = self._read_metadata(backup)
+        except Exception:
+            LOG.warning('Error while reading the metadata of backup %s, '
+                        'its deduplicated blocks are not released.',
+                        backup['id'])
+            return
+        if metadata.get('version') != self.DEDUP_DRIVER_VERSION:
+            return
+        shas = set()
+        for obj in metadata['objects']:
+            object_name = list(obj.keys())[0]
+            shas.add(object_name[len(self.DEDUP_OBJECT_PREFIX):])
+        self._remove_dedup_references(container, shas)
+
     def _prepare_output_data(self, data):
         if self.compressor is None:
             return 'none', data
@@ -410,13 +883,18 @@ class ChunkedBackupDriver(driver.BackupDriver):
                    })
         return algorithm, compressed_data
 
-    def _finalize_backup(self, backup, container, object_meta, object_sha256):
+    def _finalize_backup(self, backup, container, object_meta, object_sha256,
+                         version=None):
         """Write the backup's metadata to the backup repository."""
         object_list = object_meta['list']
         object_id = object_meta['id']
         volume_meta = object_meta['volume_meta']
         sha256_list = object_sha256['sha256s']
         extra_metadata = object_meta.get('extra_metadata')
+        holes = object_meta.get('holes')
+        # Older services would restore garbage instead of zeros in holes.
+        if holes and version is None:
+            version = self.SPARSE_DRIVER_VERSION
         self._write_sha256file(backup,
                                backup.volume_id,
                                container,
@@ -426,7 +904,9 @@ class ChunkedBackupDriver(driver.BackupDriver):
                              container,
                              object_list,
                              volume_meta,
-                             extra_metadata)
+                             extra_metadata,
+                             version,
+                             holes)
         # NOTE(whoami-rajat) : The object_id variable is used to name
         # the backup objects and hence differs from the object_count
         # variable, therefore the increment of object_id value in the last
@@ -494,6 +974,19 @@ class ChunkedBackupDriver(driver.BackupDriver):
             off += self.sha_block_size_bytes
         return shalist
 
+    def _cancel_backup(self, backup, container, uploader, dedup_blocks,
+                       stored_blocks):
+        # Let in-flight uploads finish so their objects get deleted as well.
+        if uploader:
+            uploader.wait(reraise=False)
+        if dedup_blocks is not None:
+            self._discard_dedup_blocks(container,
+                                       set(dedup_blocks) - stored_blocks)
+        # To avoid the chunk left when deletion complete, need to
+        # clean up the object of chunk again.
+        self.delete_backup(backup)
+        LOG.debug('Cancel the backup process of %s.', backup.id)
+
     def backup(self, backup, volume_file, backup_metadata=True):
         """Backup the given volume.
 
@@ -560,83 +1053,89 @@ class ChunkedBackupDriver(driver.BackupDriver):
         sha256_list = object_sha256['sha256s']
         shaindex = 0
         is_backup_canceled = False
-        while True:
-            # First of all, we check the status of this backup. If it
-            # has been changed to delete or has been deleted, we cancel the
-            # backup process to do forcing delete.
-            with backup.as_read_deleted():
-                backup.refresh()
-            if backup.status in (fields.BackupStatus.DELETING,
-                                 fields.BackupStatus.DELETED):
-                is_backup_canceled = True
-                # To avoid the chunk left when deletion complete, need to
-                # clean up the object of chunk again.
-                self.delete_backup(backup)
-                LOG.debug('Cancel the backup process of %s.', backup.id)
-                break
-            data_offset = volume_file.tell()
-
-            if sys.platform == 'win32':
-                read_bytes = min(self.chunk_size_bytes,
-                                 win32_disk_size - data_offset)
-            else:
-                read_bytes = self.chunk_size_bytes
-            data = volume_file.read(read_bytes)
-
-            if data == b'':
-                break
-
-            # Calculate new shas with the datablock.
-            shalist = eventlet.tpool.execute(self._calculate_sha, data)
-            sha256_list.extend(shalist)
-
-            # If parent_backup is not None, that means an incremental
-            # backup will be performed.
-            if parent_backup:
-                # Find the extent that needs to be backed up.
-                extent_off = -1
-                for idx, sha in enumerate(shalist):
-                    if sha != parent_backup_shalist[shaindex]:
-                        if extent_off == -1:
-                            # Start of new extent.
-                            extent_off = idx * self.sha_block_size_bytes
-                    else:
-                        if extent_off != -1:
-                            # We've reached the end of extent.
-                            extent_end = idx * self.sha_block_size_bytes
-                            segment = data[extent_off:extent_end]
-                            self._backup_chunk(backup, container, segment,
-                                               data_offset + extent_off,
-                                               object_meta,
-                                               extra_metadata)
-                            extent_off = -1
-                    shaindex += 1
-
-                # The last extent extends to the end of data buffer.
-                if extent_off != -1:
-                    extent_end = len(data)
-                    segment = data[extent_off:extent_end]
-                    self._backup_chunk(backup, container, segment,
-                                       data_offset + extent_off,
-                                       object_meta, extra_metadata)
-                    extent_off = -1
-            else:  # Do a full backup.
-                self._backup_chunk(backup, container, data, data_offset,
-                                   object_meta, extra_metadata)
-
-            # Notifications
-            total_block_sent_num += self.data_block_num
-            counter += 1
-            if counter == self.data_block_num:
-                # Send the notification to Ceilometer when the chunk
-                # number reaches the data_block_num.  The backup percentage
-                # is put in the metadata as the extra information.
-                self._send_progress_notification(self.context, backup,
-                                                 object_meta,
-                                                 total_block_sent_num,
-                                                 volume_size_bytes)
-                # Reset the counter
-                counter = 0
+        # With deduplication every changed hash block is stored in the
+        # content addressed namespace of the container, unless it's there.
+        dedup_blocks = stored_blocks = None
+        if self.enable_deduplication:
+            dedup_blocks = self._read_dedup_index(container)['blocks']
+            stored_blocks = set(dedup_blocks)
+        # Chunks are read and hashed here, while compressing and uploading
+        # them can be done by several greenthreads at the same time.
+        uploader = None
+        if self.max_concurrent_uploads > 1:
+            uploader = _ChunkUploader(self.max_concurrent_uploads)
+        try:
+            while True:
+                # First of all, we check the status of this backup. If it
+                # has been changed to delete or has been deleted, we cancel the
+                # backup process to do forcing delete.
+                with backup.as_read_deleted():
+                    backup.refresh()
+                if backup.status in (fields.BackupStatus.DELETING,
+                                     fields.BackupStatus.DELETED):
+                    is_backup_canceled = True
+                    self._cancel_backup(backup, container, uploader,
+                                        dedup_blocks, stored_blocks)
+                    break
+                data_offset = volume_file.tell()
+
+                if sys.platform == 'win32':
+                    read_bytes = min(self.chunk_size_bytes,
+                                     win32_disk_size - data_offset)
+                else:
+                    read_bytes = self.chunk_size_bytes
+                data, shalist = self._read_chunk(volume_file, data_offset,
+                                                 read_bytes)
+
+                if data == b'':
+                    break
+
+                sha256_list.extend(shalist)
+
+                parent_shalist = None
+                if parent_backup:
+                    parent_shalist = parent_backup_shalist[
+                        shaindex:shaindex + len(shalist)]
+                shaindex += len(shalist)
+
+                if dedup_blocks is not None:
+                    self._backup_dedup_chunk(container, data, data_offset,
+                                             shalist, parent_shalist,
+                                             object_meta, extra_metadata,
+                                             dedup_blocks, uploader)
+                # If parent_backup is not None, that means an incremental
+                # backup will be performed.
+                elif parent_backup or self.zero_block_sha:
+                    self._backup_extents(backup, container, data,
+                                         data_offset, shalist,
+                                         parent_shalist, object_meta,
+                                         extra_metadata, uploader=uploader)
+                else:  # Do a full backup.
+                    self._backup_chunk(backup, container, data, data_offset,
+                                       object_meta, extra_metadata,
+                                       uploader=uploader)
+
+                # Notifications
+                total_block_sent_num += self.data_block_num
+                counter += 1
+                if counter == self.data_block_num:
+                    # Send the notification to Ceilometer when the chunk
+                    # number reaches the data_block_num.  The backup percentage
+                    # is put in the metadata as the extra information.
+                    self._send_progress_notification(self.context, backup,
+                                                     object_meta,
+                                                     total_block_sent_num,
+                                                     volume_size_bytes)
+                    # Reset the counter
+                    counter = 0
+
+            # Metadata can only be written once every object is stored.
+            if uploader:
+                uploader.wait()
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                if uploader:
+                    uploader.wait(reraise=False)
 
         # Stop the timer.
         timer.stop()
@@ -657,7 +1156,69 @@ class ChunkedBackupDriver(driver.BackupDriver):
                     LOG.exception("Backup volume metadata failed.")
                     self.delete_backup(backup)
 
-        self._finalize_backup(backup, container, object_meta, object_sha256)
+        if dedup_blocks is not None:
+            self._finalize_dedup(container, object_meta, dedup_blocks)
+            self._finalize_backup(backup, container, object_meta,
+                                  object_sha256, self.DEDUP_DRIVER_VERSION)
+        else:
+            self._finalize_backup(backup, container, object_meta,
+                                  object_sha256)
+
+    def _check_object_list(self, backup, metadata):
+        """Check that the backup objects match the ones in its metadata."""
+        metadata_object_names = []
+        for obj in metadata['objects']:
+            metadata_object_names.extend(obj.keys())
+        LOG.debug('metadata_object_names = %s.', metadata_object_names)
+        prune_list = [self._metadata_filename(backup),
+                      self._sha256_filename(backup)]
+        object_names = [object_name for object_name in
+                        self._generate_object_names(backup)
+                        if object_name not in prune_list]
+        if sorted(object_names) != sorted(metadata_object_names):
+            err = _('restore_backup aborted, actual object list '
+                    'does not match object list stored in metadata.')
+            raise exception.InvalidBackup(reason=err)
+
+    def _check_restore_canceled(self, backup, volume_id, requested_backup):
+        # Abort when status changes to error, available, or anything else
+        with requested_backup.as_read_deleted():
+            requested_backup.refresh()
+        if requested_backup.status != fields.BackupStatus.RESTORING:
+            raise exception.BackupRestoreCancel(back_id=backup.id,
+                                                vol_id=volume_id)
+
+    def _read_object(self, container, object_name, obj, extra_metadata):
+        """Return the volume data stored in a backup object."""
+        with self._get_object_reader(
+                container, object_name,
+                extra_metadata=extra_metadata) as reader:
+            body = reader.read()
+        compression_algorithm = obj['compression']
+        decompressor = self._get_compressor(compression_algorithm)
+        if decompressor is None:
+            return body
+        LOG.debug('decompressing data using %s algorithm',
+                  compression_algorithm)
+        return decompressor.decompress(body)
+
+    def _fsync(self, volume_file):
+        # Be tolerant to IO implementations that do not support fileno()
+        try:
+            fileno = volume_file.fileno()
+        except IOError:
+            LOG.info("volume_file does not support fileno() so skipping "
+                     "fsync()")
+        else:
+            os.fsync(fileno)
+
+    def _write_zeros(self, volume_file, offset, length):
+        zeros = b'\0' * min(length, 4 * units.Mi)
+        volume_file.seek(offset)
+        while length > 0:
+            volume_file.write(zeros if length >= len(zeros)
+                              else zeros[:length])
+            length -= len(zeros)
 
     def _restore_v1(self, backup, volume_id, metadata, volume_file,
                     requested_backup):
@@ -672,27 +1233,10 @@ class ChunkedBackupDriver(driver.BackupDriver):
         extra_metadata = metadata.get('extra_metadata')
         container = backup['container']
         metadata_objects = metadata['objects']
-        metadata_object_names = []
-        for obj in metadata_objects:
-            metadata_object_names.extend(obj.keys())
-        LOG.debug('metadata_object_names = %s.', metadata_object_names)
-        prune_list = [self._metadata_filename(backup),
-                      self._sha256_filename(backup)]
-        object_names = [object_name for object_name in
-                        self._generate_object_names(backup)
-                        if object_name not in prune_list]
-        if sorted(object_names) != sorted(metadata_object_names):
-            err = _('restore_backup aborted, actual object list '
-                    'does not match object list stored in metadata.')
-            raise exception.InvalidBackup(reason=err)
+        self._check_object_list(backup, metadata)
 
         for metadata_object in metadata_objects:
-            # Abort when status changes to error, available, or anything else
-            with requested_backup.as_read_deleted():
-                requested_backup.refresh()
-            if requested_backup.status != fields.BackupStatus.RESTORING:
-                raise exception.BackupRestoreCancel(back_id=backup.id,
-                                                    vol_id=volume_id)
+            self._check_restore_canceled(backup, volume_id, requested_backup)
 
             object_name, obj = list(metadata_object.items())[0]
             LOG.debug('restoring object. backup: %(backup_id)s, '
@@ -705,40 +1249,119 @@ class ChunkedBackupDriver(driver.BackupDriver):
                           'volume_id': volume_id,
                       })
 
-            with self._get_object_reader(
-                    container, object_name,
-                    extra_metadata=extra_metadata) as reader:
-                body = reader.read()
-            compression_algorithm = metadata_object[object_name]['compression']
-            decompressor = self._get_compressor(compression_algorithm)
+            data = self._read_object(container, object_name, obj,
+                                     extra_metadata)
             volume_file.seek(obj['offset'])
-            if decompressor is not None:
-                LOG.debug('decompressing data using %s algorithm',
-                          compression_algorithm)
-                decompressed = decompressor.decompress(body)
-                volume_file.write(decompressed)
-            else:
-                volume_file.write(body)
+            volume_file.write(data)
 
             # force flush every write to avoid long blocking write on close
             volume_file.flush()
-
-            # Be tolerant to IO implementations that do not support fileno()
-            try:
-                fileno = volume_file.fileno()
-            except IOError:
-                LOG.info("volume_file does not support fileno() so skipping "
-                         "fsync()")
-            else:
-                os.fsync(fileno)
+            self._fsync(volume_file)
 
             # Restoring a backup to a volume can take some time. Yield so other
             # threads can run, allowing for among other things the service
             # status to be updated
             eventlet.sleep(0)
+
+        for offset, length in metadata.get('holes', []):
+            self._write_zeros(volume_file, offset, length)
+        volume_file.flush()
         LOG.debug('v1 volume backup restore of %s finished.',
                   backup_id)
 
+    def _restore_chain(self, backup_chain, volume_id, volume_file,
+                       requested_backup):
+        """Restore a chain of v1/v2 backups writing each volume range once.
+
+        The objects of the chain, ordered from the full backup to the
+        requested incremental backup, are merged into an extent map where
+        the last backup writing a range wins. Only the objects that still
+        hold current data are downloaded, up to max_concurrent_downloads of
+        them ahead of the one being written to the volume. Deduplicated
+        blocks are downloaded once for all the ranges holding them.
+
+        Raises BackupRestoreCancel on any requested_backup status change.
+        """
+        extent_map = _ExtentMap()
+        for backup, metadata in backup_chain:
+            # Deduplicated blocks are shared with other backups, so only v1
+            # backups have a fixed list of objects.
+            if metadata['version'] != self.DEDUP_DRIVER_VERSION:
+                self._check_object_list(backup, metadata)
+            for metadata_object in metadata['objects']:
+                object_name, obj = list(metadata_object.items())[0]
+                extent_map.add(obj['offset'], obj['offset'] + obj['length'],
+                               (backup, metadata, object_name, obj))
+            for offset, length in metadata.get('holes', []):
+                extent_map.add(offset, offset + length, None)
+
+        # Group the surviving ranges by object, keeping the volume order.
+        object_extents = collections.OrderedDict()
+        zero_extents = []
+        for start, end, source in extent_map:
+            if source is None:
+                zero_extents.append((start, end))
+                continue
+            key = (source[0]['container'], source[2])
+            object_extents.setdefault(key, (source, []))[1].append(
+                (start, end, source[3]['offset']))
+        LOG.debug('Restoring %(count)d objects from a chain of %(length)d '
+                  'backups to volume %(volume_id)s.',
+                  {'count': len(object_extents),
+                   'length': len(backup_chain),
+                   'volume_id': volume_id})
+
+        def _download(backup, metadata, object_name, obj):
+            return self._read_object(backup['container'], object_name, obj,
+                                     metadata.get('extra_metadata'))
+
+        def _write(source, extents, download):
+            backup = source[0]
+            self._check_restore_canceled(backup, volume_id, requested_backup)
+            data = download.wait()
+            for start, end, object_offset in extents:
+                volume_file.seek(start)
+                if start == object_offset and end - start == len(data):
+                    volume_file.write(data)
+                else:
+                    data_start = start - object_offset
+                    volume_file.write(
+                        data[data_start:data_start + end - start])
+            # force flush every write to avoid long blocking write on close
+            volume_file.flush()
+            # Restoring a backup to a volume can take some time. Yield so
+            # other threads can run, allowing for among other things the
+            # service status to be updated
+            eventlet.sleep(0)
+
+        pool = eventlet.GreenPool(self.max_concurrent_downloads)
+        downloads = collections.deque()
+        try:
+            for source, extents in object_extents.values():
+                if len(downloads) >= self.max_concurrent_downloads:
+                    _write(*downloads.popleft())
+                downloads.append((source, extents,
+                                  pool.spawn(_download, *source)))
+            while downloads:
+                _write(*downloads.popleft())
+        finally:
+            for source, extents, download in downloads:
+                download.kill()
+
+        # Holes don't need any download, only zeroing.
+        for start, end in zero_extents:
+            self._write_zeros(volume_file, start, end - start)
+            eventlet.sleep(0)
+        volume_file.flush()
+
+        self._fsync(volume_file)
+
+    def _restore_v2(self, backup, volume_id, metadata, volume_file,
+                    requested_backup):
+        """Restore a v2 volume backup, whose objects are deduplicated."""
+        self._restore_chain([(backup, metadata)], volume_id, volume_file,
+                            requested_backup)
+
     def restore(self, backup, volume_id, volume_file):
         """Restore the given volume backup from backup repository.
 
@@ -779,14 +1402,20 @@ class ChunkedBackupDriver(driver.BackupDriver):
             current_backup = prev_backup
 
         # Do a full restore first, then layer the incremental backups
-        # on top of it in order.
-        index = len(backup_list) - 1
-        while index >= 0:
-            backup1 = backup_list[index]
-            index = index - 1
-            metadata = self._read_metadata(backup1)
-            restore_func(backup1, volume_id, metadata, volume_file, backup)
-
+        # on top of it in order. Chains of v1 and v2 backups are merged so
+        # every volume range is only restored from the last backup having it.
+        backup_chain = [(backup1, self._read_metadata(backup1))
+                        for backup1 in reversed(backup_list)]
+        if all(self.DRIVER_VERSION_MAPPING.get(metadata['version']) in
+               ('_restore_v1', '_restore_v2')
+               for backup1, metadata in backup_chain):
+            self._restore_chain(backup_chain, volume_id, volume_file, backup)
+        else:
+            for backup1, metadata in backup_chain:
+                restore_func(backup1, volume_id, metadata, volume_file,
+                             backup)
+
+        for backup1, metadata in backup_chain:
             volume_meta = metadata.get('volume_meta', None)
             try:
                 if volume_meta:
@@ -819,6 +1448,11 @@ class ChunkedBackupDriver(driver.BackupDriver):
                 LOG.warning('Error while listing objects, continuing'
                             ' with delete.')
 
+            # The metadata is needed to know the deduplicated blocks that
+            # the backup references, so release them before deleting it.
+            if self._metadata_filename(backup) in object_names:
+                self._release_dedup_references(backup)
+
             for object_name in object_names:
                 self.delete_object(container, object_name)
                 LOG.debug('deleted object: %(object_name)s'
@@ -42,10 +42,9 @@ was deemed the safest action to take. It is therefore recommended to always
 restore to a new volume (default).
 """
 
-import fcntl
+import contextlib
 import os
 import re
-import subprocess
 import time
 
 import eventlet
@@ -72,6 +71,11 @@ except ImportError:
 
 LOG = logging.getLogger(__name__)
 
+# Size of the reads and writes of the extents copied between RBD images, the
+# default object size of RBD images. It bounds the memory used by the copies
+# to backup_ceph_max_concurrent_ops times this size.
+RBD_TRANSFER_SIZE = 4 * units.Mi
+
 service_opts = [
     cfg.StrOpt('backup_ceph_conf', default='/etc/ceph/ceph.conf',
                help='Ceph configuration file to use.'),
@@ -91,6 +95,10 @@ service_opts = [
     cfg.BoolOpt('backup_ceph_image_journals', default=False,
                 help='If True, apply JOURNALING and EXCLUSIVE_LOCK feature '
                      'bits to the backup RBD objects to allow mirroring'),
+    cfg.IntOpt('backup_ceph_max_concurrent_ops', default=8, min=1,
+               help='Number of 4 MiB extents that are read and written at '
+                    'the same time when copying the changes between RBD '
+                    'images for incremental backups and restores.'),
     cfg.BoolOpt('restore_discard_excess_bytes', default=True,
                 help='If True, always discard excess bytes when restoring '
                      'volumes i.e. pad with zeroes.')
@@ -198,27 +206,6 @@ class CephBackupDriver(driver.BackupDriver):
         """Ensure all args are non-None and non-empty."""
         return all(args)
 
-    def _ceph_args(self, user, conf=None, pool=None):
-        """Create default ceph args for executing rbd commands.
-
-        If no --conf is provided, rbd will look in the default locations e.g.
-        /etc/ceph/ceph.conf
-        """
-
-        # Make sure user arg is valid since rbd command may not fail if
-        # invalid/no user provided, resulting in unexpected behaviour.
-        if not self._validate_string_args(user):
-            raise exception.BackupInvalidCephArgs(_("invalid user '%s'") %
-                                                  user)
-
-        args = ['--id', user]
-        if conf:
-            args.extend(['--conf', conf])
-        if pool:
-            args.extend(['--pool', pool])
-
-        return args
-
     @property
     def _supports_layering(self):
         """Determine if copy-on-write is supported by our version of librbd."""
@@ -289,11 +276,19 @@ class CephBackupDriver(driver.BackupDriver):
         with rbd_driver.RADOSClient(self, self._ceph_backup_pool):
             pass
 
-    def _connect_to_rados(self, pool=None):
-        """Establish connection to the backup Ceph cluster."""
+    def _connect_to_rados(self, pool=None, user=None, conf=None):
+        """Establish connection to the backup Ceph cluster.
+
+        The user and conf arguments allow connecting to the cluster of a
+        volume instead. An empty conf is passed to librados as is, so it
+        reads its default configuration file.
+        """
+        if user is None and conf is None:
+            user = self._ceph_backup_user
+            conf = self._ceph_backup_conf
         client = eventlet.tpool.Proxy(self.rados.Rados(
-                                      rados_id=self._ceph_backup_user,
-                                      conffile=self._ceph_backup_conf))
+            rados_id=utils.convert_str(user),
+            conffile=conf and utils.convert_str(conf)))
         try:
             client.connect()
             pool_to_open = utils.convert_str(pool or self._ceph_backup_pool)
@@ -304,7 +299,7 @@ class CephBackupDriver(driver.BackupDriver):
             client.shutdown()
             raise
 
-    def _disconnect_from_rados(self, client, ioctx):
+    def _disconnect_from_rados(self, client, ioctx, error=None):
         """Terminate connection with the backup Ceph cluster."""
         # closing an ioctx cannot raise an exception
         ioctx.close()
@@ -546,37 +541,82 @@ class CephBackupDriver(driver.BackupDriver):
                 finally:
                     src_rbd.close()
 
-    def _piped_execute(self, cmd1, cmd2):
-        """Pipe output of cmd1 into cmd2."""
-        LOG.debug("Piping cmd1='%s' into...", ' '.join(cmd1))
-        LOG.debug("cmd2='%s'", ' '.join(cmd2))
+    @contextlib.contextmanager
+    def _open_rbd_image(self, name, pool, user, conf, **kwargs):
+        """Open an RBD image with its own connection to the cluster."""
+        # Make sure user arg is valid since we would otherwise connect with
+        # the user of the backup cluster.
+        if not self._validate_string_args(user):
+            raise exception.BackupInvalidCephArgs(_("invalid user '%s'") %
+                                                  user)
 
+        client, ioctx = self._connect_to_rados(pool, user, conf)
         try:
-            p1 = subprocess.Popen(cmd1, stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE,
-                                  close_fds=True)
-        except OSError as e:
-            LOG.error("Pipe1 failed - %s ", e)
-            raise
+            image = eventlet.tpool.Proxy(self.rbd.Image(
+                ioctx, utils.convert_str(name), **kwargs))
+            try:
+                yield image
+            finally:
+                image.close()
+        finally:
+            self._disconnect_from_rados(client, ioctx)
 
-        # NOTE(dosaboy): ensure that the pipe is blocking. This is to work
-        # around the case where evenlet.green.subprocess is used which seems to
-        # use a non-blocking pipe.
-        flags = fcntl.fcntl(p1.stdout, fcntl.F_GETFL) & (~os.O_NONBLOCK)
-        fcntl.fcntl(p1.stdout, fcntl.F_SETFL, flags)
+    def _copy_rbd_extents(self, src_rbd, dest_rbd, from_snap=None):
+        """Copy the extents of src_rbd changed since from_snap to dest_rbd.
 
-        try:
-            p2 = subprocess.Popen(cmd2, stdin=p1.stdout,
-                                  stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE,
-                                  close_fds=True)
-        except OSError as e:
-            LOG.error("Pipe2 failed - %s ", e)
-            raise
+        Holes are skipped, extents that were discarded since from_snap are
+        discarded from the destination, and up to
+        backup_ceph_max_concurrent_ops chunks of RBD_TRANSFER_SIZE bytes are
+        copied at the same time in the threads of eventlet's thread pool.
+        """
+        size = src_rbd.size()
+        if dest_rbd.size() != size:
+            LOG.debug("Resizing destination image to %s bytes", size)
+            dest_rbd.resize(size)
+
+        chunks = []
+
+        def iter_cb(offset, length, exists):
+            if not exists:
+                # Discards don't transfer any data.
+                chunks.append((offset, length, exists))
+                return
+            for chunk_offset in range(offset, offset + length,
+                                      RBD_TRANSFER_SIZE):
+                chunks.append((chunk_offset,
+                               min(RBD_TRANSFER_SIZE,
+                                   offset + length - chunk_offset),
+                               exists))
+
+        src_rbd.diff_iterate(0, size, from_snap, iter_cb)
+
+        def copy_chunk(chunk):
+            offset, length, exists = chunk
+            if exists:
+                dest_rbd.write(src_rbd.read(offset, length), offset)
+            else:
+                dest_rbd.discard(offset, length)
+            return length
 
-        p1.stdout.close()
-        stdout, stderr = p2.communicate()
-        return p2.returncode, stderr
+        total = sum(chunk[1] for chunk in chunks)
+        LOG.debug("%(chunks)s chunks of up to %(size)s bytes, %(total)s bytes "
+                  "in total, to be transferred",
+                  {'chunks': len(chunks), 'size': RBD_TRANSFER_SIZE,
+                   'total': total})
+
+        before = time.time()
+        transferred = 0
+        next_report = 0.1
+        pool = eventlet.GreenPool(CONF.backup_ceph_max_concurrent_ops)
+        for length in pool.imap(copy_chunk, chunks):
+            transferred += length
+            if transferred >= total * next_report:
+                delta = max(time.time() - before, 0.001)
+                LOG.debug("Transferred %(transferred)s of %(total)s bytes "
+                          "(%(rate)dK/s)",
+                          {'transferred': transferred, 'total': total,
+                           'rate': (transferred / delta) / 1024})
+                next_report = float(transferred) / total + 0.1
 
     def _rbd_diff_transfer(self, src_name, src_pool, dest_name, dest_pool,
                            src_user, src_conf, dest_user, dest_conf,
@@ -586,36 +626,36 @@ class CephBackupDriver(driver.BackupDriver):
         If no snapshot is provided, the diff extents will be all those changed
         since the rbd volume/base was created, otherwise it will be those
         changed since the snapshot was created.
+
+        Like with rbd export-diff and import-diff, the destination is resized
+        to the size of the source and src_snap is created on it once the
+        extents are copied.
         """
         LOG.debug("Performing differential transfer from '%(src)s' to "
                   "'%(dest)s'",
                   {'src': src_name, 'dest': dest_name})
 
-        # NOTE(dosaboy): Need to be tolerant of clusters/clients that do
-        # not support these operations since at the time of writing they
-        # were very new.
-
-        src_ceph_args = self._ceph_args(src_user, src_conf, pool=src_pool)
-        dest_ceph_args = self._ceph_args(dest_user, dest_conf, pool=dest_pool)
-
-        cmd1 = ['rbd', 'export-diff'] + src_ceph_args
-        if from_snap is not None:
-            cmd1.extend(['--from-snap', from_snap])
-        if src_snap:
-            path = utils.convert_str("%s/%s@%s"
-                                     % (src_pool, src_name, src_snap))
-        else:
-            path = utils.convert_str("%s/%s" % (src_pool, src_name))
-        cmd1.extend([path, '-'])
-
-        cmd2 = ['rbd', 'import-diff'] + dest_ceph_args
-        rbd_path = utils.convert_str("%s/%s" % (dest_pool, dest_name))
-        cmd2.extend(['-', rbd_path])
-
-        ret, stderr = self._piped_execute(cmd1, cmd2)
-        if ret:
-            msg = (_("RBD diff op failed - (ret=%(ret)s stderr=%(stderr)s)") %
-                   {'ret': ret, 'stderr': stderr})
+        snapshot = utils.convert_str(src_snap) if src_snap else None
+        try:
+            with self._open_rbd_image(src_name, src_pool, src_user, src_conf,
+                                      snapshot=snapshot,
+                                      read_only=True) as src_rbd, \
+                    self._open_rbd_image(dest_name, dest_pool, dest_user,
+                                         dest_conf) as dest_rbd:
+                if from_snap is not None:
+                    from_snap = utils.convert_str(from_snap)
+                    if from_snap not in [snap['name'] for snap in
+                                         dest_rbd.list_snaps()]:
+                        msg = (_("Snapshot %(snap)s not found in "
+                                 "%(dest)s") % {'snap': from_snap,
+                                                'dest': dest_name})
+                        raise exception.BackupRBDOperationFailed(msg)
+
+                self._copy_rbd_extents(src_rbd, dest_rbd, from_snap)
+                if snapshot:
+                    dest_rbd.create_snap(snapshot)
+        except (self.rados.Error, self.rbd.Error) as e:
+            msg = _("RBD diff op failed - %s") % e
             LOG.info(msg)
             raise exception.BackupRBDOperationFailed(msg)
 
@@ -1061,9 +1101,8 @@ class CephBackupDriver(driver.BackupDriver):
             raise
 
         # If the volume we are restoring to is larger than the backup volume,
-        # we will need to resize it after the diff import since import-diff
-        # appears to shrink the target rbd volume to the size of the original
-        # backup volume.
+        # we will need to resize it after the diff transfer since it shrinks
+        # the target rbd volume to the size of the original backup volume.
         self._check_restore_vol_size(backup, restore_file, restore_length,
                                      rbd_pool)
 
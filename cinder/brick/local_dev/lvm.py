@@ -17,6 +17,7 @@
 LVM class for performing LVM operations.
 """
 
+import functools
 import math
 import os
 import re
@@ -24,7 +25,9 @@ import re
 from os_brick import executor
 from oslo_concurrency import processutils as putils
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 from oslo_utils import excutils
+from oslo_utils import timeutils
 from six import moves
 
 from cinder import exception
@@ -34,16 +37,31 @@ from cinder import utils
 
 LOG = logging.getLogger(__name__)
 
+# Fields of the LV report, by the name of their lvdisplay column
+LV_REPORT_FIELDS = {'Attr': 'lv_attr', 'Origin': 'origin'}
+
+
+def _invalidates_lv_report(f):
+    """Decorator for the methods that change the LVs of the VG."""
+    @functools.wraps(f)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return f(self, *args, **kwargs)
+        finally:
+            self._invalidate_lv_report()
+    return wrapper
+
 
 class LVM(executor.Executor):
     """LVM object to enable various LVM related operations."""
     LVM_CMD_PREFIX = ['env', 'LC_ALL=C']
     _supports_pvs_ignoreskippedcluster = None
+    _supports_lvs_json_report = None
 
     def __init__(self, vg_name, root_helper, create_vg=False,
                  physical_volumes=None, lvm_type='default',
                  executor=putils.execute, lvm_conf=None,
-                 suppress_fd_warn=False):
+                 suppress_fd_warn=False, report_cache_ttl=0):
 
         """Initialize the LVM object.
 
@@ -58,6 +76,9 @@ class LVM(executor.Executor):
         :param lvm_type: VG and Volume type (default, or thin)
         :param executor: Execute method to use, None uses common/processutils
         :param suppress_fd_warn: Add suppress FD Warn to LVM env
+        :param report_cache_ttl: Seconds during which the lookups of LVs are
+                                 answered from a single report of the LVs of
+                                 the VG, 0 to run a command for each lookup
 
         """
         super(LVM, self).__init__(execute=executor, root_helper=root_helper)
@@ -73,6 +94,10 @@ class LVM(executor.Executor):
         self._supports_snapshot_lv_activation = None
         self._supports_lvchange_ignoreskipactivation = None
         self.vg_provisioned_capacity = 0.0
+        self._lv_report_ttl = report_cache_ttl
+        self._lv_report = None
+        self._lv_report_time = None
+        self._lv_report_generation = 0
 
         if lvm_type not in ['default', 'thin']:
             raise exception.Invalid('lvm_type must be "default" or "thin"')
@@ -108,6 +133,12 @@ class LVM(executor.Executor):
             LOG.error('Unable to locate Volume Group %s', vg_name)
             raise exception.VolumeGroupNotFound(vg_name=vg_name)
 
+        if (self._lv_report_ttl and
+                not self.supports_lvs_json_report(root_helper)):
+            LOG.warning('The LVM version does not support JSON reports, '
+                        'LVs are not cached.')
+            self._lv_report_ttl = 0
+
         # NOTE: we assume that the VG has been activated outside of Cinder
 
         if lvm_type == 'thin':
@@ -157,6 +188,12 @@ class LVM(executor.Executor):
         :returns: Free space in GB (float), calculated using data_percent
 
         """
+        lv = self._get_cached_lv(thin_pool_name)
+        if lv is not None and vg_name == self.vg_name:
+            pool_size = float(lv['lv_size'])
+            consumed_space = pool_size / 100 * float(lv['data_percent'])
+            return round(pool_size - consumed_space, 2)
+
         cmd = LVM.LVM_CMD_PREFIX +\
             ['lvs', '--noheadings', '--unit=g',
              '-o', 'size,data_percent', '--separator',
@@ -274,6 +311,78 @@ class LVM(executor.Executor):
 
         return LVM._supports_pvs_ignoreskippedcluster
 
+    @staticmethod
+    def supports_lvs_json_report(root_helper):
+        """Property indicating whether lvs supports --reportformat json
+
+        Check for LVM version >= 2.02.158.
+        """
+
+        if LVM._supports_lvs_json_report is not None:
+            return LVM._supports_lvs_json_report
+
+        LVM._supports_lvs_json_report = (
+            LVM.get_lvm_version(root_helper) >= (2, 2, 158))
+
+        return LVM._supports_lvs_json_report
+
+    def _get_lv_report(self):
+        """Return the report of the LVs of the VG, by name.
+
+        The report is gathered with a single lvs command and reused until it
+        is older than the TTL or an LV is changed through this object.
+
+        :returns: Dictionary of LV fields by LV name, or None if LVs are not
+                  cached
+
+        """
+        if not self._lv_report_ttl:
+            return None
+        if (self._lv_report is not None and
+                timeutils.now() - self._lv_report_time < self._lv_report_ttl):
+            return self._lv_report
+
+        # Don't cache the report if an LV changed while we were gathering it
+        generation = self._lv_report_generation
+        cmd = LVM.LVM_CMD_PREFIX + ['lvs', '--reportformat', 'json',
+                                    '--unit=g', '--nosuffix', '-o',
+                                    'vg_name,lv_name,lv_size,lv_attr,origin,'
+                                    'data_percent', self.vg_name]
+        (out, _err) = self._execute(*cmd,
+                                    root_helper=self._root_helper,
+                                    run_as_root=True)
+        report = {}
+        for entry in jsonutils.loads(out)['report']:
+            for lv in entry['lv']:
+                report[lv['lv_name']] = lv
+
+        if generation == self._lv_report_generation:
+            self._lv_report = report
+            self._lv_report_time = timeutils.now()
+        return report
+
+    def _get_cached_lv(self, name):
+        """Return the report of an LV, or None if it isn't cached."""
+        report = self._get_lv_report()
+        return report.get(name) if report is not None else None
+
+    def _invalidate_lv_report(self):
+        self._lv_report = None
+        self._lv_report_generation += 1
+
+    def _lv_display(self, name, field):
+        """Return the value of an lvdisplay column for an LV."""
+        lv = self._get_cached_lv(name)
+        if lv is not None:
+            return lv[LV_REPORT_FIELDS[field]]
+
+        cmd = LVM.LVM_CMD_PREFIX + ['lvdisplay', '--noheading', '-C', '-o',
+                                    field, '%s/%s' % (self.vg_name, name)]
+        out, _err = self._execute(*cmd,
+                                  root_helper=self._root_helper,
+                                  run_as_root=True)
+        return out
+
     @staticmethod
     def get_lv_info(root_helper, vg_name=None, lv_name=None):
         """Retrieve info about LVs (all, in a VG, or a single LV).
@@ -320,6 +429,13 @@ class LVM(executor.Executor):
         :returns: List of Dictionaries with LV info
 
         """
+        report = self._get_lv_report()
+        if report is not None:
+            return [{'vg': lv['vg_name'], 'name': lv['lv_name'],
+                     'size': lv['lv_size']}
+                    for lv in report.values()
+                    if lv_name is None or lv['lv_name'] == lv_name]
+
         return self.get_lv_info(self._root_helper,
                                 self.vg_name,
                                 lv_name)
@@ -448,8 +564,7 @@ class LVM(executor.Executor):
             # We need info on both the thin pool and the volumes,
             # therefore we should provide only self.vg_name, but not
             # self.vg_thin_pool here.
-            for lv in self.get_lv_info(self._root_helper,
-                                       self.vg_name):
+            for lv in self.get_volumes():
                 lvsize = lv['size']
                 # get_lv_info runs "lvs" command with "--nosuffix".
                 # This removes "g" from "1.00g" and only outputs "1.00".
@@ -489,6 +604,7 @@ class LVM(executor.Executor):
         # leave 5% free for metadata
         return "%sg" % (self.vg_free_space * 0.95)
 
+    @_invalidates_lv_report
     def create_thin_pool(self, name=None, size_str=None):
         """Creates a thin provisioning pool for this VG.
 
@@ -530,6 +646,7 @@ class LVM(executor.Executor):
         self.vg_thin_pool = name
         return size_str
 
+    @_invalidates_lv_report
     def create_volume(self, name, size_str, lv_type='default', mirror_count=0):
         """Creates a logical volume on the object's VG.
 
@@ -571,6 +688,7 @@ class LVM(executor.Executor):
                       self.get_all_volume_groups(self._root_helper))
             raise
 
+    @_invalidates_lv_report
     @utils.retry(putils.ProcessExecutionError)
     def create_lv_snapshot(self, name, source_lv_name, lv_type='default'):
         """Creates a snapshot of a logical volume.
@@ -610,17 +728,14 @@ class LVM(executor.Executor):
         return '_' + name
 
     def _lv_is_active(self, name):
-        cmd = LVM.LVM_CMD_PREFIX + ['lvdisplay', '--noheading', '-C', '-o',
-                                    'Attr', '%s/%s' % (self.vg_name, name)]
-        out, _err = self._execute(*cmd,
-                                  root_helper=self._root_helper,
-                                  run_as_root=True)
+        out = self._lv_display(name, 'Attr')
         if out:
             out = out.strip()
             if (out[4] == 'a'):
                 return True
         return False
 
+    @_invalidates_lv_report
     @utils.retry(exception.VolumeNotDeactivated, retries=1, interval=2)
     def deactivate_lv(self, name):
         lv_path = self.vg_name + '/' + self._mangle_lv_name(name)
@@ -646,12 +761,14 @@ class LVM(executor.Executor):
     def _wait_for_volume_deactivation(self, name):
         LOG.debug("Checking to see if volume %s has been deactivated.",
                   name)
+        self._invalidate_lv_report()
         if self._lv_is_active(name):
             LOG.debug("Volume %s is still active.", name)
             raise exception.VolumeNotDeactivated(name=name)
         else:
             LOG.debug("Volume %s has been deactivated.", name)
 
+    @_invalidates_lv_report
     @utils.retry(putils.ProcessExecutionError, retries=5, backoff_rate=2)
     def activate_lv(self, name, is_snapshot=False, permanent=False):
         """Ensure that logical volume/snapshot logical volume is activated.
@@ -696,6 +813,7 @@ class LVM(executor.Executor):
             LOG.error('StdErr  :%s', err.stderr)
             raise
 
+    @_invalidates_lv_report
     @utils.retry(putils.ProcessExecutionError)
     def delete(self, name):
         """Delete logical volume or snapshot.
@@ -741,6 +859,7 @@ class LVM(executor.Executor):
             LOG.debug('Successfully deleted volume: %s after '
                       'udev settle.', name)
 
+    @_invalidates_lv_report
     def revert(self, snapshot_name):
         """Revert an LV to snapshot.
 
@@ -757,11 +876,7 @@ class LVM(executor.Executor):
             raise
 
     def lv_has_snapshot(self, name):
-        cmd = LVM.LVM_CMD_PREFIX + ['lvdisplay', '--noheading', '-C', '-o',
-                                    'Attr', '%s/%s' % (self.vg_name, name)]
-        out, _err = self._execute(*cmd,
-                                  root_helper=self._root_helper,
-                                  run_as_root=True)
+        out = self._lv_display(name, 'Attr')
         if out:
             out = out.strip()
             if (out[0] == 'o') or (out[0] == 'O'):
@@ -770,11 +885,7 @@ class LVM(executor.Executor):
 
     def lv_is_snapshot(self, name):
         """Return True if LV is a snapshot, False otherwise."""
-        cmd = LVM.LVM_CMD_PREFIX + ['lvdisplay', '--noheading', '-C', '-o',
-                                    'Attr', '%s/%s' % (self.vg_name, name)]
-        out, _err = self._execute(*cmd,
-                                  root_helper=self._root_helper,
-                                  run_as_root=True)
+        out = self._lv_display(name, 'Attr')
         out = out.strip()
         if out:
             if (out[0] == 's'):
@@ -783,11 +894,7 @@ class LVM(executor.Executor):
 
     def lv_is_open(self, name):
         """Return True if LV is currently open, False otherwise."""
-        cmd = LVM.LVM_CMD_PREFIX + ['lvdisplay', '--noheading', '-C', '-o',
-                                    'Attr', '%s/%s' % (self.vg_name, name)]
-        out, _err = self._execute(*cmd,
-                                  root_helper=self._root_helper,
-                                  run_as_root=True)
+        out = self._lv_display(name, 'Attr')
         out = out.strip()
         if out:
             if (out[5] == 'o'):
@@ -796,16 +903,13 @@ class LVM(executor.Executor):
 
     def lv_get_origin(self, name):
         """Return the origin of an LV that is a snapshot, None otherwise."""
-        cmd = LVM.LVM_CMD_PREFIX + ['lvdisplay', '--noheading', '-C', '-o',
-                                    'Origin', '%s/%s' % (self.vg_name, name)]
-        out, _err = self._execute(*cmd,
-                                  root_helper=self._root_helper,
-                                  run_as_root=True)
+        out = self._lv_display(name, 'Origin')
         out = out.strip()
         if out:
             return out
         return None
 
+    @_invalidates_lv_report
     def extend_volume(self, lv_name, new_size):
         """Extend the size of an existing volume."""
         # Volumes with snaps have attributes 'o' or 'O' and will be
@@ -853,6 +957,7 @@ class LVM(executor.Executor):
     def vg_mirror_size(self, mirror_count):
         return (self.vg_free_space / (mirror_count + 1))
 
+    @_invalidates_lv_report
     def rename_volume(self, lv_name, new_name):
         """Change the name of an existing volume."""
 
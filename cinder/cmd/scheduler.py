@@ -40,6 +40,8 @@ from cinder import version
 
 
 CONF = cfg.CONF
+CONF.import_opt('scheduler_shared_allocations',
+                'cinder.scheduler.host_manager')
 
 
 def main():
@@ -51,6 +53,8 @@ def main():
     python_logging.captureWarnings(True)
     utils.monkey_patch()
     gmr.TextGuruMeditation.setup_autorun(version, conf=CONF)
-    server = service.Service.create(binary='cinder-scheduler')
+    server = service.Service.create(
+        binary='cinder-scheduler',
+        coordination=CONF.scheduler_shared_allocations)
     service.serve(server)
     service.wait()
@@ -150,6 +150,14 @@ global_opts = [
                default=60,
                help='Maximum time since last check-in for a service to be '
                     'considered up'),
+    cfg.IntOpt('capabilities_delta_reports',
+               default=0,
+               min=0,
+               help='Number of consecutive capability reports a volume '
+                    'service sends to the schedulers containing only the '
+                    'pools and fields that changed since its previous '
+                    'report, before sending a full report again. Setting '
+                    'it to 0 sends full reports every time.'),
     cfg.StrOpt('volume_api_class',
                default='cinder.volume.api.API',
                help='The full class name of the volume API class to use'),
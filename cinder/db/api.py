@@ -261,6 +261,11 @@ def volume_data_get_for_host(context, host, count_only=False):
                                          count_only)
 
 
+def volume_count_get_all_by_host(context):
+    """Get a dictionary with the number of volumes of each host."""
+    return IMPL.volume_count_get_all_by_host(context)
+
+
 def volume_data_get_for_project(context, project_id, host=None):
     """Get (volume_count, gigabytes) for project."""
     return IMPL.volume_data_get_for_project(context, project_id, host=host)
@@ -281,10 +281,76 @@ def model_query(context, model, *args, **kwargs):
     return query
 
 
+def _volume_data_get_by_type(context, project_id, session):
+    rows = model_query(context,
+                       func.count(models.Volume.id),
+                       func.sum(models.Volume.size),
+                       models.Volume.volume_type_id,
+                       read_deleted="no",
+                       session=session).\
+        filter_by(project_id=project_id).\
+        group_by(models.Volume.volume_type_id).all()
+    return {volume_type_id: (count or 0, gigs or 0)
+            for count, gigs, volume_type_id in rows}
+
+
+def _snapshot_data_get_by_type(context, project_id, session):
+    authorize_project_context(context, project_id)
+    rows = model_query(context,
+                       func.count(models.Snapshot.id),
+                       func.sum(models.Snapshot.volume_size),
+                       models.Volume.volume_type_id,
+                       read_deleted="no",
+                       session=session).\
+        outerjoin(models.Snapshot.volume).\
+        filter(models.Snapshot.project_id == project_id).\
+        group_by(models.Volume.volume_type_id).all()
+    return {volume_type_id: (count or 0, gigs or 0)
+            for count, gigs, volume_type_id in rows}
+
+
+def _project_data_get(context, project_id, session, volume_type_id,
+                      project_usages, name, get_by_type, get_for_project):
+    """Return the (count, gigabytes) of a project's volumes or snapshots.
+
+    When the sync routines share a project_usages dictionary, the data of
+    all the volume types is loaded with a single grouped query the first
+    time it is needed, and the following routines use it.
+    """
+    if project_usages is None:
+        return get_for_project(context, project_id,
+                               volume_type_id=volume_type_id,
+                               session=session)
+
+    if name not in project_usages:
+        project_usages[name] = get_by_type(context, project_id, session)
+    data_by_type = project_usages[name]
+    if volume_type_id:
+        return data_by_type.get(volume_type_id, (0, 0))
+    return (sum(count for count, _gigs in data_by_type.values()),
+            sum(gigs for _count, gigs in data_by_type.values()))
+
+
+def _volume_data_get(context, project_id, session, volume_type_id,
+                     project_usages):
+    return _project_data_get(context, project_id, session, volume_type_id,
+                             project_usages, 'volumes',
+                             _volume_data_get_by_type,
+                             _volume_data_get_for_project)
+
+
+def _snapshot_data_get(context, project_id, session, volume_type_id,
+                       project_usages):
+    return _project_data_get(context, project_id, session, volume_type_id,
+                             project_usages, 'snapshots',
+                             _snapshot_data_get_by_type,
+                             _snapshot_data_get_for_project)
+
+
 def _sync_volumes(context, project_id, session, volume_type_id=None,
-                  volume_type_name=None):
-    (volumes, _gigs) = _volume_data_get_for_project(
-        context, project_id, volume_type_id=volume_type_id, session=session)
+                  volume_type_name=None, project_usages=None):
+    (volumes, _gigs) = _volume_data_get(
+        context, project_id, session, volume_type_id, project_usages)
     key = 'volumes'
     if volume_type_name:
         key += '_' + volume_type_name
@@ -292,9 +358,9 @@ def _sync_volumes(context, project_id, session, volume_type_id=None,
 
 
 def _sync_snapshots(context, project_id, session, volume_type_id=None,
-                    volume_type_name=None):
-    (snapshots, _gigs) = _snapshot_data_get_for_project(
-        context, project_id, volume_type_id=volume_type_id, session=session)
+                    volume_type_name=None, project_usages=None):
+    (snapshots, _gigs) = _snapshot_data_get(
+        context, project_id, session, volume_type_id, project_usages)
     key = 'snapshots'
     if volume_type_name:
         key += '_' + volume_type_name
@@ -302,7 +368,7 @@ def _sync_snapshots(context, project_id, session, volume_type_id=None,
 
 
 def _sync_backups(context, project_id, session, volume_type_id=None,
-                  volume_type_name=None):
+                  volume_type_name=None, project_usages=None):
     (backups, _gigs) = _backup_data_get_for_project(
         context, project_id, volume_type_id=volume_type_id, session=session)
     key = 'backups'
@@ -310,22 +376,22 @@ def _sync_backups(context, project_id, session, volume_type_id=None,
 
 
 def _sync_gigabytes(context, project_id, session, volume_type_id=None,
-                    volume_type_name=None):
-    (_junk, vol_gigs) = _volume_data_get_for_project(
-        context, project_id, volume_type_id=volume_type_id, session=session)
+                    volume_type_name=None, project_usages=None):
+    (_junk, vol_gigs) = _volume_data_get(
+        context, project_id, session, volume_type_id, project_usages)
     key = 'gigabytes'
     if volume_type_name:
         key += '_' + volume_type_name
     if CONF.no_snapshot_gb_quota:
         return {key: vol_gigs}
-    (_junk, snap_gigs) = _snapshot_data_get_for_project(
-        context, project_id, volume_type_id=volume_type_id, session=session)
+    (_junk, snap_gigs) = _snapshot_data_get(
+        context, project_id, session, volume_type_id, project_usages)
     return {key: vol_gigs + snap_gigs}
 
 
 def _sync_consistencygroups(context, project_id, session,
                             volume_type_id=None,
-                            volume_type_name=None):
+                            volume_type_name=None, project_usages=None):
     (_junk, groups) = _consistencygroup_data_get_for_project(
         context, project_id, session=session)
     key = 'consistencygroups'
@@ -334,7 +400,7 @@ def _sync_consistencygroups(context, project_id, session,
 
 def _sync_groups(context, project_id, session,
                  volume_type_id=None,
-                 volume_type_name=None):
+                 volume_type_name=None, project_usages=None):
     (_junk, groups) = _group_data_get_for_project(
         context, project_id, session=session)
     key = 'groups'
@@ -342,7 +408,7 @@ def _sync_groups(context, project_id, session,
 
 
 def _sync_backup_gigabytes(context, project_id, session, volume_type_id=None,
-                           volume_type_name=None):
+                           volume_type_name=None, project_usages=None):
     key = 'backup_gigabytes'
     (_junk, backup_gigs) = _backup_data_get_for_project(
         context, project_id, volume_type_id=volume_type_id, session=session)
@@ -1174,7 +1240,7 @@ def _quota_usage_create(context, project_id, resource, in_use, reserved,
 
 
 def _reservation_create(context, uuid, usage, project_id, resource, delta,
-                        expire, session=None, allocated_id=None):
+                        expire, session=None, allocated_id=None, save=True):
     usage_id = usage['id'] if usage else None
     reservation_ref = models.Reservation()
     reservation_ref.uuid = uuid
@@ -1184,7 +1250,8 @@ def _reservation_create(context, uuid, usage, project_id, resource, delta,
     reservation_ref.delta = delta
     reservation_ref.expire = expire
     reservation_ref.allocated_id = allocated_id
-    reservation_ref.save(session=session)
+    if save:
+        reservation_ref.save(session=session)
     return reservation_ref
 
 
@@ -1251,6 +1318,9 @@ def quota_reserve(context, resources, quotas, deltas, expire,
 
         # Handle usage refresh
         work = set(deltas.keys())
+        # Data of the project shared by the sync routines, so it is only
+        # queried once for all the resources that are refreshed.
+        project_usages = {}
         while work:
             resource = work.pop()
 
@@ -1288,7 +1358,8 @@ def quota_reserve(context, resources, quotas, deltas, expire,
                 updates = sync(elevated, project_id,
                                volume_type_id=volume_type_id,
                                volume_type_name=volume_type_name,
-                               session=session)
+                               session=session,
+                               project_usages=project_usages)
                 for res, in_use in updates.items():
                     # Make sure we have a destination for the usage!
                     if res not in usages:
@@ -1346,6 +1417,7 @@ def quota_reserve(context, resources, quotas, deltas, expire,
         # Create the reservations
         if not overs:
             reservations = []
+            reservation_refs = []
             for resource, delta in deltas.items():
                 usage = usages[resource]
                 allocated_id = None
@@ -1365,8 +1437,10 @@ def quota_reserve(context, resources, quotas, deltas, expire,
                     usage = None
                 reservation = _reservation_create(
                     elevated, str(uuid.uuid4()), usage, project_id, resource,
-                    delta, expire, session=session, allocated_id=allocated_id)
+                    delta, expire, session=session, allocated_id=allocated_id,
+                    save=False)
 
+                reservation_refs.append(reservation)
                 reservations.append(reservation.uuid)
 
                 # Also update the reserved quantity
@@ -1384,6 +1458,9 @@ def quota_reserve(context, resources, quotas, deltas, expire,
                 if delta > 0 and not is_allocated_reserve:
                     usages[resource].reserved += delta
 
+            # Insert all the reservations at once
+            session.bulk_save_objects(reservation_refs)
+
     if unders:
         LOG.warning("Change will make usage less than 0 for the following "
                     "resources: %s", unders)
@@ -1664,6 +1741,16 @@ def volume_data_get_for_host(context, host, count_only=False):
         return (result[0] or 0, result[1] or 0)
 
 
+@require_admin_context
+def volume_count_get_all_by_host(context):
+    result = model_query(context,
+                         models.Volume.host,
+                         func.count(models.Volume.id),
+                         read_deleted="no").\
+        group_by(models.Volume.host).all()
+    return {host: count for host, count in result}
+
+
 @require_admin_context
 def _volume_data_get_for_project(context, project_id, volume_type_id=None,
                                  session=None, host=None):
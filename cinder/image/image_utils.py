@@ -26,6 +26,8 @@ we should look at maybe pushing this up to Oslo
 
 import contextlib
 import errno
+import hashlib
+import itertools
 import math
 import os
 import re
@@ -56,10 +58,21 @@ LOG = logging.getLogger(__name__)
 image_helper_opts = [cfg.StrOpt('image_conversion_dir',
                                 default='$state_path/conversion',
                                 help='Directory used for temporary storage '
-                                'during image conversion'), ]
+                                'during image conversion'),
+                     cfg.BoolOpt('image_stream_to_volume',
+                                 default=False,
+                                 help='Write raw images directly to the '
+                                 'volume while they are downloaded, verifying '
+                                 'their checksum and signature on the fly, '
+                                 'instead of storing them in '
+                                 'image_conversion_dir first. Images whose '
+                                 'content looks like another disk format '
+                                 'are still inspected with qemu-img from a '
+                                 'temporary file.'), ]
 
 CONF = cfg.CONF
 CONF.register_opts(image_helper_opts)
+CONF.import_opt('verify_glance_signatures', 'cinder.image.glance')
 
 QEMU_IMG_LIMITS = processutils.ProcessLimits(
     cpu_time=8,
@@ -78,6 +91,21 @@ QEMU_IMG_VERSION = None
 QEMU_IMG_MIN_FORCE_SHARE_VERSION = [2, 10, 0]
 QEMU_IMG_MIN_CONVERT_LUKS_VERSION = '2.10'
 
+# Magic numbers of the disk formats known to qemu-img, with their offset, used
+# to detect images which are not really raw before streaming them.
+IMAGE_FORMAT_MAGICS = (
+    (0, b'QFI\xfb'),                # qcow, qcow2
+    (0, b'QED\x00'),                # qed
+    (0, b'KDMV'),                   # vmdk
+    (0, b'# Disk DescriptorFile'),  # vmdk descriptor
+    (0, b'conectix'),               # vhd
+    (0, b'vhdxfile'),               # vhdx
+    (0, b'LUKS\xba\xbe'),           # luks
+    (0, b'WithoutFreeSpace'),       # parallels
+    (0x40, b'\x7f\x10\xda\xbe'),    # vdi
+)
+IMAGE_PROBE_SIZE = 512
+
 
 def fixup_disk_format(disk_format):
     """Return the format to be provided to qemu-img convert."""
@@ -318,9 +346,20 @@ def _verify_image(img_file, verifier):
     verifier.verify()
 
 
-def verify_glance_image_signature(context, image_service, image_id, path):
-    verifier = None
-    image_meta = image_service.show(context, image_id)
+IMAGE_SIGNATURE_PROPERTIES = ('img_signature',
+                              'img_signature_hash_method',
+                              'img_signature_certificate_uuid',
+                              'img_signature_key_type')
+
+
+def is_signed_image(image_meta):
+    image_properties = image_meta.get('properties', {})
+    return any(image_properties.get(prop) is not None
+               for prop in IMAGE_SIGNATURE_PROPERTIES)
+
+
+def _get_image_verifier(context, image_id, image_meta):
+    """Return a verifier for the signature of an image, if it is signed."""
     image_properties = image_meta.get('properties', {})
     img_signature = image_properties.get('img_signature')
     img_sig_hash_method = image_properties.get('img_signature_hash_method')
@@ -332,7 +371,7 @@ def verify_glance_image_signature(context, image_service, image_id, path):
                                img_sig_key_type]):
         # NOTE(tommylikehu): We won't verify the image signature
         # if none of the signature metadata presents.
-        return False
+        return None
     if any(m is None for m in [img_signature,
                                img_sig_cert_uuid,
                                img_sig_hash_method,
@@ -342,7 +381,7 @@ def verify_glance_image_signature(context, image_service, image_id, path):
             raise exception.InvalidSignatureImage(image_id=image_id)
 
     try:
-        verifier = signature_utils.get_verifier(
+        return signature_utils.get_verifier(
             context=context,
             img_signature_certificate_uuid=img_sig_cert_uuid,
             img_signature_hash_method=img_sig_hash_method,
@@ -354,6 +393,11 @@ def verify_glance_image_signature(context, image_service, image_id, path):
         LOG.error(message)
         raise exception.ImageSignatureVerificationException(
             reason=message)
+
+
+def verify_glance_image_signature(context, image_service, image_id, path):
+    image_meta = image_service.show(context, image_id)
+    verifier = _get_image_verifier(context, image_id, image_meta)
     if verifier:
         with fileutils.remove_path_on_error(path):
             with open(path, "rb") as tem_file:
@@ -425,6 +469,120 @@ def fetch(context, image_service, image_id, path, _user_id, _project_id):
     LOG.info(msg, {"sz": fsz_mb, "mbps": mbps})
 
 
+def is_streamable_image(image_meta):
+    """Check if an image can be written to a volume while it is downloaded.
+
+    Only raw images stored without a container can be streamed, as any other
+    format needs qemu-img, which can't read from a pipe.
+    """
+    return bool(CONF.image_stream_to_volume and image_meta and
+                image_meta.get('disk_format') == 'raw' and
+                image_meta.get('container_format') == 'bare')
+
+
+def probe_image_format(header):
+    """Check if the first bytes of an image belong to a known disk format."""
+    return any(header[offset:offset + len(magic)] == magic
+               for offset, magic in IMAGE_FORMAT_MAGICS)
+
+
+def _update_image_digests(chunk, checksum, verifier):
+    # Hashing is CPU bound, so this is run in a native thread.
+    if checksum:
+        checksum.update(chunk)
+    if verifier:
+        verifier.update(chunk)
+
+
+def _close_image_chunks(image_chunks):
+    close = getattr(image_chunks, 'close', None)
+    if close:
+        close()
+
+
+def stream_to_volume(context, image_service, image_id, image_meta, dest):
+    """Write a raw image to a volume while it is downloaded from Glance.
+
+    The checksum and the signature of the image are verified on the fly, so
+    that no temporary file is needed, and whether the signature was verified
+    is recorded in the TemporaryImages of the image service. Returns False,
+    without writing anything, if the image looks like another disk format,
+    in which case it has to be inspected with qemu-img before being written.
+    """
+    verifier = None
+    if CONF.verify_glance_signatures != 'disabled':
+        verifier = _get_image_verifier(context, image_id, image_meta)
+    checksum = hashlib.md5() if image_meta.get('checksum') else None
+
+    start_time = timeutils.utcnow()
+    image_chunks = iter(image_service.download(context, image_id))
+    header = b''
+    for chunk in image_chunks:
+        header += chunk
+        if len(header) >= IMAGE_PROBE_SIZE:
+            break
+    if probe_image_format(header):
+        LOG.warning('Image %s is not a raw image, it will be inspected '
+                    'before being copied.', image_id)
+        _close_image_chunks(image_chunks)
+        return False
+
+    throttle = throttling.Throttle.get_default()
+    size = 0
+    try:
+        with utils.temporary_chown(dest), open(dest, 'r+b') as volume_file:
+            volume_file = tpool.Proxy(volume_file)
+            for chunk in itertools.chain([header], image_chunks):
+                if not chunk:
+                    continue
+                tpool.execute(_update_image_digests, chunk, checksum,
+                              verifier)
+                throttle.consume(len(chunk))
+                volume_file.write(chunk)
+                size += len(chunk)
+            volume_file.flush()
+            tpool.execute(os.fsync, volume_file.fileno())
+    except IOError as e:
+        reason = ("IOError: %(errno)s %(strerror)s" %
+                  {'errno': e.errno, 'strerror': e.strerror})
+        LOG.error(reason)
+        raise exception.ImageDownloadFailed(image_href=image_id,
+                                            reason=reason)
+    finally:
+        _close_image_chunks(image_chunks)
+
+    if checksum and checksum.hexdigest() != image_meta['checksum']:
+        reason = _('checksum %(checksum)s does not match the expected '
+                   'checksum %(expected)s.') % {
+            'checksum': checksum.hexdigest(),
+            'expected': image_meta['checksum']}
+        LOG.error('Failed to copy image %(image)s to %(dest)s: %(reason)s',
+                  {'image': image_id, 'dest': dest, 'reason': reason})
+        raise exception.ImageDownloadFailed(image_href=image_id,
+                                            reason=reason)
+    if verifier:
+        try:
+            verifier.verify()
+        except cryptography.exceptions.InvalidSignature:
+            message = _('Image signature verification '
+                        'failed for image: %s') % image_id
+            LOG.error(message)
+            raise exception.ImageSignatureVerificationException(
+                reason=message)
+        LOG.info('Image signature verification succeeded for image: %s',
+                 image_id)
+    if CONF.verify_glance_signatures != 'disabled':
+        TemporaryImages.for_image_service(image_service).set_verified(
+            context, image_id, verifier is not None)
+
+    duration = max(timeutils.delta_seconds(start_time, timeutils.utcnow()),
+                   1)
+    size_mb = size / units.Mi
+    LOG.info("Image streamed to %(dest)s, %(sz).2f MB at %(mbps).2f MB/s",
+             {'dest': dest, 'sz': size_mb, 'mbps': size_mb / duration})
+    return True
+
+
 def get_qemu_data(image_id, has_meta, disk_format_raw, dest, run_as_root,
                   force_share=False):
     # We may be on a system that doesn't have qemu-img installed.  That
@@ -521,6 +679,24 @@ def fetch_to_volume_format(context, image_service,
                            project_id=None, size=None, run_as_root=True):
     qemu_img = True
     image_meta = image_service.show(context, image_id)
+    tmp_images = TemporaryImages.for_image_service(image_service)
+    tmp_image = tmp_images.get(context, image_id)
+
+    # NOTE: Images which can be streamed are not pre-fetched by the volume
+    # manager, so their signature has to be verified here.
+    verify_signature = (not tmp_image and is_streamable_image(image_meta) and
+                        CONF.verify_glance_signatures != 'disabled')
+    if (not tmp_image and volume_format == 'raw' and
+            is_streamable_image(image_meta)):
+        if size is not None:
+            check_virtual_size(image_meta['size'], size, image_id)
+        if stream_to_volume(context, image_service, image_id, image_meta,
+                            dest):
+            return
+        # The volume manager only checks the space of the temporary file of
+        # images that aren't streamed.
+        check_available_space(CONF.image_conversion_dir, image_meta['size'],
+                              image_id)
 
     # NOTE(avishay): I'm not crazy about creating temp files which may be
     # large and cause disk full errors which would confuse users.
@@ -537,12 +713,14 @@ def fetch_to_volume_format(context, image_service,
         if data is None:
             qemu_img = False
 
-        tmp_images = TemporaryImages.for_image_service(image_service)
-        tmp_image = tmp_images.get(context, image_id)
         if tmp_image:
             tmp = tmp_image
         else:
             fetch(context, image_service, image_id, tmp, user_id, project_id)
+            if verify_signature:
+                verified = verify_glance_image_signature(
+                    context, image_service, image_id, tmp)
+                tmp_images.set_verified(context, image_id, verified)
 
         if is_xenserver_format(image_meta):
             replace_xenserver_image_with_coalesced_vhd(tmp)
@@ -830,6 +1008,9 @@ class TemporaryImages(object):
 
     def __init__(self, image_service):
         self.temporary_images = {}
+        # Whether the signature of the images written to volumes without
+        # being pre-fetched was verified.
+        self.verified_images = {}
         self.image_service = image_service
         image_service.temp_images = self
 
@@ -862,3 +1043,17 @@ class TemporaryImages(object):
         if not self.temporary_images.get(user):
             return None
         return self.temporary_images[user].get(image_id)
+
+    def set_verified(self, context, image_id, verified):
+        """Record whether the signature of an image was verified."""
+        self.verified_images.setdefault(context.user_id, {})[image_id] = (
+            verified)
+
+    def pop_verified(self, context, image_id):
+        """Return whether the signature of an image was verified.
+
+        Returns None when nothing was recorded, which means the image was
+        not written to the volume by the image_utils helpers.
+        """
+        verified_images = self.verified_images.get(context.user_id, {})
+        return verified_images.pop(image_id, None)
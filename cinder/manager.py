@@ -52,6 +52,8 @@ This module provides Manager, a base class for managers.
 """
 
 
+import copy
+
 from oslo_config import cfg
 from oslo_log import log as logging
 import oslo_messaging as messaging
@@ -179,6 +181,12 @@ class SchedulerDependentManager(ThreadPoolManager):
     def __init__(self, host=None, db_driver=None, service_name='undefined',
                  cluster=None):
         self.last_capabilities = None
+        # Capabilities in the last report sent to the schedulers, its sequence
+        # number and how many reports with changes only have followed the
+        # last full report.
+        self._reported_capabilities = None
+        self._capabilities_sequence = 0
+        self._delta_reports = 0
         self.service_name = service_name
         self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
         super(SchedulerDependentManager, self).__init__(host, db_driver,
@@ -188,16 +196,11 @@ class SchedulerDependentManager(ThreadPoolManager):
         """Remember these capabilities to send on next periodic update."""
         self.last_capabilities = capabilities
 
-    def _publish_service_capabilities(self, context):
+    def _publish_service_capabilities(self, context, full_report=False):
         """Pass data back to the scheduler at a periodic interval."""
         if self.last_capabilities:
             LOG.debug('Notifying Schedulers of capabilities ...')
-            self.scheduler_rpcapi.update_service_capabilities(
-                context,
-                self.service_name,
-                self.host,
-                self.last_capabilities,
-                self.cluster)
+            self._send_service_capabilities(context, full_report)
             try:
                 self.scheduler_rpcapi.notify_service_capabilities(
                     context,
@@ -213,6 +216,43 @@ class SchedulerDependentManager(ThreadPoolManager):
                        "during a live upgrade. Error: %(e)s")
                 LOG.warning(msg, {'host': self.host, 'e': e})
 
+    def _send_service_capabilities(self, context, full_report):
+        """Send the capabilities, or only their changes, to the schedulers.
+
+        Up to capabilities_delta_reports consecutive reports only include
+        what changed since the previous one, and each report carries a
+        sequence number so schedulers can detect a missed report and request
+        a full one.
+        """
+        if not CONF.capabilities_delta_reports:
+            self._reported_capabilities = None
+            self.scheduler_rpcapi.update_service_capabilities(
+                context,
+                self.service_name,
+                self.host,
+                self.last_capabilities,
+                self.cluster)
+            return
+
+        delta = None
+        if (not full_report and self._reported_capabilities is not None and
+                self._delta_reports < CONF.capabilities_delta_reports):
+            delta = utils.diff_capabilities(self._reported_capabilities,
+                                            self.last_capabilities)
+
+        self._capabilities_sequence += 1
+        self._delta_reports = 0 if delta is None else self._delta_reports + 1
+        self.scheduler_rpcapi.update_service_capabilities(
+            context,
+            self.service_name,
+            self.host,
+            self.last_capabilities,
+            self.cluster,
+            sequence=self._capabilities_sequence,
+            delta=delta)
+        # Drivers may update their stats in place, so keep our own copy
+        self._reported_capabilities = copy.deepcopy(self.last_capabilities)
+
     def reset(self):
         super(SchedulerDependentManager, self).reset()
         self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
@@ -61,6 +61,7 @@ from cinder.scheduler import host_manager as cinder_scheduler_hostmanager
 from cinder.scheduler import manager as cinder_scheduler_manager
 from cinder.scheduler import scheduler_options as \
     cinder_scheduler_scheduleroptions
+from cinder.scheduler import tracing as cinder_scheduler_tracing
 from cinder.scheduler.weights import capacity as \
     cinder_scheduler_weights_capacity
 from cinder.scheduler.weights import volume_number as \
@@ -237,6 +238,7 @@ def list_opts():
                 [cinder_scheduler_manager.scheduler_driver_opt],
                 [cinder_scheduler_scheduleroptions.
                     scheduler_json_config_location_opt],
+                cinder_scheduler_tracing.scheduler_tracing_opts,
                 cinder_scheduler_weights_capacity.capacity_weight_opts,
                 cinder_scheduler_weights_volumenumber.
                 volume_number_weight_opts,
@@ -0,0 +1,135 @@
+# Copyright (c) 2026 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Capacity allocations shared between schedulers."""
+
+import datetime
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+import tooz
+from tooz import coordination as tooz_coordination
+
+from cinder import coordination
+from cinder import exception
+from cinder.i18n import _
+
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+
+class AllocationLedger(object):
+    """Allocations made by the schedulers that volume services didn't report.
+
+    Each scheduler publishes the allocations it made in the last
+    scheduler_shared_allocations_ttl seconds as the capabilities of its member
+    in a coordination group, and reads the ones of the other schedulers, so
+    they can all consume them from their view of the pools before the volume
+    services report the new capacity.
+    """
+
+    GROUP = b'cinder-scheduler-allocations'
+
+    def __init__(self, coordinator=coordination.COORDINATOR):
+        self.coordinator = coordinator
+        self._allocations = []
+        self._sequence = 0
+        self._joined = False
+
+    @property
+    def _member_id(self):
+        return (self.coordinator.prefix +
+                self.coordinator.agent_id).encode('ascii')
+
+    def _get_group_coordinator(self):
+        group_coordinator = self.coordinator.coordinator
+        if group_coordinator is None:
+            raise exception.CinderException(_('Coordinator uninitialized.'))
+
+        if not self._joined:
+            try:
+                group_coordinator.create_group(self.GROUP).get()
+            except tooz_coordination.GroupAlreadyExist:
+                pass
+            try:
+                group_coordinator.join_group(self.GROUP, b'[]').get()
+            except tooz_coordination.MemberAlreadyExist:
+                pass
+            self._joined = True
+        return group_coordinator
+
+    @staticmethod
+    def _is_expired(timestamp):
+        return timeutils.is_older_than(
+            timestamp, CONF.scheduler_shared_allocations_ttl)
+
+    def add(self, backend_id, size):
+        """Publish an allocation of size GB on a pool."""
+        self._sequence += 1
+        self._allocations = [allocation for allocation in self._allocations
+                             if not self._is_expired(allocation[3])]
+        self._allocations.append((self._sequence, backend_id, size,
+                                  timeutils.utcnow()))
+        allocations = [
+            allocation[:3] +
+            (allocation[3].strftime(timeutils.PERFECT_TIME_FORMAT),)
+            for allocation in self._allocations]
+        capabilities = jsonutils.dump_as_bytes(allocations)
+        try:
+            group_coordinator = self._get_group_coordinator()
+            try:
+                group_coordinator.update_capabilities(self.GROUP,
+                                                      capabilities).get()
+            except tooz.NotImplemented:
+                # Some backends, like the file one, can only set the
+                # capabilities when joining the group.
+                group_coordinator.leave_group(self.GROUP).get()
+                group_coordinator.join_group(self.GROUP, capabilities).get()
+        except Exception as e:
+            LOG.warning('Failed to share the allocation of %(size)s GB on '
+                        '%(backend)s with other schedulers: %(error)s',
+                        {'size': size, 'backend': backend_id, 'error': e})
+
+    def get_allocations(self):
+        """Return the allocations made by the other schedulers.
+
+        :returns: list of (id, backend_id, size, timestamp) tuples, where id
+                  is unique across all the schedulers.
+        """
+        try:
+            group_coordinator = self._get_group_coordinator()
+            members = group_coordinator.get_members(self.GROUP).get()
+            requests = [
+                (member, group_coordinator.get_member_capabilities(self.GROUP,
+                                                                   member))
+                for member in members if member != self._member_id]
+
+            result = []
+            for member, request in requests:
+                for sequence, backend_id, size, timestamp in jsonutils.loads(
+                        request.get() or b'[]'):
+                    timestamp = datetime.datetime.strptime(
+                        timestamp, timeutils.PERFECT_TIME_FORMAT)
+                    if not self._is_expired(timestamp):
+                        result.append(((member, sequence), backend_id, size,
+                                       timestamp))
+            return result
+        except Exception as e:
+            LOG.warning('Failed to get the allocations of other schedulers: '
+                        '%s', e)
+            return []
@@ -17,6 +17,7 @@
 Filter support
 """
 from oslo_log import log as logging
+from oslo_utils import timeutils
 
 from cinder.scheduler import base_handler
 
@@ -80,7 +81,7 @@ class BaseFilterHandler(base_handler.BaseHandler):
                  msg_dict)
 
     def get_filtered_objects(self, filter_classes, objs,
-                             filter_properties, index=0):
+                             filter_properties, index=0, trace=None):
         """Get objects after filter
 
         :param filter_classes: filters that will be used to filter the
@@ -90,6 +91,8 @@ class BaseFilterHandler(base_handler.BaseHandler):
         :param index: This value needs to be increased in the caller
                       function of get_filtered_objects when handling
                       each resource.
+        :param trace: SchedulingTrace where the time and the number of
+                      objects of each filter are recorded
         """
         list_objs = list(objs)
         LOG.debug("Starting with %d host(s)", len(list_objs))
@@ -106,15 +109,24 @@ class BaseFilterHandler(base_handler.BaseHandler):
             filter_class = filter_cls()
 
             if filter_class.run_filter_for_index(index):
+                start_time = timeutils.now()
                 objs = filter_class.filter_all(list_objs, filter_properties)
                 if objs is None:
                     LOG.info("Filter %s returned 0 hosts", cls_name)
+                    if trace:
+                        trace.record('filter', cls_name,
+                                     timeutils.now() - start_time,
+                                     start_count, 0)
                     full_filter_results.append((cls_name, None))
                     list_objs = None
                     break
 
                 list_objs = list(objs)
                 end_count = len(list_objs)
+                if trace:
+                    trace.record('filter', cls_name,
+                                 timeutils.now() - start_time,
+                                 start_count, end_count)
                 part_filter_results.append((cls_name, start_count, end_count))
                 remaining = [getattr(obj, "host", obj)
                              for obj in list_objs]
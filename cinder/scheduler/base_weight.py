@@ -18,8 +18,10 @@ Pluggable Weighing support
 """
 
 import abc
+import heapq
 
 from oslo_log import log as logging
+from oslo_utils import timeutils
 import six
 
 from cinder.scheduler import base_handler
@@ -101,39 +103,46 @@ class BaseWeigher(object):
         just return a list of weights.
         """
         # Calculate the weights
-        weights = []
-        for obj in weighed_obj_list:
-            weight = self._weigh_object(obj.obj, weight_properties)
-
-            # Record the min and max values if they are None. If they anything
-            # but none we assume that the weigher has set them
-            if self.minval is None:
-                self.minval = weight
-            if self.maxval is None:
-                self.maxval = weight
-
-            if weight < self.minval:
-                self.minval = weight
-            elif weight > self.maxval:
-                self.maxval = weight
+        weights = [self._weigh_object(obj.obj, weight_properties)
+                   for obj in weighed_obj_list]
+        self._update_limits(weights)
+        return weights
 
-            weights.append(weight)
+    def _update_limits(self, weights):
+        """Extend the min and max values to include all the weights.
 
-        return weights
+        If the weigher has set them they are only extended when some weights
+        are out of range.
+        """
+        if not weights:
+            return
+        minval = min(weights)
+        maxval = max(weights)
+        if self.minval is None or minval < self.minval:
+            self.minval = minval
+        if self.maxval is None or maxval > self.maxval:
+            self.maxval = maxval
 
 
 class BaseWeightHandler(base_handler.BaseHandler):
     object_class = WeighedObject
 
     def get_weighed_objects(self, weigher_classes, obj_list,
-                            weighing_properties):
-        """Return a sorted (descending), normalized list of WeighedObjects."""
+                            weighing_properties, trace=None, limit=None):
+        """Return a sorted (descending), normalized list of WeighedObjects.
+
+        :param limit: only return the limit objects with the highest weights
+        """
 
         if not obj_list:
             return []
 
         weighed_objs = [self.object_class(obj, 0.0) for obj in obj_list]
+        # The weights are added up in a list, and only set on the objects
+        # that are returned.
+        totals = [0.0] * len(weighed_objs)
         for weigher_cls in weigher_classes:
+            start_time = timeutils.now()
             weigher = weigher_cls()
             weights = weigher.weigh_objects(weighed_objs, weighing_properties)
 
@@ -142,14 +151,29 @@ class BaseWeightHandler(base_handler.BaseHandler):
                                 minval=weigher.minval,
                                 maxval=weigher.maxval)
 
-            for i, weight in enumerate(weights):
-                obj = weighed_objs[i]
-                obj.weight += weigher.weight_multiplier() * weight
+            multiplier = weigher.weight_multiplier()
+            totals = [total + multiplier * weight
+                      for total, weight in zip(totals, weights)]
 
             LOG.debug("Weigher %(cls_name)s returned, "
                       "weigher value is {max: %(maxval)s, min: %(minval)s}",
                       {'cls_name': weigher_cls.__name__,
                        'maxval': weigher.maxval,
                        'minval': weigher.minval})
-
-        return sorted(weighed_objs, key=lambda x: x.weight, reverse=True)
+            if trace:
+                trace.record('weigher', weigher_cls.__name__,
+                             timeutils.now() - start_time,
+                             len(weighed_objs), len(weighed_objs))
+
+        if limit is None:
+            indexes = sorted(range(len(totals)), key=totals.__getitem__,
+                             reverse=True)
+        else:
+            indexes = heapq.nlargest(limit, range(len(totals)),
+                                     key=totals.__getitem__)
+        result = []
+        for i in indexes:
+            weighed_obj = weighed_objs[i]
+            weighed_obj.weight = totals[i]
+            result.append(weighed_obj)
+        return result
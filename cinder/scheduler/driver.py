@@ -35,6 +35,17 @@ scheduler_driver_opts = [
     cfg.IntOpt('scheduler_max_attempts',
                default=3,
                help='Maximum number of attempts to schedule a volume'),
+    cfg.IntOpt('scheduler_batch_window',
+               default=0,
+               min=0,
+               help='Number of seconds during which the backends found for '
+                    'a volume creation are reused for the following '
+                    'creations of volumes of the same type, size and '
+                    'availability zone. Only those backends are filtered and '
+                    'weighed again, instead of every backend, which speeds '
+                    'up the scheduling of many identical volumes at once. '
+                    'Capabilities reported meanwhile are taken into account '
+                    'once the window expires. 0 disables it.'),
 ]
 
 CONF = cfg.CONF
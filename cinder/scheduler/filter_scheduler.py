@@ -20,14 +20,18 @@ You can customize this scheduler by specifying your own volume Filters and
 Weighing Functions.
 """
 
+import datetime
+
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
+from oslo_utils import timeutils
 
 from cinder import exception
 from cinder.i18n import _
 from cinder.scheduler import driver
 from cinder.scheduler import scheduler_options
+from cinder.scheduler import tracing
 from cinder.volume import utils
 
 CONF = cfg.CONF
@@ -41,6 +45,10 @@ class FilterScheduler(driver.Scheduler):
         self.cost_function_cache = None
         self.options = scheduler_options.SchedulerOptions()
         self.max_attempts = self._max_attempts()
+        # Filtered backends of recent volume creations, by request, with the
+        # time until which they can be reused.
+        self._batches = {}
+        self.tracer = tracing.Tracer()
 
     def schedule(self, context, topic, method, *args, **kwargs):
         """Schedule contract that returns best-suited host for this request."""
@@ -274,11 +282,83 @@ class FilterScheduler(driver.Scheduler):
                 {'max_attempts': max_attempts,
                  'resource_id': resource_id})
 
+    def _get_batch_key(self, request_spec, filter_properties):
+        """Return the key identifying similar volume creation requests.
+
+        Returns None for the requests whose backends can't be reused, because
+        they depend on a source resource, a group, scheduler hints or
+        previous attempts.
+        """
+        retry = filter_properties.get('retry') or {}
+        if (retry.get('num_attempts', 1) > 1 or
+                filter_properties.get('scheduler_hints') or
+                request_spec.get('resource_backend') or
+                request_spec.get('group_id')):
+            return None
+
+        volume_type = request_spec.get('volume_type') or {}
+        volume_properties = request_spec['volume_properties']
+        availability_zones = request_spec.get('availability_zones') or [
+            volume_properties.get('availability_zone')]
+        # The filter function of the DriverFilter can read any property of
+        # the volume, other filters only the ones passed in the filter
+        # properties.
+        filter_names = {cls.__name__
+                        for cls in self.host_manager.enabled_filters}
+        if 'DriverFilter' in filter_names:
+            inputs = filter_properties['request_spec']['volume_properties']
+        else:
+            inputs = {name: filter_properties.get(name)
+                      for name in ('user_id', 'metadata', 'qos_specs')}
+            inputs['project_id'] = volume_properties.get('project_id')
+        return (volume_type.get('id'),
+                tuple(sorted(availability_zones, key=str)),
+                volume_properties.get('size'),
+                bool(volume_properties.get('multiattach')),
+                jsonutils.dumps(inputs, sort_keys=True))
+
+    def _get_filtered_backends(self, context, request_spec, filter_properties,
+                               batch=False, trace=None):
+        """Return the backends that pass the filters.
+
+        With batching, the backends filtered for a request are only filtered
+        again, taking into account the capacity consumed in between, for the
+        similar requests received during the batch window.
+        """
+        key = None
+        if batch and CONF.scheduler_batch_window:
+            key = self._get_batch_key(request_spec, filter_properties)
+
+        now = timeutils.utcnow()
+        batch_backends = self._batches.get(key) if key else None
+        if batch_backends and batch_backends[0] > now:
+            backends = self.host_manager.get_up_backends(context,
+                                                         batch_backends[1])
+        else:
+            # Note: remember, we are using an iterator here. So only
+            # traverse this list once.
+            backends = self.host_manager.get_all_backend_states(context)
+            batch_backends = None
+
+        # Filter local hosts based on requirements ...
+        backends = self.host_manager.get_filtered_backends(backends,
+                                                           filter_properties,
+                                                           trace=trace)
+        if key and not batch_backends:
+            self._batches = {k: v for k, v in self._batches.items()
+                             if v[0] > now}
+            expires = now + datetime.timedelta(
+                seconds=CONF.scheduler_batch_window)
+            self._batches[key] = (expires, list(backends))
+        return backends
+
     def _get_weighted_candidates(self, context, request_spec,
-                                 filter_properties=None):
+                                 filter_properties=None, batch=False,
+                                 trace=None, limit=None):
         """Return a list of backends that meet required specs.
 
-        Returned list is ordered by their fitness.
+        Returned list is ordered by their fitness, and only includes the
+        limit best backends if limit is set.
         """
         elevated = context.elevated()
 
@@ -329,13 +409,9 @@ class FilterScheduler(driver.Scheduler):
         # weighing our options. we virtually consume resources on
         # it so subsequent selections can adjust accordingly.
 
-        # Note: remember, we are using an iterator here. So only
-        # traverse this list once.
-        backends = self.host_manager.get_all_backend_states(elevated)
-
-        # Filter local hosts based on requirements ...
-        backends = self.host_manager.get_filtered_backends(backends,
-                                                           filter_properties)
+        backends = self._get_filtered_backends(elevated, request_spec,
+                                               filter_properties, batch=batch,
+                                               trace=trace)
         if not backends:
             return []
 
@@ -343,7 +419,7 @@ class FilterScheduler(driver.Scheduler):
         # weighted_backends = WeightedHost() ... the best
         # backend for the job.
         weighed_backends = self.host_manager.get_weighed_backends(
-            backends, filter_properties)
+            backends, filter_properties, trace=trace, limit=limit)
         return weighed_backends
 
     def _get_weighted_candidates_generic_group(
@@ -519,12 +595,22 @@ class FilterScheduler(driver.Scheduler):
         return weighed_backends
 
     def _schedule(self, context, request_spec, filter_properties=None):
+        trace = self.tracer.start(request_spec)
+        resource_backend = request_spec.get('resource_backend')
+        # Only the best backend is needed unless the backends have to be
+        # matched with the resource's backend or the weights of all of them
+        # are logged.
+        limit = 1
+        if resource_backend or (trace and trace.log_decision):
+            limit = None
         weighed_backends = self._get_weighted_candidates(context, request_spec,
-                                                         filter_properties)
+                                                         filter_properties,
+                                                         batch=True,
+                                                         trace=trace,
+                                                         limit=limit)
         # When we get the weighed_backends, we clear those backends that don't
         # match the resource's backend (it could be assigend from group,
         # snapshot or volume).
-        resource_backend = request_spec.get('resource_backend')
         if weighed_backends and resource_backend:
             resource_backend_has_pool = bool(utils.extract_host(
                 resource_backend, 'pool'))
@@ -541,8 +627,15 @@ class FilterScheduler(driver.Scheduler):
             LOG.warning('No weighed backend found for volume '
                         'with properties: %s',
                         filter_properties['request_spec'].get('volume_type'))
+            if trace:
+                trace.finish(None)
             return None
-        return self._choose_top_backend(weighed_backends, request_spec)
+        top_backend = self._choose_top_backend(weighed_backends, request_spec)
+        if trace:
+            trace.weights = [(backend.obj.backend_id, backend.weight)
+                             for backend in weighed_backends]
+            trace.finish(top_backend.obj.backend_id)
+        return top_backend
 
     def _schedule_generic_group(self, context, group_spec, request_spec_list,
                                 group_filter_properties=None,
@@ -563,6 +656,8 @@ class FilterScheduler(driver.Scheduler):
         LOG.debug("Choosing %s", backend_state.backend_id)
         volume_properties = request_spec['volume_properties']
         backend_state.consume_from_volume(volume_properties)
+        self.host_manager.share_allocation(backend_state,
+                                           volume_properties['size'])
         return top_backend
 
     def _choose_top_backend_generic_group(self, weighed_backends):
@@ -75,3 +75,25 @@ def match(value, req):
         pass
 
     return False
+
+
+def get_match_values(req):
+    """Return the values matching a requirement by equality.
+
+    Returns None when the requirement uses an operator that isn't a plain
+    equality, in which case any value could match it.
+    """
+    if req is None:
+        return None
+    words = req.split()
+    if not words:
+        return [req]
+
+    op = words[0]
+    if op == '<or>':
+        return words[1::2]
+    if op == 's==':
+        return words[1:2] or None
+    if op in _op_methods:
+        return None
+    return [req]
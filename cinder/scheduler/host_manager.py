@@ -29,7 +29,9 @@ from cinder.common import constants
 from cinder import context as cinder_context
 from cinder import exception
 from cinder import objects
+from cinder.scheduler import allocations
 from cinder.scheduler import filters
+from cinder.scheduler.filters import extra_specs_ops
 from cinder import utils
 from cinder.volume import utils as vol_utils
 from cinder.volume import volume_types
@@ -58,12 +60,35 @@ host_manager_opts = [
                default='cinder.scheduler.weights.OrderedHostWeightHandler',
                help='Which handler to use for selecting the host/pool '
                     'after weighing'),
+    cfg.BoolOpt('scheduler_capabilities_index',
+                default=False,
+                help='Keep an index of the pools by availability zone and '
+                     'reported capabilities, updated when the capabilities '
+                     'are received, and use it to discard the pools that '
+                     'can not match the availability zone and the extra '
+                     'specs of a request before running the filters.'),
+    cfg.BoolOpt('scheduler_shared_allocations',
+                default=False,
+                help='Share the capacity allocated to the volumes each '
+                     'scheduler places with the other schedulers through '
+                     'the coordination backend, so they take it into '
+                     'account until the volume services report it. The '
+                     'coordination backend must be shared by all the '
+                     'schedulers.'),
+    cfg.IntOpt('scheduler_shared_allocations_ttl',
+               default=120,
+               min=1,
+               help='Time, in seconds, the allocations shared between '
+                    'schedulers are kept. It should be longer than the '
+                    'interval at which volume services report their '
+                    'capabilities.'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(host_manager_opts)
 CONF.import_opt('scheduler_driver', 'cinder.scheduler.manager')
 CONF.import_opt('max_over_subscription_ratio', 'cinder.volume.driver')
+CONF.import_opt('report_interval', 'cinder.service')
 
 LOG = logging.getLogger(__name__)
 
@@ -123,6 +148,10 @@ class BackendState(object):
         # all volumes on a backend, which could be greater than or
         # equal to the allocated_capacity_gb.
         self.provisioned_capacity_gb = 0
+        # Number of volumes on the backend, and when it was counted, for
+        # the volume number weigher.
+        self.volume_count = None
+        self.volume_counted_at = None
         self.max_over_subscription_ratio = 1.0
         self.thin_provisioning_support = False
         self.thick_provisioning_support = False
@@ -303,6 +332,9 @@ class BackendState(object):
         volume_gb = volume['size']
         self.allocated_capacity_gb += volume_gb
         self.provisioned_capacity_gb += volume_gb
+        if self.volume_count is not None:
+            # Consumed capacity is reverted with a negative size
+            self.volume_count += 1 if volume_gb >= 0 else -1
         if self.free_capacity_gb == 'infinite':
             # There's virtually infinite space on back-end
             pass
@@ -352,6 +384,10 @@ class PoolState(BackendState):
         self.pool_name = pool_name
         # No pools in pool
         self.pools = None
+        # Allocations of other schedulers consumed since the pool was
+        # reported at reported_at
+        self.reported_at = None
+        self.shared_allocations = set()
 
     def update_from_volume_capability(self, capability, service=None):
         """Update information about a pool from its volume_node info."""
@@ -361,6 +397,8 @@ class PoolState(BackendState):
             if self.updated and self.updated > capability['timestamp']:
                 return
             self.update_backend(capability)
+            self.reported_at = capability['timestamp']
+            self.shared_allocations = set()
 
             self.total_capacity_gb = capability.get('total_capacity_gb', 0)
             self.free_capacity_gb = capability.get('free_capacity_gb', 0)
@@ -392,6 +430,56 @@ class PoolState(BackendState):
         pass
 
 
+class PoolIndex(object):
+    """Inverted index of the pools by availability zone and capabilities.
+
+    For each capability key, the pools are indexed by the values they report
+    for it. The pools whose value can't be indexed, like a dict, are kept
+    apart and are candidates for any value of that key.
+    """
+
+    def __init__(self):
+        self._index = collections.defaultdict(
+            lambda: collections.defaultdict(set))
+        self._unindexed = collections.defaultdict(set)
+        self._entries = {}
+
+    def add(self, pool):
+        self.remove(pool)
+        entries = [('availability_zone',
+                    pool.service.get('availability_zone'))]
+        for key, value in pool.capabilities.items():
+            values = value if isinstance(value, list) else [value]
+            entries.extend((key, v) for v in values)
+
+        indexed = []
+        for key, value in entries:
+            try:
+                self._index[key][value].add(pool)
+            except TypeError:
+                self._unindexed[key].add(pool)
+                value = None
+            indexed.append((key, value))
+        self._entries[pool] = indexed
+
+    def remove(self, pool):
+        for key, value in self._entries.pop(pool, []):
+            self._unindexed[key].discard(pool)
+            pools = self._index[key].get(value)
+            if pools is not None:
+                pools.discard(pool)
+                if not pools:
+                    del self._index[key][value]
+
+    def get(self, key, values):
+        """Return the pools which may have one of the values for a key."""
+        pools = set(self._unindexed.get(key, ()))
+        by_value = self._index.get(key, {})
+        for value in values:
+            pools.update(by_value.get(value, ()))
+        return pools
+
+
 class HostManager(object):
     """Base HostManager class."""
 
@@ -422,6 +510,13 @@ class HostManager(object):
         self.weight_classes = self.weight_handler.get_all_classes()
 
         self._no_capabilities_backends = set()  # Services without capabilities
+        # When the volume services were last read, and the up backends then
+        self._up_backends = (None, set())
+        self.pool_index = PoolIndex()
+        self._indexed_backends = {}
+        self.allocation_ledger = None
+        if CONF.scheduler_shared_allocations:
+            self.allocation_ledger = allocations.AllocationLedger()
         self._update_backend_state_map(cinder_context.get_admin_context())
         self.service_states_last_update = {}
 
@@ -479,23 +574,99 @@ class HostManager(object):
         return good_weighers
 
     def get_filtered_backends(self, backends, filter_properties,
-                              filter_class_names=None):
+                              filter_class_names=None, trace=None):
         """Filter backends and return only ones passing all filters."""
         if filter_class_names is not None:
             filter_classes = self._choose_backend_filters(filter_class_names)
         else:
             filter_classes = self.enabled_filters
+        if CONF.scheduler_capabilities_index:
+            candidates = self._get_indexed_candidates(filter_classes,
+                                                      filter_properties)
+            if candidates is not None:
+                backends = [backend for backend in backends
+                            if backend in candidates]
         return self.filter_handler.get_filtered_objects(filter_classes,
                                                         backends,
-                                                        filter_properties)
+                                                        filter_properties,
+                                                        trace=trace)
+
+    def _get_indexed_candidates(self, filter_classes, filter_properties):
+        """Return the pools that may pass the filters according to the index.
+
+        Only the requirements checked by the availability zone and
+        capabilities filters, when they are used, are looked up in the index.
+        Returns None when nothing can be looked up.
+        """
+        filter_names = {cls.__name__ for cls in filter_classes}
+        candidates = None
+
+        if 'AvailabilityZoneFilter' in filter_names:
+            spec = filter_properties.get('request_spec') or {}
+            availability_zones = spec.get('availability_zones')
+            if not availability_zones:
+                props = spec.get('resource_properties') or {}
+                availability_zone = props.get('availability_zone')
+                availability_zones = ([availability_zone]
+                                      if availability_zone else None)
+            if availability_zones:
+                candidates = self.pool_index.get('availability_zone',
+                                                 availability_zones)
+
+        if 'CapabilitiesFilter' in filter_names:
+            resource_type = filter_properties.get('resource_type') or {}
+            extra_specs = resource_type.get('extra_specs') or {}
+            for key, req in extra_specs.items():
+                scope = key.split(':')
+                if scope[0] == 'capabilities':
+                    del scope[0]
+                # Scoped and nested capabilities aren't indexed.
+                if len(scope) != 1:
+                    continue
+                values = extra_specs_ops.get_match_values(req)
+                if values is None:
+                    continue
+                pools = self.pool_index.get(scope[0], values)
+                candidates = (pools if candidates is None
+                              else candidates & pools)
+
+        return candidates
+
+    def _update_pool_index(self, backend_key, backend_state):
+        # The capabilities are replaced, not modified, on every report, so
+        # the pools only need to be indexed again when they change.
+        capabilities = (backend_state.capabilities,
+                        backend_state.service.get('availability_zone'))
+        indexed = self._indexed_backends.get(backend_key)
+        if indexed and indexed[0] == capabilities:
+            return
+
+        if indexed:
+            for pool in indexed[1]:
+                self.pool_index.remove(pool)
+        pools = list(backend_state.pools.values())
+        for pool in pools:
+            self.pool_index.add(pool)
+        self._indexed_backends[backend_key] = (capabilities, pools)
+
+    def _remove_from_pool_index(self, backend_key):
+        indexed = self._indexed_backends.pop(backend_key, None)
+        if indexed:
+            for pool in indexed[1]:
+                self.pool_index.remove(pool)
 
     def get_weighed_backends(self, backends, weight_properties,
-                             weigher_class_names=None):
-        """Weigh the backends."""
+                             weigher_class_names=None, trace=None,
+                             limit=None):
+        """Weigh the backends.
+
+        :param limit: only return the limit backends with the highest weights
+        """
         weigher_classes = self._choose_backend_weighers(weigher_class_names)
 
         weighed_backends = self.weight_handler.get_weighed_objects(
-            weigher_classes, backends, weight_properties)
+            weigher_classes, backends, weight_properties, trace=trace,
+            limit=limit)
 
         LOG.debug("Weighed %s", weighed_backends)
         return weighed_backends
@@ -643,6 +814,8 @@ class HostManager(object):
             # update capabilities and attributes in backend_state
             backend_state.update_from_volume_capability(capabilities,
                                                         service=dict(service))
+            if CONF.scheduler_capabilities_index:
+                self._update_pool_index(backend_key, backend_state)
             active_backends.add(backend_key)
 
         self._no_capabilities_backends = no_capabilities_backends
@@ -657,6 +830,7 @@ class HostManager(object):
                 LOG.info("Removing non-active backend: %(backend)s from "
                          "scheduler cache.", {'backend': backend_key})
             del self.backend_state_map[backend_key]
+            self._remove_from_pool_index(backend_key)
 
     def revert_volume_consumed_capacity(self, pool_name, size):
         for backend_key, state in self.backend_state_map.items():
@@ -688,8 +862,65 @@ class HostManager(object):
                 pool_key = '.'.join([backend_key, pool.pool_name])
                 all_pools[pool_key] = pool
 
+        if self.allocation_ledger:
+            self._consume_shared_allocations(all_pools.values())
+
         return all_pools.values()
 
+    def get_up_backends(self, context, backends):
+        """Return the backends whose volume service is still up.
+
+        Only the services are read, to drop the backends that went down or
+        were disabled since backends were returned by get_all_backend_states,
+        and at most once every report_interval seconds, how often services
+        report their state. Like in get_all_backend_states, the allocations
+        of other schedulers are consumed from the backends.
+        """
+        now = timeutils.utcnow()
+        read_at, up_backends = self._up_backends
+        if (read_at is None or
+                timeutils.delta_seconds(read_at, now) >= CONF.report_interval):
+            volume_services = objects.ServiceList.get_all(
+                context, {'topic': constants.VOLUME_TOPIC, 'disabled': False,
+                          'frozen': False})
+            up_backends = {service.service_topic_queue
+                           for service in volume_services.objects
+                           if service.is_up}
+            self._up_backends = (now, up_backends)
+
+        backends = [backend for backend in backends
+                    if vol_utils.extract_host(backend.backend_id) in
+                    up_backends]
+
+        if self.allocation_ledger:
+            self._consume_shared_allocations(backends)
+
+        return backends
+
+    def _consume_shared_allocations(self, pools):
+        """Consume the allocations of other schedulers from the pools.
+
+        Allocations are consumed once, and only if they were made after the
+        last capabilities report of the pool.
+        """
+        pools = {pool.backend_id: pool for pool in pools}
+        for (allocation_id, backend_id, size,
+             timestamp) in self.allocation_ledger.get_allocations():
+            pool = pools.get(backend_id)
+            if (not pool or allocation_id in pool.shared_allocations or
+                    (pool.reported_at and timestamp <= pool.reported_at)):
+                continue
+            LOG.debug('Consuming %(size)s GB allocated by another scheduler '
+                      'from %(backend)s.', {'size': size,
+                                            'backend': backend_id})
+            pool.consume_from_volume({'size': size}, update_time=False)
+            pool.shared_allocations.add(allocation_id)
+
+    def share_allocation(self, backend_state, size):
+        """Share the capacity allocated on a pool with other schedulers."""
+        if self.allocation_ledger:
+            self.allocation_ledger.add(backend_state.backend_id, size)
+
     def _filter_pools_by_volume_type(self, context, volume_type, pools):
         """Return the pools filtered by volume type specs"""
 
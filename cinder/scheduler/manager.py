@@ -47,6 +47,7 @@ from cinder import quota
 from cinder import rpc
 from cinder.scheduler.flows import create_volume
 from cinder.scheduler import rpcapi as scheduler_rpcapi
+from cinder import utils
 from cinder.volume import rpcapi as volume_rpcapi
 
 
@@ -99,6 +100,10 @@ class SchedulerManager(manager.CleanableManager, manager.Manager):
         self.message_api = mess_api.API()
         self.rpc_api_version = versionutils.convert_version_to_int(
             self.RPC_API_VERSION)
+        # Last sequenced capabilities report received from each service and
+        # the services we have asked for a full report.
+        self._capabilities_reports = {}
+        self._capabilities_resyncs = set()
 
     def init_host_with_rpc(self):
         ctxt = context.get_admin_context()
@@ -129,6 +134,7 @@ class SchedulerManager(manager.CleanableManager, manager.Manager):
     def update_service_capabilities(self, context, service_name=None,
                                     host=None, capabilities=None,
                                     cluster_name=None, timestamp=None,
+                                    sequence=None, base_sequence=None,
                                     **kwargs):
         """Process a capability update from a service node."""
         if capabilities is None:
@@ -138,12 +144,56 @@ class SchedulerManager(manager.CleanableManager, manager.Manager):
             timestamp = datetime.strptime(timestamp,
                                           timeutils.PERFECT_TIME_FORMAT)
 
+        if sequence is not None:
+            capabilities = self._get_reported_capabilities(
+                context, service_name, host, capabilities, sequence,
+                base_sequence)
+            if capabilities is None:
+                return
+
         self.driver.update_service_capabilities(service_name,
                                                 host,
                                                 capabilities,
                                                 cluster_name,
                                                 timestamp)
 
+    def _get_reported_capabilities(self, context, service_name, host,
+                                   capabilities, sequence, base_sequence):
+        """Return the full capabilities of a sequenced report.
+
+        Reports with a base sequence only contain the changes since that
+        report, so we apply them to the capabilities we got in it.  If we
+        missed a report we cannot do that, so we ask the service for a full
+        report and return None.
+        """
+        key = (service_name, host)
+        if base_sequence is not None:
+            last_sequence, last_capabilities = self._capabilities_reports.get(
+                key, (None, None))
+            if last_sequence != base_sequence:
+                self._capabilities_reports.pop(key, None)
+                if key not in self._capabilities_resyncs:
+                    LOG.info('Missed capability report from %(service)s '
+                             'service on %(host)s, requesting a full report.',
+                             {'service': service_name, 'host': host})
+                    self._capabilities_resyncs.add(key)
+                    self.volume_api.publish_service_capabilities(context,
+                                                                 host=host)
+                return None
+            capabilities = utils.apply_capabilities_delta(last_capabilities,
+                                                          capabilities)
+        else:
+            self._capabilities_resyncs.discard(key)
+
+        self._capabilities_reports[key] = (sequence, capabilities)
+        # The host manager modifies the pools it receives, so give it copies
+        # and keep ours intact to apply the next changes.
+        capabilities = dict(capabilities)
+        if isinstance(capabilities.get('pools'), list):
+            capabilities['pools'] = [dict(pool)
+                                     for pool in capabilities['pools']]
+        return capabilities
+
     def notify_service_capabilities(self, context, service_name,
                                     capabilities, host=None, backend=None,
                                     timestamp=None):
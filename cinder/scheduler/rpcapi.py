@@ -72,9 +72,11 @@ class SchedulerAPI(rpc.RPCAPI):
         3.9 - Adds create_snapshot method
         3.10 - Adds backup_id to create_volume method.
         3.11 - Adds manage_existing_snapshot method.
+        3.12 - Adds sequence and base_sequence to
+               update_service_capabilities to receive capability changes.
     """
 
-    RPC_API_VERSION = '3.11'
+    RPC_API_VERSION = '3.12'
     RPC_DEFAULT_VERSION = '3.0'
     TOPIC = constants.SCHEDULER_TOPIC
     BINARY = 'cinder-scheduler'
@@ -204,13 +206,23 @@ class SchedulerAPI(rpc.RPCAPI):
 
     def update_service_capabilities(self, ctxt, service_name, host,
                                     capabilities, cluster_name,
-                                    timestamp=None):
+                                    timestamp=None, sequence=None,
+                                    delta=None):
         msg_args = dict(service_name=service_name, host=host,
                         capabilities=capabilities)
 
-        version = '3.3'
+        version = '3.12'
+        # If server accepts sequenced reports we can send only the changes
+        if sequence is not None and self.client.can_send_version(version):
+            msg_args.update(cluster_name=cluster_name,
+                            timestamp=self.prepare_timestamp(timestamp),
+                            sequence=sequence)
+            if delta is not None:
+                msg_args.update(capabilities=delta,
+                                base_sequence=sequence - 1)
         # If server accepts timestamping the capabilities and the cluster name
-        if self.client.can_send_version(version):
+        elif self.client.can_send_version('3.3'):
+            version = '3.3'
             # Serialize the timestamp
             msg_args.update(cluster_name=cluster_name,
                             timestamp=self.prepare_timestamp(timestamp))
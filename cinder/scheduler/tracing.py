@@ -0,0 +1,138 @@
+# Copyright (c) 2026 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Instrumentation of the scheduling decisions.
+"""
+
+import random
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+from oslo_utils import importutils
+from oslo_utils import timeutils
+
+
+scheduler_tracing_opts = [
+    cfg.StrOpt('scheduler_metrics_sink',
+               help='Full class name of the metrics sink that receives the '
+                    'time spent and the hosts removed by each scheduler '
+                    'filter and weigher, for example '
+                    'cinder.scheduler.tracing.LogMetricsSink. Metrics are '
+                    'not collected when unset.'),
+    cfg.FloatOpt('scheduler_decision_log_sample_rate',
+                 default=0.0,
+                 min=0.0,
+                 max=1.0,
+                 help='Fraction of the scheduling decisions that are logged '
+                      'to the cinder.scheduler.decisions logger, with the '
+                      'time and host counts of each filter and weigher and '
+                      'the final weights of the hosts.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(scheduler_tracing_opts)
+
+LOG = logging.getLogger(__name__)
+DECISION_LOG = logging.getLogger('cinder.scheduler.decisions')
+
+
+class MetricsSink(object):
+    """Base class for the sinks receiving the scheduler metrics.
+
+    Override increment to collect counters and observe to collect the
+    samples of histograms, like the time spent by each filter.
+    """
+
+    def increment(self, name, value=1):
+        """Increase the counter with the given name."""
+
+    def observe(self, name, value):
+        """Add a sample to the histogram with the given name."""
+
+
+class LogMetricsSink(MetricsSink):
+    """Metrics sink that logs the metrics at debug level."""
+
+    def increment(self, name, value=1):
+        LOG.debug('Scheduler metric %(name)s increased by %(value)s.',
+                  {'name': name, 'value': value})
+
+    def observe(self, name, value):
+        LOG.debug('Scheduler metric %(name)s observed %(value)s.',
+                  {'name': name, 'value': value})
+
+
+class SchedulingTrace(object):
+    """Steps of a scheduling decision.
+
+    Filter and weigher handlers record the time they spent and the number of
+    candidates before and after each step, and the scheduler the final
+    weights of the candidates before the trace is finished.
+    """
+
+    def __init__(self, sink, log_decision, volume_id=None):
+        self.sink = sink
+        self.log_decision = log_decision
+        self.volume_id = volume_id
+        self.steps = []
+        self.weights = []
+        self._start = timeutils.now()
+
+    def record(self, kind, name, elapsed, start_count, end_count):
+        """Record a filter or weigher step."""
+        self.steps.append({'kind': kind, 'name': name, 'elapsed': elapsed,
+                           'start': start_count, 'end': end_count})
+        if self.sink:
+            self.sink.observe('scheduler.%s.%s.time' % (kind, name), elapsed)
+            if start_count != end_count:
+                self.sink.increment('scheduler.%s.%s.removed' % (kind, name),
+                                    start_count - end_count)
+
+    def finish(self, backend_id):
+        """Finish the trace of a decision that chose backend_id, or None."""
+        elapsed = timeutils.now() - self._start
+        if self.sink:
+            self.sink.observe('scheduler.time', elapsed)
+            self.sink.increment('scheduler.requests')
+            if backend_id is None:
+                self.sink.increment('scheduler.no_valid_backend')
+
+        if self.log_decision:
+            DECISION_LOG.info(jsonutils.dumps(
+                {'volume_id': self.volume_id,
+                 'backend': backend_id,
+                 'elapsed': elapsed,
+                 'steps': self.steps,
+                 'weights': self.weights}))
+
+
+class Tracer(object):
+    """Create the traces of the scheduling decisions."""
+
+    def __init__(self):
+        self.sink = None
+        if CONF.scheduler_metrics_sink:
+            self.sink = importutils.import_object(CONF.scheduler_metrics_sink)
+
+    def start(self, request_spec):
+        """Return the trace for a request, or None if it isn't traced."""
+        sample_rate = CONF.scheduler_decision_log_sample_rate
+        log_decision = bool(sample_rate) and random.random() < sample_rate
+        if not (self.sink or log_decision):
+            return None
+        return SchedulingTrace(self.sink, log_decision,
+                               request_spec.get('volume_id'))
@@ -63,17 +63,21 @@ class CapacityWeigher(weights.BaseHostWeigher):
         """Override the weigh objects.
 
 
-        This override calls the parent to do the weigh objects and then
-        replaces any infinite weights with a value that is a multiple of the
-        delta between the min and max values.
+        This override weighs all the objects at once, looking up the
+        provisioning type and the multiplier only once, and then replaces any
+        infinite weights with a value that is a multiple of the delta between
+        the min and max values.
 
         NOTE(jecarey): the infinite weight value is only used when the
         smallest value is being favored (negative multiplier).  When the
         largest weight value is being used a weight of -1 is used instead.
         See _weigh_object method.
         """
-        tmp_weights = super(CapacityWeigher, self).weigh_objects(
-            weighed_obj_list, weight_properties)
+        thin = self._is_thin(weight_properties)
+        unknown_weight = self._unknown_weight()
+        tmp_weights = [self._get_free(obj.obj, thin, unknown_weight)
+                       for obj in weighed_obj_list]
+        self._update_limits(tmp_weights)
 
         if math.isinf(self.maxval):
             # NOTE(jecarey): if all weights were infinite then parent
@@ -88,41 +92,47 @@ class CapacityWeigher(weights.BaseHostWeigher):
 
         return tmp_weights
 
-    def _weigh_object(self, host_state, weight_properties):
-        """Higher weights win.  We want spreading to be the default."""
+    @staticmethod
+    def _is_thin(weight_properties):
+        # NOTE(xyang): If 'provisioning:type' is 'thick' in extra_specs,
+        # we will not use max_over_subscription_ratio and
+        # provisioned_capacity_gb to determine whether a volume can be
+        # provisioned. Instead free capacity will be used to evaluate.
+        vol_type = weight_properties.get('volume_type', {}) or {}
+        provision_type = vol_type.get('extra_specs', {}).get(
+            'provisioning:type')
+        return provision_type != 'thick'
+
+    @staticmethod
+    def _unknown_weight():
+        # As a partial fix for bug #1350638, 'infinite' and 'unknown' are
+        # given the lowest weight to discourage driver from report such
+        # capacity anymore.
+        return -1 if CONF.capacity_weight_multiplier > 0 else float('inf')
+
+    @staticmethod
+    def _get_free(host_state, thin, unknown_weight):
         free_space = host_state.free_capacity_gb
         total_space = host_state.total_capacity_gb
         if (free_space == 'infinite' or free_space == 'unknown' or
                 total_space == 'infinite' or total_space == 'unknown'):
             # (zhiteng) 'infinite' and 'unknown' are treated the same
             # here, for sorting purpose.
+            return unknown_weight
+
+        return utils.calculate_virtual_free_capacity(
+            total_space,
+            free_space,
+            host_state.provisioned_capacity_gb,
+            host_state.thin_provisioning_support,
+            host_state.max_over_subscription_ratio,
+            host_state.reserved_percentage,
+            thin)
 
-            # As a partial fix for bug #1350638, 'infinite' and 'unknown' are
-            # given the lowest weight to discourage driver from report such
-            # capacity anymore.
-            free = -1 if CONF.capacity_weight_multiplier > 0 else float('inf')
-        else:
-            # NOTE(xyang): If 'provisioning:type' is 'thick' in extra_specs,
-            # we will not use max_over_subscription_ratio and
-            # provisioned_capacity_gb to determine whether a volume can be
-            # provisioned. Instead free capacity will be used to evaluate.
-            thin = True
-            vol_type = weight_properties.get('volume_type', {}) or {}
-            provision_type = vol_type.get('extra_specs', {}).get(
-                'provisioning:type')
-            if provision_type == 'thick':
-                thin = False
-
-            free = utils.calculate_virtual_free_capacity(
-                total_space,
-                free_space,
-                host_state.provisioned_capacity_gb,
-                host_state.thin_provisioning_support,
-                host_state.max_over_subscription_ratio,
-                host_state.reserved_percentage,
-                thin)
-
-        return free
+    def _weigh_object(self, host_state, weight_properties):
+        """Higher weights win.  We want spreading to be the default."""
+        return self._get_free(host_state, self._is_thin(weight_properties),
+                              self._unknown_weight())
 
 
 class AllocatedCapacityWeigher(weights.BaseHostWeigher):
@@ -22,6 +22,8 @@ weight.
 
 import random
 
+from oslo_utils import timeutils
+
 from cinder.scheduler import base_weight
 from cinder.scheduler import weights as wts
 
@@ -32,7 +34,7 @@ class StochasticHostWeightHandler(base_weight.BaseWeightHandler):
                                                           namespace)
 
     def get_weighed_objects(self, weigher_classes, obj_list,
-                            weighing_properties):
+                            weighing_properties, trace=None, limit=None):
         # The normalization performed in the superclass is nonlinear, which
         # messes up the probabilities, so override it. The probabilistic
         # approach we use here is self-normalizing.
@@ -43,11 +45,16 @@ class StochasticHostWeightHandler(base_weight.BaseWeightHandler):
         # or normalization.
         weighed_objs = [wts.WeighedHost(obj, 0.0) for obj in obj_list]
         for weigher_cls in weigher_classes:
+            start_time = timeutils.now()
             weigher = weigher_cls()
             weights = weigher.weigh_objects(weighed_objs, weighing_properties)
             for i, weight in enumerate(weights):
                 obj = weighed_objs[i]
                 obj.weight += weigher.weight_multiplier() * weight
+            if trace:
+                trace.record('weigher', weigher_cls.__name__,
+                             timeutils.now() - start_time,
+                             len(weighed_objs), len(weighed_objs))
 
         # Avoid processing empty lists
         if not weighed_objs:
@@ -79,4 +86,5 @@ class StochasticHostWeightHandler(base_weight.BaseWeightHandler):
         # could only occur with very large numbers and floating point
         # rounding. In those cases the actual winner should have been the
         # last element, so return it.
-        return weighed_objs[winning_index:] + weighed_objs[0:winning_index]
+        result = weighed_objs[winning_index:] + weighed_objs[0:winning_index]
+        return result if limit is None else result[:limit]
@@ -14,6 +14,7 @@
 #    under the License.
 
 from oslo_config import cfg
+from oslo_utils import timeutils
 
 from cinder import db
 from cinder.scheduler import weights
@@ -24,6 +25,14 @@ volume_number_weight_opts = [
                  default=-1.0,
                  help='Multiplier used for weighing volume number. '
                       'Negative numbers mean to spread vs stack.'),
+    cfg.IntOpt('volume_number_refresh_interval',
+               default=60,
+               min=0,
+               help='Seconds after which the number of volumes of the '
+                    'backends used for weighing volume number are counted '
+                    'again in the database. In between, the volumes placed '
+                    'by the scheduler are added to the counts. 0 counts '
+                    'them on every request.'),
 ]
 
 CONF = cfg.CONF
@@ -36,12 +45,48 @@ class VolumeNumberWeigher(weights.BaseHostWeigher):
     The default is to spread volumes across all hosts evenly. If you prefer
     stacking, you can set the ``volume_number_multiplier`` option to a positive
     number and the weighing has the opposite effect of the default.
+
+    The volumes of all the hosts are counted with a single query, and the
+    counts are kept in the host states until they are older than
+    ``volume_number_refresh_interval`` seconds.
     """
 
     def weight_multiplier(self):
         """Override the weight multiplier."""
         return CONF.volume_number_multiplier
 
+    def weigh_objects(self, weighed_obj_list, weight_properties):
+        """Override the weigh objects to count the volumes at once."""
+        host_states = [obj.obj for obj in weighed_obj_list]
+        interval = CONF.volume_number_refresh_interval
+        if not interval or any(
+                state.volume_count is None or
+                timeutils.is_older_than(state.volume_counted_at, interval)
+                for state in host_states):
+            self._count_volumes(weight_properties['context'], host_states)
+
+        weights = [state.volume_count for state in host_states]
+        self._update_limits(weights)
+        return weights
+
+    @staticmethod
+    def _count_volumes(context, host_states):
+        counts = {}
+        for host, count in db.volume_count_get_all_by_host(
+                context.elevated()).items():
+            if not host:
+                continue
+            counts[host] = counts.get(host, 0) + count
+            # Volumes in a pool also count for its backend
+            backend = host.partition('#')[0]
+            if backend != host:
+                counts[backend] = counts.get(backend, 0) + count
+
+        now = timeutils.utcnow()
+        for state in host_states:
+            state.volume_count = counts.get(state.host, 0)
+            state.volume_counted_at = now
+
     def _weigh_object(self, host_state, weight_properties):
         """Less volume number weights win.
 
@@ -128,29 +128,6 @@ class BackupCephTestCase(test.TestCase):
                                              'user_foo', 'conf_foo')
         return linuxrbd.RBDVolumeIOWrapper(rbd_meta)
 
-    def _setup_mock_popen(self, mock_popen, retval=None, p1hook=None,
-                          p2hook=None):
-
-        class MockPopen(object):
-            hooks = [p2hook, p1hook]
-
-            def __init__(mock_inst, cmd, *args, **kwargs):
-                self.callstack.append('popen_init')
-                mock_inst.stdout = mock.Mock()
-                mock_inst.stdout.close = mock.Mock()
-                mock_inst.stdout.close.side_effect = \
-                    lambda *args: self.callstack.append('stdout_close')
-                mock_inst.returncode = 0
-                hook = mock_inst.__class__.hooks.pop()
-                if hook is not None:
-                    hook()
-
-            def communicate(mock_inst):
-                self.callstack.append('communicate')
-                return retval
-
-        mock_popen.side_effect = MockPopen
-
     def setUp(self):
         global RAISED_EXCEPTIONS
         RAISED_EXCEPTIONS = []
@@ -203,8 +180,6 @@ class BackupCephTestCase(test.TestCase):
         # called to avoid div by zero errors.
         self.counter = float(0)
 
-        self.callstack = []
-
     @common_mocks
     def test_get_rbd_support(self):
         del self.service.rbd.RBD_FEATURE_LAYERING
@@ -438,27 +413,31 @@ class BackupCephTestCase(test.TestCase):
                          name)
 
     @common_mocks
-    @mock.patch('fcntl.fcntl', spec=True)
-    @mock.patch('subprocess.Popen', spec=True)
-    def test_backup_volume_from_rbd(self, mock_popen, mock_fnctl):
+    @mock.patch.object(ceph.CephBackupDriver, '_open_rbd_image')
+    def test_backup_volume_from_rbd(self, mock_open_rbd_image):
         backup_name = self.service._get_backup_base_name(self.volume_id,
                                                          diff_format=True)
 
-        def mock_write_data():
-            self.volume_file.seek(0)
-            data = self.volume_file.read(self.data_length)
-            self.callstack.append('write')
-            checksum.update(data)
-            test_file.write(data)
+        def mock_read_data(offset, length):
+            self.volume_file.seek(offset)
+            return self.volume_file.read(length)
 
-        def mock_read_data():
-            self.callstack.append('read')
-            return self.volume_file.read(self.data_length)
+        def mock_write_data(data, offset):
+            test_file.seek(offset)
+            test_file.write(data)
+            checksum.update(data)
 
-        self._setup_mock_popen(mock_popen,
-                               ['out', 'err'],
-                               p1hook=mock_read_data,
-                               p2hook=mock_write_data)
+        src_rbd = mock.Mock()
+        src_rbd.size.return_value = self.data_length
+        src_rbd.diff_iterate.side_effect = (
+            lambda offset, length, from_snap, cb: cb(0, length, True))
+        src_rbd.read.side_effect = mock_read_data
+        dest_rbd = mock.Mock()
+        dest_rbd.size.return_value = self.data_length
+        dest_rbd.write.side_effect = mock_write_data
+        mock_open_rbd_image.side_effect = [
+            mock.MagicMock(**{'__enter__.return_value': rbd_image})
+            for rbd_image in (src_rbd, dest_rbd)]
 
         self.mock_rbd.RBD.list = mock.Mock()
         self.mock_rbd.RBD.list.return_value = [backup_name]
@@ -486,12 +465,17 @@ class BackupCephTestCase(test.TestCase):
                             output = self.service.backup(self.backup, rbdio)
                             self.assertDictEqual({}, output)
 
-                            self.assertEqual(['popen_init',
-                                              'read',
-                                              'popen_init',
-                                              'write',
-                                              'stdout_close',
-                                              'communicate'], self.callstack)
+                            self.assertEqual(
+                                [mock.call(self.volume.name, 'pool_foo',
+                                           'user_foo', 'conf_foo',
+                                           snapshot=mock.ANY, read_only=True),
+                                 mock.call(backup_name, 'backups', 'cinder',
+                                           '/etc/ceph/ceph.conf')],
+                                mock_open_rbd_image.call_args_list)
+                            dest_rbd.create_snap.assert_called_once_with(
+                                mock_open_rbd_image.call_args_list[0][1][
+                                    'snapshot'])
+                            test_file.flush()
 
                             self.assertFalse(mock_full_backup.called)
                             self.assertTrue(mock_get_backup_snaps.called)
@@ -584,9 +568,7 @@ class BackupCephTestCase(test.TestCase):
             self.assertDictEqual({'parent_id': 'mock'}, output)
 
     @common_mocks
-    @mock.patch('fcntl.fcntl', spec=True)
-    @mock.patch('subprocess.Popen', spec=True)
-    def test_backup_volume_from_rbd_fail(self, mock_popen, mock_fnctl):
+    def test_backup_volume_from_rbd_fail(self):
         """Test of when an exception occurs in an exception handler.
 
         In _backup_rbd(), after an exception.BackupRBDOperationFailed
@@ -597,22 +579,6 @@ class BackupCephTestCase(test.TestCase):
         backup_name = self.service._get_backup_base_name(self.volume_id,
                                                          diff_format=True)
 
-        def mock_write_data():
-            self.volume_file.seek(0)
-            data = self.volume_file.read(self.data_length)
-            self.callstack.append('write')
-            checksum.update(data)
-            test_file.write(data)
-
-        def mock_read_data():
-            self.callstack.append('read')
-            return self.volume_file.read(self.data_length)
-
-        self._setup_mock_popen(mock_popen,
-                               ['out', 'err'],
-                               p1hook=mock_read_data,
-                               p2hook=mock_write_data)
-
         self.mock_rbd.RBD.list = mock.Mock()
         self.mock_rbd.RBD.list.return_value = [backup_name]
 
@@ -645,26 +611,22 @@ class BackupCephTestCase(test.TestCase):
                     mock_try_delete_base_image.side_effect \
                         = mock_try_delete_base_image_side_effect
                     with mock.patch.object(self.service, '_backup_metadata'):
-                        with tempfile.NamedTemporaryFile() as test_file:
-                            checksum = hashlib.sha256()
-                            image = self.service.rbd.Image()
-                            meta = linuxrbd.RBDImageMetadata(image,
-                                                             'pool_foo',
-                                                             'user_foo',
-                                                             'conf_foo')
-                            rbdio = linuxrbd.RBDVolumeIOWrapper(meta)
+                        image = self.service.rbd.Image()
+                        meta = linuxrbd.RBDImageMetadata(image,
+                                                         'pool_foo',
+                                                         'user_foo',
+                                                         'conf_foo')
+                        rbdio = linuxrbd.RBDVolumeIOWrapper(meta)
 
-                            # We expect that the second exception is
-                            # notified.
-                            self.assertRaises(
-                                self.service.rbd.ImageNotFound,
-                                self.service.backup,
-                                self.backup, rbdio)
+                        # We expect that the second exception is
+                        # notified.
+                        self.assertRaises(
+                            self.service.rbd.ImageNotFound,
+                            self.service.backup,
+                            self.backup, rbdio)
 
     @common_mocks
-    @mock.patch('fcntl.fcntl', spec=True)
-    @mock.patch('subprocess.Popen', spec=True)
-    def test_backup_volume_from_rbd_fail2(self, mock_popen, mock_fnctl):
+    def test_backup_volume_from_rbd_fail2(self):
         """Test of when an exception occurs in an exception handler.
 
         In backup(), after an exception.BackupOperationError occurs in
@@ -674,22 +636,6 @@ class BackupCephTestCase(test.TestCase):
         backup_name = self.service._get_backup_base_name(self.volume_id,
                                                          diff_format=True)
 
-        def mock_write_data():
-            self.volume_file.seek(0)
-            data = self.volume_file.read(self.data_length)
-            self.callstack.append('write')
-            checksum.update(data)
-            test_file.write(data)
-
-        def mock_read_data():
-            self.callstack.append('read')
-            return self.volume_file.read(self.data_length)
-
-        self._setup_mock_popen(mock_popen,
-                               ['out', 'err'],
-                               p1hook=mock_read_data,
-                               p2hook=mock_write_data)
-
         self.mock_rbd.RBD.list = mock.Mock()
         self.mock_rbd.RBD.list.return_value = [backup_name]
 
@@ -716,21 +662,19 @@ class BackupCephTestCase(test.TestCase):
 
                     # Raise a pseudo exception rbd.ImageBusy.
                     mock_delete.side_effect = mock_delete_side_effect
-                    with tempfile.NamedTemporaryFile() as test_file:
-                        checksum = hashlib.sha256()
-                        image = self.service.rbd.Image()
-                        meta = linuxrbd.RBDImageMetadata(image,
-                                                         'pool_foo',
-                                                         'user_foo',
-                                                         'conf_foo')
-                        rbdio = linuxrbd.RBDVolumeIOWrapper(meta)
-
-                        # We expect that the second exception is
-                        # notified.
-                        self.assertRaises(
-                            self.service.rbd.ImageBusy,
-                            self.service.backup,
-                            self.backup, rbdio)
+                    image = self.service.rbd.Image()
+                    meta = linuxrbd.RBDImageMetadata(image,
+                                                     'pool_foo',
+                                                     'user_foo',
+                                                     'conf_foo')
+                    rbdio = linuxrbd.RBDVolumeIOWrapper(meta)
+
+                    # We expect that the second exception is
+                    # notified.
+                    self.assertRaises(
+                        self.service.rbd.ImageBusy,
+                        self.service.backup,
+                        self.backup, rbdio)
 
     @common_mocks
     def test_backup_rbd_from_snap(self):
@@ -814,6 +758,128 @@ class BackupCephTestCase(test.TestCase):
                             dest_user='cinder', src_snap='new_snap',
                             from_snap='backup.mock.snap.153464362.12')
 
+    def _mock_open_rbd_image(self, mock_open_rbd_image, src_extents):
+        src_rbd = mock.Mock()
+        src_rbd.size.return_value = 8192
+        src_rbd.diff_iterate.side_effect = (
+            lambda offset, length, from_snap, cb: [cb(*extent)
+                                                   for extent in src_extents])
+        src_rbd.read.side_effect = lambda offset, length: b'x' * length
+        dest_rbd = mock.Mock()
+        dest_rbd.size.return_value = 4096
+        dest_rbd.list_snaps.return_value = [{'name': 'from_snap'}]
+        mock_open_rbd_image.side_effect = [
+            mock.MagicMock(**{'__enter__.return_value': rbd_image})
+            for rbd_image in (src_rbd, dest_rbd)]
+        return src_rbd, dest_rbd
+
+    @common_mocks
+    @mock.patch.object(ceph, 'RBD_TRANSFER_SIZE', 2048)
+    @mock.patch.object(ceph.CephBackupDriver, '_open_rbd_image')
+    def test_rbd_diff_transfer(self, mock_open_rbd_image):
+        # The backup chunk size doesn't bound the size of the transfers
+        self.service.chunk_size = 8192
+        src_rbd, dest_rbd = self._mock_open_rbd_image(
+            mock_open_rbd_image, [(0, 3000, True), (3000, 5000, False)])
+
+        self.service._rbd_diff_transfer('src', 'src_pool', 'dest',
+                                        'dest_pool', 'src_user', 'src_conf',
+                                        'dest_user', 'dest_conf',
+                                        src_snap='src_snap',
+                                        from_snap='from_snap')
+
+        self.assertEqual(
+            [mock.call('src', 'src_pool', 'src_user', 'src_conf',
+                       snapshot='src_snap', read_only=True),
+             mock.call('dest', 'dest_pool', 'dest_user', 'dest_conf')],
+            mock_open_rbd_image.call_args_list)
+        src_rbd.diff_iterate.assert_called_once_with(0, 8192, 'from_snap',
+                                                     mock.ANY)
+        dest_rbd.resize.assert_called_once_with(8192)
+        # Extents are split in chunks and holes are skipped
+        self.assertEqual([mock.call(0, 2048), mock.call(2048, 952)],
+                         src_rbd.read.call_args_list)
+        self.assertEqual([mock.call(b'x' * 2048, 0),
+                          mock.call(b'x' * 952, 2048)],
+                         dest_rbd.write.call_args_list)
+        # Discards are not split
+        dest_rbd.discard.assert_called_once_with(3000, 5000)
+        dest_rbd.create_snap.assert_called_once_with('src_snap')
+
+    @common_mocks
+    @mock.patch.object(ceph.CephBackupDriver, '_open_rbd_image')
+    def test_rbd_diff_transfer_from_snap_not_found(self, mock_open_rbd_image):
+        self.mock_rados.Error = MockException
+        self.mock_rbd.Error = MockException
+        src_rbd, dest_rbd = self._mock_open_rbd_image(mock_open_rbd_image,
+                                                      [(0, 4096, True)])
+
+        self.assertRaises(exception.BackupRBDOperationFailed,
+                          self.service._rbd_diff_transfer,
+                          'src', 'src_pool', 'dest', 'dest_pool', 'src_user',
+                          'src_conf', 'dest_user', 'dest_conf',
+                          src_snap='src_snap', from_snap='other_snap')
+
+        self.assertFalse(src_rbd.diff_iterate.called)
+        self.assertFalse(dest_rbd.create_snap.called)
+
+    @common_mocks
+    @mock.patch.object(ceph.CephBackupDriver, '_open_rbd_image')
+    def test_rbd_diff_transfer_rbd_error(self, mock_open_rbd_image):
+        self.mock_rados.Error = MockException
+        self.mock_rbd.Error = MockException
+        src_rbd, dest_rbd = self._mock_open_rbd_image(mock_open_rbd_image,
+                                                      [(0, 4096, True)])
+        dest_rbd.write.side_effect = MockException
+
+        self.assertRaises(exception.BackupRBDOperationFailed,
+                          self.service._rbd_diff_transfer,
+                          'src', 'src_pool', 'dest', 'dest_pool', 'src_user',
+                          'src_conf', 'dest_user', 'dest_conf',
+                          src_snap='src_snap')
+
+        self.assertFalse(dest_rbd.create_snap.called)
+
+    @common_mocks
+    def test_open_rbd_image(self):
+        image = self.mock_rbd.Image.return_value
+        client = self.mock_rados.Rados.return_value
+        ioctx = client.open_ioctx.return_value
+
+        with self.service._open_rbd_image('name', 'pool', 'user', 'conf',
+                                          read_only=True) as rbd_image:
+            self.assertEqual(image.size.return_value, rbd_image.size())
+
+        self.mock_rados.Rados.assert_called_once_with(rados_id='user',
+                                                      conffile='conf')
+        client.open_ioctx.assert_called_once_with('pool')
+        self.mock_rbd.Image.assert_called_once_with(ioctx, 'name',
+                                                    read_only=True)
+        image.close.assert_called_once_with()
+        ioctx.close.assert_called_once_with()
+        client.shutdown.assert_called_once_with()
+
+        self.assertRaises(exception.BackupInvalidCephArgs,
+                          self.service._open_rbd_image('name', 'pool', None,
+                                                       'conf').__enter__)
+
+    @common_mocks
+    def test_connect_to_rados(self):
+        self.service._ceph_backup_user = 'backup_user'
+        self.service._ceph_backup_conf = 'backup_conf'
+
+        self.service._connect_to_rados()
+        self.mock_rados.Rados.assert_called_once_with(rados_id='backup_user',
+                                                      conffile='backup_conf')
+        self.mock_rados.Rados.return_value.open_ioctx.assert_called_once_with(
+            self.service._ceph_backup_pool)
+
+        # An empty conf of a volume isn't replaced by the backup cluster one
+        self.mock_rados.Rados.reset_mock()
+        self.service._connect_to_rados('pool', 'user', '')
+        self.mock_rados.Rados.assert_called_once_with(rados_id='user',
+                                                      conffile='')
+
     @common_mocks
     def test_backup_vol_length_0(self):
         volume_id = fake.VOLUME_ID
@@ -1267,16 +1333,6 @@ class BackupCephTestCase(test.TestCase):
                         self.assertTrue(mock_file_is_rbd.called)
                         self.assertTrue(mock_rbd_has_extents.called)
 
-    @common_mocks
-    @mock.patch('fcntl.fcntl', spec=True)
-    @mock.patch('subprocess.Popen', spec=True)
-    def test_piped_execute(self, mock_popen, mock_fcntl):
-        mock_fcntl.return_value = 0
-        self._setup_mock_popen(mock_popen, ['out', 'err'])
-        self.service._piped_execute(['foo'], ['bar'])
-        self.assertEqual(['popen_init', 'popen_init',
-                          'stdout_close', 'communicate'], self.callstack)
-
     @common_mocks
     def test_restore_metdata(self):
         version = 2
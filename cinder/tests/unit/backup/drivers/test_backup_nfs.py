@@ -840,6 +840,178 @@ class BackupNFSTestCase(test.TestCase):
             self.assertTrue(filecmp.cmp(self.volume_file.name,
                             restored_file.name))
 
+    def _dedup_backup(self, service, container_name, backup_id,
+                      parent_id=None):
+        self._create_backup_db_entry(container=container_name,
+                                     backup_id=backup_id,
+                                     parent_id=parent_id)
+        self.volume_file.seek(0)
+        backup = objects.Backup.get_by_id(self.ctxt, backup_id)
+        service.backup(backup, self.volume_file)
+        return objects.Backup.get_by_id(self.ctxt, backup_id)
+
+    def _dedup_restore(self, service, backup):
+        backup.status = objects.fields.BackupStatus.RESTORING
+        backup.save()
+        with tempfile.NamedTemporaryFile() as restored_file:
+            service.restore(backup, backup.volume_id, restored_file)
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                            restored_file.name))
+
+    def test_backup_deduplication(self):
+        self.flags(backup_file_size=(1024 * 8))
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_enable_deduplication=True)
+        # The first 4 blocks of the volume have the same contents.
+        block = os.urandom(1024)
+        self.volume_file.seek(0)
+        self.volume_file.write(block * 4)
+        self.volume_file.flush()
+
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        backup = self._dedup_backup(service, container_name, fake.BACKUP_ID)
+        backup2 = self._dedup_backup(service, container_name,
+                                     fake.BACKUP2_ID)
+
+        blocks = service.get_container_entries(
+            container_name, service.DEDUP_OBJECT_PREFIX)
+        self.assertEqual(29, len(blocks))
+        self.assertEqual(29, backup.object_count)
+        self.assertEqual(0, backup2.object_count)
+        index = service._read_dedup_index(container_name)
+        self.assertEqual(29, len(index['blocks']))
+        self.assertTrue(all(entry['refs'] == 2
+                            for entry in index['blocks'].values()))
+        metadata = service._read_metadata(backup2)
+        self.assertEqual(service.DEDUP_DRIVER_VERSION, metadata['version'])
+        self.assertEqual(32, len(metadata['objects']))
+
+        self._dedup_restore(service, backup2)
+
+        service.delete_backup(backup)
+        self.assertEqual(29, len(service.get_container_entries(
+            container_name, service.DEDUP_OBJECT_PREFIX)))
+        self._dedup_restore(service, backup2)
+
+        service.delete_backup(backup2)
+        self.assertEqual([], service.get_container_entries(
+            container_name, service.DEDUP_OBJECT_PREFIX))
+        self.assertEqual({}, service._read_dedup_index(
+            container_name)['blocks'])
+
+    def test_backup_deduplication_delta(self):
+        self.flags(backup_file_size=(1024 * 8))
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_enable_deduplication=True)
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self._dedup_backup(service, container_name, fake.BACKUP_ID)
+
+        self.volume_file.seek(16 * 1024)
+        self.volume_file.write(os.urandom(1024))
+        self.volume_file.seek(20 * 1024)
+        self.volume_file.write(os.urandom(1024))
+        self.volume_file.flush()
+        deltabackup = self._dedup_backup(service, container_name,
+                                         fake.BACKUP2_ID,
+                                         parent_id=fake.BACKUP_ID)
+
+        self.assertEqual(2, deltabackup.object_count)
+        self.assertEqual(34, len(service.get_container_entries(
+            container_name, service.DEDUP_OBJECT_PREFIX)))
+        self._dedup_restore(service, deltabackup)
+
+    def test_backup_deduplication_delete_while_creating(self):
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_enable_deduplication=True)
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        backup = self._dedup_backup(service, container_name, fake.BACKUP_ID)
+        self._create_backup_db_entry(
+            container=container_name, backup_id=fake.BACKUP2_ID,
+            status=objects.fields.BackupStatus.CREATING)
+
+        service.delete_backup(backup)
+
+        # Blocks are kept for the backup being created, but not referenced.
+        self.assertEqual(32, len(service.get_container_entries(
+            container_name, service.DEDUP_OBJECT_PREFIX)))
+        index = service._read_dedup_index(container_name)
+        self.assertTrue(all(entry['refs'] == 0
+                            for entry in index['blocks'].values()))
+
+    def test_backup_detect_zero_blocks(self):
+        self.flags(backup_file_size=(1024 * 8))
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_detect_zero_blocks=True)
+        self.volume_file.seek(0)
+        self.volume_file.write(b'\0' * 1024 * 6)
+        self.volume_file.flush()
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        backup = self._dedup_backup(service, container_name, fake.BACKUP_ID)
+
+        metadata = service._read_metadata(backup)
+        self.assertEqual(service.SPARSE_DRIVER_VERSION, metadata['version'])
+        self.assertEqual([[0, 1024 * 6]], metadata['holes'])
+        self.assertEqual(4, backup.object_count)
+        first_object = list(metadata['objects'][0].values())[0]
+        self.assertEqual(1024 * 6, first_object['offset'])
+        self._dedup_restore(service, backup)
+
+        # Zeroing blocks in an incremental backup.
+        self.volume_file.seek(1024 * 8)
+        self.volume_file.write(b'\0' * 1024 * 2)
+        self.volume_file.seek(1024 * 12)
+        self.volume_file.write(os.urandom(1024))
+        self.volume_file.flush()
+        deltabackup = self._dedup_backup(service, container_name,
+                                         fake.BACKUP2_ID,
+                                         parent_id=fake.BACKUP_ID)
+        metadata = service._read_metadata(deltabackup)
+        self.assertEqual([[1024 * 8, 1024 * 2]], metadata['holes'])
+        self.assertEqual(1, deltabackup.object_count)
+        self._dedup_restore(service, deltabackup)
+
+    def test_backup_detect_zero_blocks_holes(self):
+        self.flags(backup_file_size=(1024 * 16))
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_detect_zero_blocks=True)
+        self.volume_file.truncate(0)
+        self.volume_file.seek(1024 * 32)
+        self.volume_file.write(os.urandom(1024 * 8))
+        self.volume_file.truncate(1024 * 64)
+        self.volume_file.flush()
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        service = nfs.NFSBackupDriver(self.ctxt)
+
+        self.assertEqual(1024 * 16, service._get_hole_length(
+            self.volume_file, 0, 1024 * 16))
+        self.assertEqual(0, service._get_hole_length(
+            self.volume_file, 1024 * 30, 1024 * 16))
+        self.assertEqual(1024 * 24, service._get_hole_length(
+            self.volume_file, 1024 * 40, 1024 * 32))
+        self.assertEqual(1024 * 40, self.volume_file.tell())
+
+        # Holes are not read nor hashed.
+        with mock.patch.object(service, '_calculate_sha',
+                               wraps=service._calculate_sha) as mock_sha:
+            backup = self._dedup_backup(service, container_name,
+                                        fake.BACKUP_ID)
+        self.assertEqual(1, mock_sha.call_count)
+
+        metadata = service._read_metadata(backup)
+        self.assertEqual([[0, 1024 * 32], [1024 * 40, 1024 * 24]],
+                         metadata['holes'])
+        self.assertEqual(64, len(service._read_sha256file(backup)['sha256s']))
+        self._dedup_restore(service, backup)
+
     def test_delete(self):
         volume_id = fake.VOLUME_ID
         self._create_backup_db_entry(volume_id=volume_id)
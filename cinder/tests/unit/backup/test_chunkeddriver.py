@@ -14,11 +14,15 @@
 """Tests for the base chunkedbackupdriver class."""
 
 import json
+import sys
 import uuid
+import zlib
 
+import eventlet
 import mock
 from oslo_config import cfg
 from oslo_utils import units
+import six
 
 from cinder.backup import chunkeddriver as cbd
 from cinder import context
@@ -211,6 +215,39 @@ class ChunkedDriverTestCase(test.TestCase):
     def test_get_compressor_invalid(self):
         self.assertRaises(ValueError, self.driver._get_compressor, 'winzip')
 
+    def test_get_compressor_level(self):
+        compressor = self.driver._get_compressor('zlib', level=9)
+        data = b'a' * 1024
+        self.assertEqual(zlib.compress(data, 9), compressor.compress(data))
+        self.assertEqual(data, compressor.decompress(zlib.compress(data, 9)))
+
+    @mock.patch.dict('sys.modules', zstandard=mock.Mock())
+    def test_get_compressor_zstd(self):
+        zstd = sys.modules['zstandard']
+        compressor = self.driver._get_compressor('zstd', level=5, threads=4)
+
+        self.assertEqual(
+            zstd.ZstdCompressor.return_value.compress.return_value,
+            compressor.compress(b'data'))
+        zstd.ZstdCompressor.assert_called_once_with(level=5, threads=4)
+        self.assertEqual(
+            zstd.ZstdDecompressor.return_value.decompress.return_value,
+            compressor.decompress(b'compressed'))
+
+    @mock.patch.dict('sys.modules', zstandard=None)
+    def test_get_compressor_zstd_not_installed(self):
+        self.assertRaises(ValueError, self.driver._get_compressor, 'zstd')
+
+    def test_get_compressor_lz4(self):
+        lz4 = mock.Mock()
+        with mock.patch.dict('sys.modules', {'lz4': lz4,
+                                             'lz4.frame': lz4.frame}):
+            compressor = self.driver._get_compressor('lz4')
+            self.assertEqual(lz4.frame, compressor)
+            compressor = self.driver._get_compressor('lz4', level=3)
+            compressor.compress(b'data')
+        lz4.frame.compress.assert_called_once_with(b'data', 3)
+
     def test_create_container(self):
         self.assertEqual(self.backup.container,
                          self.driver._create_container(self.backup))
@@ -444,6 +481,92 @@ class ChunkedDriverTestCase(test.TestCase):
         self.assert_notify_called(mock_notify,
                                   (['INFO', 'backup.createprogress'],))
 
+    def _backup_chunks(self, data_chunks):
+        volume_file = mock.Mock()
+        offsets = [0]
+        for data in data_chunks:
+            offsets.append(offsets[-1] + len(data))
+        volume_file.tell.side_effect = offsets
+        volume_file.read.side_effect = data_chunks + [b'']
+        with mock.patch.object(self.driver, '_finalize_backup') as finalize:
+            self.driver.backup(self.backup, volume_file,
+                               backup_metadata=False)
+        return finalize
+
+    def test_backup_concurrent_uploads(self):
+        self.driver.max_concurrent_uploads = 3
+        data_chunks = [TEST_DATA[i:i + 10] for i in range(0, 50, 10)]
+        written = {}
+
+        def _write(container, object_name, data, extra_metadata):
+            # Finish the uploads in reverse order.
+            eventlet.sleep(0.01 * (10 - int(object_name[-5:])))
+            written[object_name] = data
+
+        with mock.patch.object(self.driver, '_prepare_output_data',
+                               side_effect=lambda d: ('none', d)), \
+                mock.patch.object(self.driver, '_get_object_writer') as gw:
+            gw.side_effect = lambda c, n, extra_metadata=None: (
+                mock.MagicMock(**{'__enter__.return_value.write':
+                                  lambda d: _write(c, n, d, extra_metadata)}))
+            finalize = self._backup_chunks(data_chunks)
+
+        object_meta = finalize.call_args[0][2]
+        self.assertEqual(6, object_meta['id'])
+        object_names = [list(obj.keys())[0] for obj in object_meta['list']]
+        self.assertEqual(['test--%05d' % i for i in range(1, 6)],
+                         object_names)
+        for i, obj in enumerate(object_meta['list']):
+            info = obj[object_names[i]]
+            self.assertEqual(i * 10, info['offset'])
+            self.assertEqual('none', info['compression'])
+            self.assertIn('md5', info)
+            self.assertEqual(data_chunks[i], written[object_names[i]])
+
+    def test_backup_concurrent_uploads_failure(self):
+        self.driver.max_concurrent_uploads = 2
+        data_chunks = [TEST_DATA[i:i + 10] for i in range(0, 40, 10)]
+        uploaded = []
+
+        def _upload(container, object_name, object_info, data,
+                    extra_metadata):
+            eventlet.sleep(0)
+            if object_name.endswith('2'):
+                raise exception.BackupOperationError('upload failed')
+            uploaded.append(object_name)
+
+        with mock.patch.object(self.driver, '_upload_chunk',
+                               side_effect=_upload):
+            self.assertRaises(exception.BackupOperationError,
+                              self._backup_chunks, data_chunks)
+
+        # The other uploads submitted before the failure are not abandoned.
+        self.assertIn('test--00001', uploaded)
+
+    def test_chunk_uploader_bounds_concurrency(self):
+        uploader = cbd._ChunkUploader(2)
+        running = []
+        max_running = []
+
+        def _upload():
+            running.append(1)
+            max_running.append(len(running))
+            eventlet.sleep(0.01)
+            running.pop()
+
+        for i in range(6):
+            uploader.submit(_upload)
+        uploader.wait()
+
+        self.assertEqual(6, len(max_running))
+        self.assertEqual(2, max(max_running))
+
+    def test_chunk_uploader_wait_no_reraise(self):
+        uploader = cbd._ChunkUploader(2)
+        uploader.submit(mock.Mock(side_effect=ValueError))
+        uploader.wait(reraise=False)
+        self.assertEqual([], uploader._uploads)
+
     def test_backup_invalid_size(self):
         self.driver.chunk_size_bytes = 999
         self.driver.sha_block_size_bytes = 1024
@@ -455,7 +578,7 @@ class ChunkedDriverTestCase(test.TestCase):
     def test_restore(self):
         volume_file = mock.Mock()
         restore_test = mock.Mock()
-        self.driver._restore_v1 = restore_test
+        self.driver._restore_chain = restore_test
 
         # Create a second backup
         backup = self._create_backup_db_entry(
@@ -466,6 +589,144 @@ class ChunkedDriverTestCase(test.TestCase):
             self.assertEqual(2, mock_put.call_count)
 
         restore_test.assert_called()
+        backup_chain = restore_test.call_args[0][0]
+        self.assertEqual([self.backup.id, backup.id],
+                         [b.id for b, metadata in backup_chain])
+
+    def test_restore_unknown_version_in_chain(self):
+        volume_file = mock.Mock()
+        restore_test = mock.Mock()
+        self.driver._restore_v1 = restore_test
+        self.driver.DRIVER_VERSION_MAPPING = {'1.0.0': '_restore_v1',
+                                              '3.0.0': '_restore_v3'}
+        backup = self._create_backup_db_entry(
+            self.volume, parent_id=self.backup.id)
+        metadata = json.loads(TestObjectReader('', '').read())
+
+        with mock.patch.object(self.driver, '_read_metadata',
+                               side_effect=[metadata, metadata,
+                                            dict(metadata,
+                                                 version='3.0.0')]), \
+                mock.patch.object(self.driver, '_restore_chain') as chain, \
+                mock.patch.object(self.driver, 'put_metadata'):
+            self.driver.restore(backup, self.volume, volume_file)
+
+        chain.assert_not_called()
+        self.assertEqual(2, restore_test.call_count)
+
+    def _fake_backup_chain(self, *backups_objects):
+        backup_chain = []
+        for backup_objects in backups_objects:
+            backup = self._create_backup_db_entry(volume_id=self.volume)
+            metadata = {'version': '1.0.0', 'objects': [
+                {name: {'offset': offset, 'length': len(data),
+                        'compression': 'none', 'data': data}}
+                for name, offset, data in backup_objects]}
+            backup_chain.append((backup, metadata))
+        return backup_chain
+
+    def test_restore_chain(self):
+        # The full backup is overwritten by two incremental backups, the
+        # second one fully replacing an object of the first one.
+        backup_chain = self._fake_backup_chain(
+            [('full-1', 0, b'aaaaaaaa'), ('full-2', 8, b'bbbbbbbb')],
+            [('incr1-1', 2, b'cccc'), ('incr1-2', 10, b'dd')],
+            [('incr2-1', 9, b'eeee')])
+        volume_file = six.BytesIO()
+        self.driver.max_concurrent_downloads = 2
+        self.backup.status = fields.BackupStatus.RESTORING
+        self.backup.save()
+
+        def _read_object(container, object_name, obj, extra_metadata):
+            return obj['data']
+
+        with mock.patch.object(self.driver, '_check_object_list'), \
+                mock.patch.object(self.driver, '_read_object',
+                                  side_effect=_read_object) as read_object:
+            self.driver._restore_chain(backup_chain, self.volume,
+                                       volume_file, self.backup)
+
+        self.assertEqual(b'aaccccaabeeeebbb', volume_file.getvalue())
+        read_objects = [c[0][1] for c in read_object.call_args_list]
+        self.assertEqual(['full-1', 'incr1-1', 'full-2', 'incr2-1'],
+                         read_objects)
+
+    def test_restore_chain_dedup(self):
+        backup_chain = self._fake_backup_chain(
+            [('dedup_block_a', 0, b'aaaa'), ('dedup_block_b', 4, b'bbbb'),
+             ('dedup_block_a', 8, b'aaaa')])
+        backup_chain[0][1]['version'] = self.driver.DEDUP_DRIVER_VERSION
+        volume_file = six.BytesIO()
+        self.backup.status = fields.BackupStatus.RESTORING
+        self.backup.save()
+
+        def _read_object(container, object_name, obj, extra_metadata):
+            return obj['data']
+
+        with mock.patch.object(self.driver, '_check_object_list') as check, \
+                mock.patch.object(self.driver, '_read_object',
+                                  side_effect=_read_object) as read_object:
+            self.driver._restore_chain(backup_chain, self.volume,
+                                       volume_file, self.backup)
+
+        check.assert_not_called()
+        self.assertEqual(b'aaaabbbbaaaa', volume_file.getvalue())
+        self.assertEqual(2, read_object.call_count)
+
+    def test_restore_chain_holes(self):
+        # The incremental backup zeroes part of an object of the full backup.
+        backup_chain = self._fake_backup_chain(
+            [('full-1', 0, b'aaaaaaaa')],
+            [('incr1-1', 6, b'cc')])
+        backup_chain[1][1]['holes'] = [[2, 4]]
+        volume_file = six.BytesIO(b'x' * 8)
+        self.backup.status = fields.BackupStatus.RESTORING
+        self.backup.save()
+
+        def _read_object(container, object_name, obj, extra_metadata):
+            return obj['data']
+
+        with mock.patch.object(self.driver, '_check_object_list'), \
+                mock.patch.object(self.driver, '_read_object',
+                                  side_effect=_read_object):
+            self.driver._restore_chain(backup_chain, self.volume,
+                                       volume_file, self.backup)
+
+        self.assertEqual(b'aa\0\0\0\0cc', volume_file.getvalue())
+
+    def test_restore_chain_cancel(self):
+        backup_chain = self._fake_backup_chain(
+            [('full-1', 0, b'aaaa'), ('full-2', 4, b'bbbb')])
+        volume_file = six.BytesIO()
+        self.backup.status = fields.BackupStatus.RESTORING
+        self.backup.save()
+
+        def _read_object(container, object_name, obj, extra_metadata):
+            self.backup.status = fields.BackupStatus.AVAILABLE
+            self.backup.save()
+            return obj['data']
+
+        with mock.patch.object(self.driver, '_check_object_list'), \
+                mock.patch.object(self.driver, '_read_object',
+                                  side_effect=_read_object):
+            self.assertRaises(exception.BackupRestoreCancel,
+                              self.driver._restore_chain,
+                              backup_chain, self.volume, volume_file,
+                              self.backup)
+        self.assertEqual(b'aaaa', volume_file.getvalue())
+
+    def test_extent_map(self):
+        extent_map = cbd._ExtentMap()
+        extent_map.add(0, 10, 'a')
+        extent_map.add(10, 20, 'b')
+        extent_map.add(5, 15, 'c')
+        extent_map.add(16, 18, 'd')
+        extent_map.add(0, 2, 'e')
+        self.assertEqual([(0, 2, 'e'), (2, 5, 'a'), (5, 15, 'c'),
+                          (15, 16, 'b'), (16, 18, 'd'), (18, 20, 'b')],
+                         list(extent_map))
+        extent_map.add(0, 20, 'f')
+        self.assertEqual([(0, 20, 'f')], list(extent_map))
 
     def test_delete_backup(self):
         with mock.patch.object(self.driver, 'delete_object') as mock_delete:
@@ -23,7 +23,7 @@ class FakeBrickLVM(object):
         return False
 
     def get_volumes(self):
-        return ['fake-volume']
+        return [{'vg': self.vg_name, 'name': 'fake-volume', 'size': '1.00'}]
 
     def get_volume(self, name):
         return ['name']
@@ -15,6 +15,7 @@
 import ddt
 import mock
 from oslo_concurrency import processutils
+from oslo_serialization import jsonutils
 
 from cinder.brick.local_dev import lvm as brick
 from cinder import exception
@@ -121,6 +122,19 @@ class BrickLvmTestCase(test.TestCase):
             else:
                 data = "  fake-vg fake-1 1.00g\n"
                 data += "  fake-vg fake-2 1.00g\n"
+        elif (_lvm_prefix + 'lvs, --reportformat, json, --unit=g, '
+              '--nosuffix, -o, vg_name,lv_name,lv_size,lv_attr,origin,'
+              'data_percent, fake-vg' == cmd_string):
+            lvs = [('fake-1', '1.00', 'owi-a-----', '', ''),
+                   ('fake-snapshot', '1.00', 'swi-a-s---', 'fake-1', '0.00'),
+                   ('fake-open', '2.00', '-wi-ao----', '', ''),
+                   ('fake-vg-pool', '9.00', 'twi-aotz--', '', '12.00')]
+            data = jsonutils.dumps(
+                {'report': [{'lv': [
+                    {'vg_name': 'fake-vg', 'lv_name': name, 'lv_size': size,
+                     'lv_attr': attr, 'origin': origin,
+                     'data_percent': data_percent}
+                    for name, size, attr, origin, data_percent in lvs]}]})
         elif (_lvm_prefix + 'lvdisplay, --noheading, -C, -o, Attr' in
               cmd_string):
             if 'test-volumes' in cmd_string:
@@ -405,6 +419,91 @@ class BrickLvmTestCase(test.TestCase):
 
             self.vg.activate_lv('my-lv')
 
+    def _create_cached_vg(self):
+        self.mock_object(brick.LVM, 'supports_lvs_json_report',
+                         return_value=True)
+        vg = brick.LVM(self.configuration.volume_group_name, 'sudo',
+                       executor=self.fake_execute,
+                       suppress_fd_warn=(
+                           self.configuration.lvm_suppress_fd_warnings),
+                       report_cache_ttl=5)
+        vg._execute = mock.Mock(side_effect=self.fake_execute)
+        return vg
+
+    def _count_lv_reports(self, vg):
+        return len([call for call in vg._execute.call_args_list
+                    if '--reportformat' in call[0]])
+
+    def test_lv_report_cache(self):
+        vg = self._create_cached_vg()
+
+        self.assertEqual({'vg': 'fake-vg', 'name': 'fake-1', 'size': '1.00'},
+                         vg.get_volume('fake-1'))
+        self.assertIsNone(vg.get_volume('fake-unknown'))
+        self.assertEqual(4, len(vg.get_volumes()))
+        self.assertTrue(vg.lv_has_snapshot('fake-1'))
+        self.assertTrue(vg.lv_is_snapshot('fake-snapshot'))
+        self.assertFalse(vg.lv_is_open('fake-snapshot'))
+        self.assertTrue(vg.lv_is_open('fake-open'))
+        self.assertEqual('fake-1', vg.lv_get_origin('fake-snapshot'))
+        self.assertIsNone(vg.lv_get_origin('fake-1'))
+        self.assertTrue(vg._lv_is_active('fake-1'))
+        self.assertEqual(7.92, vg._get_thin_pool_free_space('fake-vg',
+                                                            'fake-vg-pool'))
+        # All the lookups were answered by a single lvs command
+        self.assertEqual(1, self._count_lv_reports(vg))
+        self.assertEqual(1, vg._execute.call_count)
+
+        # Changing an LV invalidates the report
+        vg.create_volume('fake-new', '1G')
+        vg.get_volume('fake-1')
+        self.assertEqual(2, self._count_lv_reports(vg))
+
+    def test_lv_report_cache_expired(self):
+        vg = self._create_cached_vg()
+
+        with mock.patch.object(brick.timeutils, 'now', return_value=100):
+            vg.get_volume('fake-1')
+        with mock.patch.object(brick.timeutils, 'now', return_value=104):
+            vg.get_volume('fake-1')
+        self.assertEqual(1, self._count_lv_reports(vg))
+
+        with mock.patch.object(brick.timeutils, 'now', return_value=105):
+            vg.get_volume('fake-1')
+        self.assertEqual(2, self._count_lv_reports(vg))
+
+    def test_lv_report_cache_changed_while_reporting(self):
+        vg = self._create_cached_vg()
+
+        def fake_execute(*cmd, **kwargs):
+            # Another thread changes an LV while we run lvs
+            vg._invalidate_lv_report()
+            return self.fake_execute(*cmd, **kwargs)
+
+        vg._execute.side_effect = fake_execute
+        self.assertIsNotNone(vg.get_volume('fake-1'))
+        self.assertIsNone(vg._lv_report)
+
+    def test_lv_report_cache_lv_not_found(self):
+        vg = self._create_cached_vg()
+
+        # LVs missing from the report are looked up with lvdisplay
+        self.assertTrue(vg.lv_is_snapshot('snapshot-2'))
+        self.assertEqual(1, self._count_lv_reports(vg))
+        self.assertEqual(2, vg._execute.call_count)
+
+    def test_lv_report_cache_not_supported(self):
+        self.mock_object(brick.LVM, '_supports_lvs_json_report', None)
+
+        vg = brick.LVM(self.configuration.volume_group_name, 'sudo',
+                       executor=self.fake_execute,
+                       suppress_fd_warn=(
+                           self.configuration.lvm_suppress_fd_warnings),
+                       report_cache_ttl=5)
+
+        self.assertEqual(0, vg._lv_report_ttl)
+        self.assertIsNone(vg._get_lv_report())
+
     def test_get_mirrored_available_capacity(self):
         self.assertEqual(2.0, self.vg.vg_mirror_free_space(1))
 
@@ -0,0 +1,79 @@
+# Copyright (c) 2026 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the shared scheduler allocations.
+"""
+
+import datetime
+
+import fixtures
+from oslo_utils import timeutils
+
+from cinder import coordination
+from cinder.scheduler import allocations
+from cinder import test
+
+
+class AllocationLedgerTestCase(test.TestCase):
+    """Test case for AllocationLedger class."""
+
+    MOCK_TOOZ = False
+
+    def setUp(self):
+        super(AllocationLedgerTestCase, self).setUp()
+        state_path = self.useFixture(fixtures.TempDir()).path
+        self.override_config('backend_url', 'file://' + state_path,
+                             group='coordination')
+        self.ledgers = []
+        for __ in range(2):
+            coordinator = coordination.Coordinator(prefix='cinder-')
+            coordinator.start()
+            self.addCleanup(coordinator.stop)
+            self.ledgers.append(allocations.AllocationLedger(coordinator))
+
+    def test_get_allocations(self):
+        self.ledgers[0].add('host1@lvm#pool1', 10)
+        self.ledgers[0].add('host1@lvm#pool2', 20)
+        member_id = self.ledgers[0]._member_id
+
+        result = self.ledgers[1].get_allocations()
+
+        self.assertEqual([((member_id, 1), 'host1@lvm#pool1', 10),
+                          ((member_id, 2), 'host1@lvm#pool2', 20)],
+                         [allocation[:3] for allocation in result])
+        # We don't get our own allocations
+        self.assertEqual([], self.ledgers[0].get_allocations())
+
+    def test_get_allocations_expired(self):
+        self.ledgers[0].add('host1@lvm#pool1', 10)
+        timeutils.set_time_override(timeutils.utcnow() +
+                                    datetime.timedelta(seconds=121))
+        self.addCleanup(timeutils.clear_time_override)
+
+        self.assertEqual([], self.ledgers[1].get_allocations())
+
+        # Expired allocations are not published again
+        self.ledgers[0].add('host1@lvm#pool2', 20)
+        self.assertEqual(['host1@lvm#pool2'],
+                         [allocation[1] for allocation in
+                          self.ledgers[1].get_allocations()])
+
+    def test_coordinator_not_started(self):
+        ledger = allocations.AllocationLedger(
+            coordination.Coordinator(prefix='cinder-'))
+
+        ledger.add('host1@lvm#pool1', 10)
+
+        self.assertEqual([], ledger.get_allocations())
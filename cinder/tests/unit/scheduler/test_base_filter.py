@@ -172,3 +172,19 @@ class TestBaseFilterHandler(test.TestCase):
             result = self._get_filtered_objects(filter_classes, index=2)
             self.assertEqual(filter_objs_expected, result)
             self.assertEqual(1, fake5_filter_all.call_count)
+
+    def test_get_filtered_objects_trace(self):
+        trace = mock.Mock()
+        filter_classes = [FilterA, FakeFilter5, FilterB]
+
+        with mock.patch.object(FakeFilter5, 'filter_all',
+                               side_effect=lambda objs, props: objs):
+            result = self.handler.get_filtered_objects(
+                filter_classes, [1, 2, 3, 4], {}, 1, trace=trace)
+
+        self.assertIsNone(result)
+        # Filters that don't run for the index aren't recorded
+        self.assertEqual(
+            [mock.call('filter', 'FilterA', mock.ANY, 4, 3),
+             mock.call('filter', 'FilterB', mock.ANY, 3, 0)],
+            trace.record.call_args_list)
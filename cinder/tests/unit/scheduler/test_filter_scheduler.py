@@ -16,8 +16,11 @@
 Tests For Filter Scheduler.
 """
 
+import datetime
+
 import ddt
 import mock
+from oslo_utils import timeutils
 
 from cinder import context
 from cinder import exception
@@ -184,6 +187,174 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         self.assertIsNotNone(weighed_host.obj)
         self.assertTrue(_mock_service_get_all.called)
 
+    @mock.patch('cinder.db.service_get_all')
+    def test_schedule_shares_allocation(self, _mock_service_get_all):
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+        sched.host_manager.allocation_ledger = mock.Mock()
+        sched.host_manager.allocation_ledger.get_allocations.return_value = []
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        fakes.mock_host_manager_db_calls(_mock_service_get_all)
+
+        request_spec = {'volume_type': {'name': 'LVM_iSCSI'},
+                        'volume_properties': {'project_id': 1,
+                                              'size': 1}}
+        request_spec = objects.RequestSpec.from_primitives(request_spec)
+        weighed_host = sched._schedule(fake_context, request_spec, {})
+
+        sched.host_manager.allocation_ledger.add.assert_called_once_with(
+            weighed_host.obj.backend_id, 1)
+
+    @mock.patch('cinder.db.service_get_all')
+    def test_schedule_weighs_top_backend(self, _mock_service_get_all):
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        fakes.mock_host_manager_db_calls(_mock_service_get_all)
+        get_weighed = self.mock_object(
+            sched.host_manager, 'get_weighed_backends',
+            side_effect=sched.host_manager.get_weighed_backends)
+
+        request_spec = {'volume_type': {'name': 'LVM_iSCSI'},
+                        'volume_properties': {'project_id': 1,
+                                              'size': 1}}
+        request_spec = objects.RequestSpec.from_primitives(request_spec)
+        expected = sched._get_weighted_candidates(fake_context, request_spec,
+                                                  {})[0]
+        weighed_host = sched._schedule(fake_context, request_spec, {})
+        self.assertEqual(1, get_weighed.call_args[1]['limit'])
+        self.assertEqual(expected.obj.backend_id, weighed_host.obj.backend_id)
+        self.assertEqual(expected.weight, weighed_host.weight)
+
+        # All the backends are weighed when they have to match the
+        # resource's backend.
+        request_spec.resource_backend = 'host3'
+        weighed_host = sched._schedule(fake_context, request_spec, {})
+        self.assertIsNone(get_weighed.call_args[1]['limit'])
+        self.assertEqual('host3', utils.extract_host(weighed_host.obj.host))
+
+    @mock.patch('cinder.db.service_get_all')
+    def test_schedule_trace(self, _mock_service_get_all):
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+        sched.tracer = mock.Mock()
+        trace = sched.tracer.start.return_value
+        trace.log_decision = True
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        fakes.mock_host_manager_db_calls(_mock_service_get_all)
+
+        request_spec = {'volume_type': {'name': 'LVM_iSCSI'},
+                        'volume_properties': {'project_id': 1,
+                                              'size': 1}}
+        request_spec = objects.RequestSpec.from_primitives(request_spec)
+        weighed_host = sched._schedule(fake_context, request_spec, {})
+
+        sched.tracer.start.assert_called_once_with(request_spec)
+        recorded = [call[0][:2] for call in trace.record.call_args_list]
+        self.assertIn(('filter', 'CapacityFilter'), recorded)
+        self.assertIn(('weigher', 'CapacityWeigher'), recorded)
+        self.assertEqual((weighed_host.obj.backend_id, weighed_host.weight),
+                         trace.weights[0])
+        # The weights of all the candidates are logged
+        self.assertGreater(len(trace.weights), 1)
+        trace.finish.assert_called_once_with(weighed_host.obj.backend_id)
+
+        # Only the best one is weighed when only the metrics are collected
+        trace.log_decision = False
+        sched._schedule(fake_context, request_spec, {})
+        self.assertEqual(1, len(trace.weights))
+
+    @mock.patch('cinder.db.service_get_all')
+    def test_schedule_batch(self, _mock_service_get_all):
+        self.flags(scheduler_batch_window=10, report_interval=5)
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        fakes.mock_host_manager_db_calls(_mock_service_get_all)
+        get_all_backend_states = self.mock_object(
+            sched.host_manager, 'get_all_backend_states',
+            side_effect=sched.host_manager.get_all_backend_states)
+
+        def _schedule(size=1, project_id=1):
+            request_spec = {'volume_type': {'name': 'LVM_iSCSI'},
+                            'volume_properties': {'project_id': project_id,
+                                                  'size': size}}
+            request_spec = objects.RequestSpec.from_primitives(request_spec)
+            return sched._schedule(fake_context, request_spec, {}).obj
+
+        backends = [_schedule()]
+        self.assertEqual(1, get_all_backend_states.call_count)
+        backend_states = sched.host_manager.backend_state_map.values()
+        allocated = {pool: pool.allocated_capacity_gb
+                     for backend in backend_states
+                     for pool in backend.pools.values()}
+        get_all_backend_states.reset_mock()
+
+        # The backends are reused, and the consumed capacity is taken into
+        # account, for the same volume requests, and the services are only
+        # read once per report interval.
+        _mock_service_get_all.reset_mock()
+        for i in range(3):
+            backends.append(_schedule())
+        self.assertEqual(0, get_all_backend_states.call_count)
+        self.assertEqual(1, _mock_service_get_all.call_count)
+        self.assertEqual(3, sum(b.allocated_capacity_gb - allocated[b]
+                                for b in allocated))
+        self.assertTrue(set(backends) <= set(allocated))
+
+        _schedule(size=2)
+        self.assertEqual(1, get_all_backend_states.call_count)
+        _schedule(project_id=2)
+        self.assertEqual(2, get_all_backend_states.call_count)
+
+        # Backends whose service went down aren't reused, once the services
+        # have reported their state again.
+        for service in _mock_service_get_all.return_value:
+            if service['host'] != 'host3':
+                service['updated_at'] -= datetime.timedelta(days=1)
+        sched.host_manager._up_backends = (
+            timeutils.utcnow() - datetime.timedelta(seconds=5),
+            sched.host_manager._up_backends[1])
+        self.assertEqual('host3', utils.extract_host(_schedule().host,
+                                                     'host'))
+        self.assertEqual(2, get_all_backend_states.call_count)
+
+        # Expire the batches.
+        expired = timeutils.utcnow() - datetime.timedelta(seconds=1)
+        sched._batches = {k: (expired, v[1])
+                          for k, v in sched._batches.items()}
+        _schedule()
+        self.assertEqual(3, get_all_backend_states.call_count)
+
+    def test_get_batch_key(self):
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+
+        def _get_batch_key(**volume_properties):
+            volume_properties.setdefault('size', 1)
+            request_spec = {'volume_type': {'id': fake.VOLUME_TYPE_ID},
+                            'volume_properties': volume_properties}
+            filter_properties = {'request_spec': request_spec}
+            sched.populate_filter_properties(request_spec, filter_properties)
+            return sched._get_batch_key(request_spec, filter_properties)
+
+        self.assertEqual(_get_batch_key(project_id=1, display_name='a'),
+                         _get_batch_key(project_id=1, display_name='b'))
+        self.assertNotEqual(_get_batch_key(project_id=1),
+                            _get_batch_key(project_id=2))
+        self.assertNotEqual(_get_batch_key(metadata={'a': 'b'}),
+                            _get_batch_key(metadata={'a': 'c'}))
+
+        # Filter functions can read any volume property
+        sched.host_manager.enabled_filters = (
+            sched.host_manager._choose_backend_filters(['DriverFilter']))
+        self.assertNotEqual(_get_batch_key(project_id=1, display_name='a'),
+                            _get_batch_key(project_id=1, display_name='b'))
+
     @ddt.data(('host10@BackendA', True),
               ('host10@BackendB#openstack_nfs_1', True),
               ('host10', False))
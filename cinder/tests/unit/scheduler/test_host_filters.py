@@ -1232,6 +1232,18 @@ class ExtraSpecsOpsTestCase(test.TestCase):
             req=req,
             matches=matches)
 
+    @ddt.data((None, None),
+              ('', ['']),
+              ('lvm', ['lvm']),
+              ('s== lvm', ['lvm']),
+              ('s==', None),
+              ('<or> 11 <or> 12 <or>', ['11', '12']),
+              ('<is> True', None),
+              ('>= 10', None))
+    @ddt.unpack
+    def test_get_match_values(self, req, values):
+        self.assertEqual(values, extra_specs_ops.get_match_values(req))
+
 
 @ddt.ddt
 class BasicFiltersTestCase(BackendFiltersTestCase):
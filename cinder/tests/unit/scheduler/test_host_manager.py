@@ -111,6 +111,60 @@ class HostManagerTestCase(test.TestCase):
         self.assertEqual(expected, mock_func.call_args_list)
         self.assertEqual(set(self.fake_backends), set(result))
 
+    @mock.patch('cinder.objects.service.Service.is_up', True)
+    @mock.patch('cinder.db.service_get_all')
+    def test_get_filtered_backends_indexed(self, _mock_service_get_all):
+        self.flags(scheduler_capabilities_index=True)
+        ctxt = context.get_admin_context()
+        timestamp = datetime.utcnow()
+        _mock_service_get_all.return_value = [
+            dict(id=i, host='host%s' % i, topic='volume', disabled=False,
+                 availability_zone=az, updated_at=timeutils.utcnow(),
+                 binary=None, deleted=False, created_at=None,
+                 modified_at=None, report_count=0, deleted_at=None,
+                 disabled_reason=None, uuid=uuid)
+            for i, az, uuid in ((1, 'zone1', fake.UUID1),
+                                (2, 'zone1', fake.UUID2),
+                                (3, 'zone2', fake.UUID3))]
+        self.host_manager.service_states = {
+            'host1': dict(volume_backend_name='AAA', timestamp=timestamp,
+                          pools=[dict(pool_name='pool1', disk='ssd'),
+                                 dict(pool_name='pool2', disk='hdd')]),
+            'host2': dict(volume_backend_name='AAA', timestamp=timestamp,
+                          disk={'type': 'ssd'}),
+            'host3': dict(volume_backend_name='AAA', timestamp=timestamp,
+                          disk='ssd'),
+        }
+        self.host_manager.filter_handler = mock.Mock()
+        get_filtered = self.host_manager.filter_handler.get_filtered_objects
+
+        def _get_filtered(**extra_specs):
+            properties = {
+                'request_spec': {'resource_properties':
+                                 {'availability_zone': 'zone1'}},
+                'resource_type': {'extra_specs': extra_specs}}
+            self.host_manager.get_filtered_backends(
+                self.host_manager.get_all_backend_states(ctxt), properties)
+            return sorted(b.host for b in get_filtered.call_args[0][1])
+
+        # host2 reports a capability that can't be indexed, so it is left
+        # to the filters, host3 is in another availability zone.
+        self.assertEqual(['host1#pool1', 'host2#AAA'],
+                         _get_filtered(**{'capabilities:disk': 'ssd',
+                                          'volume_backend_name': 'AAA',
+                                          'vendor:option': 'foo',
+                                          'size': '>= 10'}))
+        self.assertEqual(['host1#pool2', 'host2#AAA'],
+                         _get_filtered(disk='<or> hdd <or> nvme'))
+
+        # The pools are indexed again when the capabilities change.
+        self.host_manager.service_states['host1'] = dict(
+            volume_backend_name='BBB', timestamp=timestamp,
+            pools=[dict(pool_name='pool1', disk='ssd')])
+        self.assertEqual(['host1#pool1'],
+                         _get_filtered(volume_backend_name='BBB'))
+        self.assertEqual(['host2#AAA'], _get_filtered(disk='hdd'))
+
     @mock.patch(
         'cinder.scheduler.host_manager.HostManager._is_just_initialized')
     @mock.patch('cinder.scheduler.host_manager.HostManager._get_updated_pools')
@@ -738,6 +792,77 @@ class HostManagerTestCase(test.TestCase):
                     ('non_clustered_host#_pool0', 4000)}
         self.assertSetEqual(expected, result)
 
+    @mock.patch('cinder.objects.Service.is_up', True)
+    def test_get_all_backend_states_shared_allocations(self):
+        ctxt = context.RequestContext(fake.USER_ID, fake.PROJECT_ID, True)
+        for host in ('host1', 'host2'):
+            db.service_create(ctxt,
+                              {'host': host,
+                               'topic': constants.VOLUME_TOPIC,
+                               'binary': constants.VOLUME_BINARY,
+                               'created_at': timeutils.utcnow()})
+        reported = timeutils.utcnow()
+        before = reported - timedelta(seconds=10)
+        after = reported + timedelta(seconds=10)
+        for host in ('host1', 'host2'):
+            self.host_manager.update_service_capabilities(
+                'volume', host, {'free_capacity_gb': 100}, None, reported)
+        self.host_manager.allocation_ledger = mock.Mock()
+        self.host_manager.allocation_ledger.get_allocations.return_value = [
+            (('scheduler2', 1), 'host1#_pool0', 10, after),
+            (('scheduler2', 2), 'host2#_pool0', 20, after),
+            # Already included in the report of the pool
+            (('scheduler2', 3), 'host2#_pool0', 40, before),
+            (('scheduler2', 4), 'unknown_host#_pool0', 40, after)]
+
+        # Allocations are only consumed once
+        for __ in range(2):
+            res = self.host_manager.get_all_backend_states(ctxt)
+            self.assertSetEqual({('host1#_pool0', 90), ('host2#_pool0', 80)},
+                                {(s.host, s.free_capacity_gb) for s in res})
+
+        # Until the pool reports its capabilities again
+        self.host_manager.update_service_capabilities(
+            'volume', 'host1', {'free_capacity_gb': 100}, None,
+            after + timedelta(seconds=1))
+        res = self.host_manager.get_all_backend_states(ctxt)
+        self.assertSetEqual({('host1#_pool0', 100), ('host2#_pool0', 80)},
+                            {(s.host, s.free_capacity_gb) for s in res})
+
+    @mock.patch('cinder.objects.Service.is_up', True)
+    def test_get_up_backends_shared_allocations(self):
+        ctxt = context.RequestContext(fake.USER_ID, fake.PROJECT_ID, True)
+        db.service_create(ctxt, {'host': 'host1',
+                                 'topic': constants.VOLUME_TOPIC,
+                                 'binary': constants.VOLUME_BINARY,
+                                 'created_at': timeutils.utcnow()})
+        reported = timeutils.utcnow()
+        self.host_manager.update_service_capabilities(
+            'volume', 'host1', {'free_capacity_gb': 100}, None, reported)
+        self.host_manager.allocation_ledger = mock.Mock()
+        self.host_manager.allocation_ledger.get_allocations.return_value = []
+        backends = list(self.host_manager.get_all_backend_states(ctxt))
+
+        # Allocations made by other schedulers in the meantime are consumed
+        # from the reused backends too.
+        self.host_manager.allocation_ledger.get_allocations.return_value = [
+            (('scheduler2', 1), 'host1#_pool0', 10,
+             reported + timedelta(seconds=10))]
+        res = self.host_manager.get_up_backends(ctxt, backends)
+        self.assertSetEqual({('host1#_pool0', 90)},
+                            {(s.host, s.free_capacity_gb) for s in res})
+
+    def test_share_allocation(self):
+        backend_state = host_manager.PoolState('host1', None, {}, 'pool1')
+
+        # Nothing happens when allocations are not shared
+        self.host_manager.share_allocation(backend_state, 10)
+
+        self.host_manager.allocation_ledger = mock.Mock()
+        self.host_manager.share_allocation(backend_state, 10)
+        self.host_manager.allocation_ledger.add.assert_called_once_with(
+            'host1#pool1', 10)
+
     @mock.patch('cinder.db.service_get_all')
     @mock.patch('cinder.objects.service.Service.is_up',
                 new_callable=mock.PropertyMock)
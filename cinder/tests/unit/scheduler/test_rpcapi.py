@@ -62,6 +62,54 @@ class SchedulerRPCAPITestCase(test.RPCAPITestCase):
                            timestamp='123')
         can_send_version.assert_called_once_with('3.3')
 
+    @mock.patch('oslo_messaging.RPCClient.can_send_version', return_value=True)
+    def test_update_service_capabilities_full_report(self, can_send_version):
+        self._test_rpc_api('update_service_capabilities',
+                           rpc_method='cast',
+                           service_name='fake_name',
+                           host='fake_host',
+                           cluster_name='cluster_name',
+                           capabilities={'free_capacity_gb': 10},
+                           fanout=True,
+                           version='3.12',
+                           timestamp='123',
+                           sequence=5)
+        can_send_version.assert_called_once_with('3.12')
+
+    @mock.patch('oslo_messaging.RPCClient.can_send_version', return_value=True)
+    def test_update_service_capabilities_delta(self, can_send_version):
+        delta = {'changed': {'free_capacity_gb': 5}, 'removed': []}
+        self._test_rpc_api('update_service_capabilities',
+                           rpc_method='cast',
+                           service_name='fake_name',
+                           host='fake_host',
+                           cluster_name='cluster_name',
+                           capabilities={'free_capacity_gb': 5},
+                           fanout=True,
+                           version='3.12',
+                           timestamp='123',
+                           sequence=5,
+                           delta=delta,
+                           expected_kwargs_diff={'capabilities': delta,
+                                                 'base_sequence': 4})
+        can_send_version.assert_called_once_with('3.12')
+
+    @mock.patch('oslo_messaging.RPCClient.can_send_version',
+                side_effect=lambda x: x == '3.3')
+    def test_update_service_capabilities_delta_capped(self, can_send_version):
+        self._test_rpc_api('update_service_capabilities',
+                           rpc_method='cast',
+                           service_name='fake_name',
+                           host='fake_host',
+                           cluster_name='cluster_name',
+                           capabilities={'free_capacity_gb': 5},
+                           fanout=True,
+                           version='3.3',
+                           timestamp='123',
+                           sequence=5,
+                           delta={'changed': {'free_capacity_gb': 5},
+                                  'removed': []})
+
     @ddt.data('3.0', '3.10')
     @mock.patch('oslo_messaging.RPCClient.can_send_version')
     def test_create_volume(self, version, can_send_version):
@@ -36,6 +36,7 @@ from cinder.tests.unit import fake_constants as fake
 from cinder.tests.unit import fake_volume
 from cinder.tests.unit.scheduler import fakes as fake_scheduler
 from cinder.tests.unit import utils as tests_utils
+from cinder import utils
 
 CONF = cfg.CONF
 
@@ -251,6 +252,67 @@ class SchedulerManagerTestCase(test.TestCase):
         _mock_update_cap.assert_called_once_with(service, host, capabilities,
                                                  None, None)
 
+    @mock.patch('cinder.volume.rpcapi.VolumeAPI.'
+                'publish_service_capabilities')
+    @mock.patch('cinder.scheduler.driver.Scheduler.'
+                'update_service_capabilities')
+    def test_update_service_capabilities_delta(self, _mock_update_cap,
+                                               publish_mock):
+        capabilities = {'volume_backend_name': 'backend',
+                        'pools': [{'pool_name': 'pool1',
+                                   'free_capacity_gb': 10},
+                                  {'pool_name': 'pool2',
+                                   'free_capacity_gb': 20}]}
+        new_capabilities = {'volume_backend_name': 'backend',
+                            'pools': [{'pool_name': 'pool1',
+                                       'free_capacity_gb': 5},
+                                      {'pool_name': 'pool3',
+                                       'free_capacity_gb': 30}]}
+        delta = utils.diff_capabilities(capabilities, new_capabilities)
+
+        self.manager.update_service_capabilities(
+            self.context, service_name='volume', host='host@backend',
+            capabilities=capabilities, sequence=1)
+        # The host manager modifies the pools it receives
+        _mock_update_cap.call_args[0][2]['pools'][0]['timestamp'] = 1
+        self.manager.update_service_capabilities(
+            self.context, service_name='volume', host='host@backend',
+            capabilities=delta, sequence=2, base_sequence=1)
+
+        _mock_update_cap.assert_called_with('volume', 'host@backend',
+                                            new_capabilities, None, None)
+        publish_mock.assert_not_called()
+
+    @mock.patch('cinder.volume.rpcapi.VolumeAPI.'
+                'publish_service_capabilities')
+    @mock.patch('cinder.scheduler.driver.Scheduler.'
+                'update_service_capabilities')
+    def test_update_service_capabilities_missed_report(self, _mock_update_cap,
+                                                       publish_mock):
+        delta = {'changed': {'fake_capability': 'fake_value'}, 'removed': []}
+        self.manager.update_service_capabilities(
+            self.context, service_name='volume', host='host@backend',
+            capabilities={}, sequence=1)
+        _mock_update_cap.reset_mock()
+
+        for sequence in (3, 4):
+            self.manager.update_service_capabilities(
+                self.context, service_name='volume', host='host@backend',
+                capabilities=delta, sequence=sequence,
+                base_sequence=sequence - 1)
+
+        _mock_update_cap.assert_not_called()
+        # We only request a full report once
+        publish_mock.assert_called_once_with(self.context,
+                                             host='host@backend')
+
+        self.manager.update_service_capabilities(
+            self.context, service_name='volume', host='host@backend',
+            capabilities={'fake_capability': 'fake_value'}, sequence=5)
+        _mock_update_cap.assert_called_once_with(
+            'volume', 'host@backend', {'fake_capability': 'fake_value'},
+            None, None)
+
     @mock.patch('cinder.scheduler.driver.Scheduler.'
                 'notify_service_capabilities')
     def test_notify_service_capabilities_no_timestamp(self, _mock_notify_cap):
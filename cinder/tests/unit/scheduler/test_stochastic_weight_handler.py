@@ -15,6 +15,7 @@ Tests for stochastic weight handler
 """
 
 import ddt
+import mock
 import random
 
 from cinder.scheduler import base_weight
@@ -61,3 +62,16 @@ class StochasticWeightHandlerTestCase(test.TestCase):
                                                     weight_map)
         winner = weighted_objs[0].obj
         self.assertEqual(expected_obj, winner)
+
+    def test_get_weighed_objects_trace(self):
+        class MapWeigher(base_weight.BaseWeigher):
+            def _weigh_object(self, obj, weight_map):
+                return weight_map[obj]
+
+        trace = mock.Mock()
+        handler = StochasticHostWeightHandler('fake_namespace')
+        handler.get_weighed_objects([MapWeigher], ['A', 'B'],
+                                    {'A': 1, 'B': 2}, trace=trace)
+
+        trace.record.assert_called_once_with('weigher', 'MapWeigher',
+                                             mock.ANY, 2, 2)
@@ -0,0 +1,104 @@
+# Copyright (c) 2026 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the scheduler tracing.
+"""
+
+import mock
+from oslo_serialization import jsonutils
+
+from cinder.scheduler import tracing
+from cinder import test
+
+
+class TracerTestCase(test.TestCase):
+    """Test case for Tracer class."""
+
+    def test_start_disabled(self):
+        tracer = tracing.Tracer()
+
+        self.assertIsNone(tracer.sink)
+        self.assertIsNone(tracer.start({}))
+
+    def test_start_metrics_sink(self):
+        self.flags(scheduler_metrics_sink='cinder.scheduler.tracing.'
+                                          'LogMetricsSink')
+        tracer = tracing.Tracer()
+
+        trace = tracer.start({'volume_id': 'fake_id'})
+
+        self.assertIsInstance(tracer.sink, tracing.LogMetricsSink)
+        self.assertIs(tracer.sink, trace.sink)
+        self.assertFalse(trace.log_decision)
+        self.assertEqual('fake_id', trace.volume_id)
+
+    @mock.patch('random.random', return_value=0.3)
+    def test_start_sampled(self, mock_random):
+        self.flags(scheduler_decision_log_sample_rate=0.5)
+        tracer = tracing.Tracer()
+
+        trace = tracer.start({})
+
+        self.assertIsNone(trace.sink)
+        self.assertTrue(trace.log_decision)
+
+        mock_random.return_value = 0.6
+        self.assertIsNone(tracer.start({}))
+
+
+class SchedulingTraceTestCase(test.TestCase):
+    """Test case for SchedulingTrace class."""
+
+    def test_metrics(self):
+        sink = mock.Mock(spec=tracing.MetricsSink)
+        trace = tracing.SchedulingTrace(sink, False)
+
+        trace.record('filter', 'CapacityFilter', 0.5, 4, 3)
+        trace.record('weigher', 'CapacityWeigher', 0.25, 3, 3)
+        trace.finish(None)
+
+        sink.observe.assert_has_calls(
+            [mock.call('scheduler.filter.CapacityFilter.time', 0.5),
+             mock.call('scheduler.weigher.CapacityWeigher.time', 0.25),
+             mock.call('scheduler.time', mock.ANY)])
+        self.assertEqual(
+            [mock.call('scheduler.filter.CapacityFilter.removed', 1),
+             mock.call('scheduler.requests'),
+             mock.call('scheduler.no_valid_backend')],
+            sink.increment.call_args_list)
+
+    @mock.patch.object(tracing.DECISION_LOG, 'info')
+    def test_log_decision(self, mock_info):
+        trace = tracing.SchedulingTrace(None, True, 'fake_id')
+
+        trace.record('filter', 'CapacityFilter', 0.5, 2, 1)
+        trace.weights = [('host1@lvm#pool1', 1.0)]
+        trace.finish('host1@lvm#pool1')
+
+        decision = jsonutils.loads(mock_info.call_args[0][0])
+        self.assertEqual('fake_id', decision['volume_id'])
+        self.assertEqual('host1@lvm#pool1', decision['backend'])
+        self.assertEqual([{'kind': 'filter', 'name': 'CapacityFilter',
+                           'elapsed': 0.5, 'start': 2, 'end': 1}],
+                         decision['steps'])
+        self.assertEqual([['host1@lvm#pool1', 1.0]], decision['weights'])
+
+    @mock.patch.object(tracing.DECISION_LOG, 'info')
+    def test_not_sampled(self, mock_info):
+        trace = tracing.SchedulingTrace(None, False)
+
+        trace.finish('host1@lvm#pool1')
+
+        mock_info.assert_not_called()
@@ -17,6 +17,7 @@ Tests For Volume Number Weigher.
 """
 
 import mock
+from oslo_utils import timeutils
 
 from cinder.common import constants
 from cinder import context
@@ -28,20 +29,12 @@ from cinder.tests.unit.scheduler import fakes
 from cinder.volume import utils
 
 
-def fake_volume_data_get_for_host(context, host, count_only=False):
-    host = utils.extract_host(host)
-    if host == 'host1':
-        return 1
-    elif host == 'host2':
-        return 2
-    elif host == 'host3':
-        return 3
-    elif host == 'host4':
-        return 4
-    elif host == 'host5':
-        return 5
-    else:
-        return 6
+def fake_volume_count_get_all_by_host(context):
+    return {'host1#lvm1': 1, 'host2#lvm2': 2, 'host3#lvm3': 3,
+            'host4#lvm4': 4, 'host5#_pool0': 5, 'host6#lvm6': 6,
+            # Volumes that aren't in a pool don't count for the pools
+            'host1': 5,
+            None: 1}
 
 
 class VolumeNumberWeigherTestCase(test.TestCase):
@@ -91,8 +84,8 @@ class VolumeNumberWeigherTestCase(test.TestCase):
         # host4: 4 volumes
         # host5: 5 volumes   Norm=-1.0
         # so, host1 should win:
-        with mock.patch.object(api, 'volume_data_get_for_host',
-                               fake_volume_data_get_for_host):
+        with mock.patch.object(api, 'volume_count_get_all_by_host',
+                               fake_volume_count_get_all_by_host):
             weighed_host = self._get_weighed_host(backend_info_list)
             self.assertEqual(0.0, weighed_host.weight)
             self.assertEqual('host1',
@@ -108,9 +101,63 @@ class VolumeNumberWeigherTestCase(test.TestCase):
         # host4: 4 volumes
         # host5: 5 volumes     Norm=1
         # so, host5 should win:
-        with mock.patch.object(api, 'volume_data_get_for_host',
-                               fake_volume_data_get_for_host):
+        with mock.patch.object(api, 'volume_count_get_all_by_host',
+                               fake_volume_count_get_all_by_host):
             weighed_host = self._get_weighed_host(backend_info_list)
             self.assertEqual(1.0, weighed_host.weight)
             self.assertEqual('host5',
                              utils.extract_host(weighed_host.obj.host))
+
+    def test_volume_number_counts(self):
+        self.flags(volume_number_multiplier=1.0)
+        backend_info_list = sorted(self._get_all_backends(),
+                                   key=lambda backend: backend.host)
+        get_counts = self.mock_object(
+            api, 'volume_count_get_all_by_host',
+            side_effect=fake_volume_count_get_all_by_host)
+
+        weighed_host = self._get_weighed_host(backend_info_list)
+        self.assertEqual('host5', utils.extract_host(weighed_host.obj.host))
+        self.assertEqual(5, weighed_host.obj.volume_count)
+        get_counts.assert_called_once_with(mock.ANY)
+
+        # The counts are kept in the host states and adjusted for the
+        # volumes placed by the scheduler.
+        for __ in range(5):
+            backend_info_list[0].consume_from_volume({'size': 1})
+        backend_info_list[1].consume_from_volume({'size': -1})
+        weighed_host = self._get_weighed_host(backend_info_list)
+        self.assertEqual('host1', utils.extract_host(weighed_host.obj.host))
+        self.assertEqual(1, get_counts.call_count)
+        self.assertEqual([6, 1, 3, 4, 5],
+                         [backend.volume_count
+                          for backend in backend_info_list])
+
+    def test_volume_number_counts_expired(self):
+        backend_info_list = sorted(self._get_all_backends(),
+                                   key=lambda backend: backend.host)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        get_counts = self.mock_object(
+            api, 'volume_count_get_all_by_host',
+            side_effect=fake_volume_count_get_all_by_host)
+
+        self._get_weighed_host(backend_info_list)
+        backend_info_list[0].consume_from_volume({'size': 1})
+        timeutils.advance_time_seconds(61)
+        self._get_weighed_host(backend_info_list)
+
+        self.assertEqual(2, get_counts.call_count)
+        self.assertEqual(1, backend_info_list[0].volume_count)
+
+    def test_volume_number_counts_no_refresh_interval(self):
+        self.flags(volume_number_refresh_interval=0)
+        backend_info_list = list(self._get_all_backends())
+        get_counts = self.mock_object(
+            api, 'volume_count_get_all_by_host',
+            side_effect=fake_volume_count_get_all_by_host)
+
+        self._get_weighed_host(backend_info_list)
+        self._get_weighed_host(backend_info_list)
+
+        self.assertEqual(2, get_counts.call_count)
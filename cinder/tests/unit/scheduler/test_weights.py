@@ -52,3 +52,46 @@ class TestWeightHandler(test.TestCase):
         for seq, result, minval, maxval in map_:
             ret = base_weight.normalize(seq, minval=minval, maxval=maxval)
             self.assertEqual(result, tuple(ret))
+
+    def test_weigh_objects_limits(self):
+        class FakeWeigher(base_weight.BaseWeigher):
+            minval = 0
+            maxval = 10
+
+            def _weigh_object(self, obj, weight_properties):
+                return obj
+
+        weigher = FakeWeigher()
+        weighed_objs = [base_weight.WeighedObject(obj, 0.0)
+                        for obj in (2, 5, 20)]
+
+        self.assertEqual([2, 5, 20],
+                         weigher.weigh_objects(weighed_objs, {}))
+        # The limits set by the weigher are only extended
+        self.assertEqual(0, weigher.minval)
+        self.assertEqual(20, weigher.maxval)
+
+    def test_get_weighed_objects_limit(self):
+        class FakeWeigher(base_weight.BaseWeigher):
+            def _weigh_object(self, obj, weight_properties):
+                return weight_properties[obj]
+
+        class FakeWeigher2(FakeWeigher):
+            def weight_multiplier(self):
+                return 2.0
+
+        handler = base_weight.BaseWeightHandler(base_weight.BaseWeigher,
+                                                'fake_namespace')
+        weight_properties = {'a': 1, 'b': 3, 'c': 2, 'd': 3}
+        objs = sorted(weight_properties)
+
+        result = handler.get_weighed_objects([FakeWeigher, FakeWeigher2],
+                                             objs, weight_properties)
+        self.assertEqual([('b', 3.0), ('d', 3.0), ('c', 1.5), ('a', 0.0)],
+                         [(obj.obj, obj.weight) for obj in result])
+
+        result = handler.get_weighed_objects([FakeWeigher, FakeWeigher2],
+                                             objs, weight_properties,
+                                             limit=2)
+        self.assertEqual([('b', 3.0), ('d', 3.0)],
+                         [(obj.obj, obj.weight) for obj in result])
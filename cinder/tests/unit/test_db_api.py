@@ -618,6 +618,18 @@ class DBAPIVolumeTestCase(BaseTest):
                              db.volume_data_get_for_host(
                                  self.ctxt, 'h%d@lvmdriver-1' % i))
 
+    def test_volume_count_get_all_by_host(self):
+        for i in range(THREE):
+            for j in range(i + 1):
+                db.volume_create(self.ctxt, {'host': 'h%d@lvm#pool' % i,
+                                             'size': ONE_HUNDREDS})
+        volume = db.volume_create(self.ctxt, {'host': 'h0@lvm#pool'})
+        db.volume_destroy(self.ctxt, volume.id)
+
+        self.assertEqual({'h0@lvm#pool': 1, 'h1@lvm#pool': 2,
+                          'h2@lvm#pool': 3},
+                         db.volume_count_get_all_by_host(self.ctxt))
+
     def test_volume_data_get_for_project(self):
         for i in range(THREE):
             for j in range(THREE):
@@ -2599,6 +2611,61 @@ class DBAPIQuotaTestCase(BaseTest):
                           'volumes': {'reserved': 1, 'in_use': 0}},
                          quota_usage)
 
+    def test_quota_reserve_refresh(self):
+        for volume_type_id, size in ((fake.VOLUME_TYPE_ID, 1),
+                                     (fake.VOLUME_TYPE_ID, 2),
+                                     (fake.VOLUME_TYPE2_ID, 4)):
+            volume = db.volume_create(self.ctxt,
+                                      {'project_id': 'project1',
+                                       'volume_type_id': volume_type_id,
+                                       'size': size})
+            db.snapshot_create(self.ctxt, {'project_id': 'project1',
+                                           'volume_id': volume.id,
+                                           'volume_size': size})
+        db.volume_create(self.ctxt, {'project_id': 'project2', 'size': 8})
+        volume_type = {'id': fake.VOLUME_TYPE_ID, 'name': 'type1'}
+        resources = {
+            'volumes': quota.ReservableResource('volumes', '_sync_volumes'),
+            'gigabytes': quota.ReservableResource('gigabytes',
+                                                  '_sync_gigabytes'),
+            'snapshots': quota.ReservableResource('snapshots',
+                                                  '_sync_snapshots'),
+            'volumes_type1': quota.VolumeTypeResource('volumes',
+                                                      volume_type),
+            'gigabytes_type1': quota.VolumeTypeResource('gigabytes',
+                                                        volume_type),
+        }
+        quotas = {resource: -1 for resource in resources}
+        deltas = {resource: 1 for resource in resources}
+
+        with mock.patch.object(
+                sqlalchemy_api, '_volume_data_get_by_type',
+                side_effect=sqlalchemy_api._volume_data_get_by_type
+        ) as volume_data, mock.patch.object(
+                sqlalchemy_api, '_snapshot_data_get_by_type',
+                side_effect=sqlalchemy_api._snapshot_data_get_by_type
+        ) as snapshot_data:
+            reservations = db.quota_reserve(
+                self.ctxt, resources, quotas, deltas,
+                datetime.datetime.utcnow(), 0, 0, 'project1')
+
+        # The data of the project is only queried once for all the resources
+        volume_data.assert_called_once_with(mock.ANY, 'project1', mock.ANY)
+        snapshot_data.assert_called_once_with(mock.ANY, 'project1', mock.ANY)
+        self.assertEqual(5, len(reservations))
+        quota_usage = db.quota_usage_get_all_by_project(self.ctxt, 'project1')
+        self.assertEqual({'project_id': 'project1',
+                          'volumes': {'reserved': 1, 'in_use': 3},
+                          'gigabytes': {'reserved': 1, 'in_use': 14},
+                          'snapshots': {'reserved': 1, 'in_use': 3},
+                          'volumes_type1': {'reserved': 1, 'in_use': 2},
+                          'gigabytes_type1': {'reserved': 1, 'in_use': 6}},
+                         quota_usage)
+        self.assertEqual(
+            set(reservations),
+            {reservation.uuid for reservation in
+             sqlalchemy_api.model_query(self.ctxt, models.Reservation)})
+
     def test__get_quota_usages(self):
         _quota_reserve(self.ctxt, 'project1')
         session = sqlalchemy_api.get_session()
@@ -13,6 +13,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+
+import mock
+
 from cinder import exception
 from cinder.scheduler.evaluator import evaluator
 from cinder import test
@@ -137,3 +141,25 @@ class EvaluatorTestCase(test.TestCase):
         self.assertRaises(exception.EvaluatorParseException,
                           evaluator.evaluate,
                           "7 / 0")
+
+    @mock.patch.object(evaluator, '_expressions', collections.OrderedDict())
+    def test_parsed_expression_reused(self):
+        expression = "stats.free_capacity_gb > 10 ? 100 : 50"
+        parser = mock.Mock(wraps=evaluator._def_parser())
+        with mock.patch.object(evaluator, '_parser', parser):
+            self.assertEqual(
+                100, evaluator.evaluate(expression,
+                                        stats={'free_capacity_gb': 20}))
+            self.assertEqual(
+                50, evaluator.evaluate(expression,
+                                       stats={'free_capacity_gb': 5}))
+        parser.parseString.assert_called_once_with(expression, parseAll=True)
+
+    @mock.patch.object(evaluator, '_expressions', collections.OrderedDict())
+    @mock.patch.object(evaluator, '_EXPRESSIONS_CACHE_SIZE', 2)
+    def test_parsed_expressions_evicted(self):
+        evaluator.evaluate("1+1")
+        evaluator.evaluate("1+2")
+        evaluator.evaluate("1+1")
+        evaluator.evaluate("1+3")
+        self.assertEqual(['1+1', '1+3'], list(evaluator._expressions))
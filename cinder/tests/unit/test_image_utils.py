@@ -15,7 +15,9 @@
 """Unit tests for image utils."""
 
 import errno
+import hashlib
 import math
+import tempfile
 
 import cryptography
 import ddt
@@ -422,6 +424,90 @@ class BadVerifier(object):
         )
 
 
+@mock.patch('cinder.utils.temporary_chown')
+class TestStreamToVolume(test.TestCase):
+    def setUp(self):
+        super(TestStreamToVolume, self).setUp()
+        self.ctxt = mock.Mock(user_id=mock.sentinel.user_id)
+        self.image_data = b'a' * 1000 + b'b' * 1000
+        self.image_meta = {
+            'size': len(self.image_data),
+            'disk_format': 'raw',
+            'container_format': 'bare',
+            'checksum': hashlib.md5(self.image_data).hexdigest(),
+            'properties': {}}
+        self.image_service = mock.Mock(temp_images=None)
+        self.image_service.download.return_value = iter(
+            [self.image_data[:600], self.image_data[600:]])
+        self.dest = tempfile.NamedTemporaryFile()
+        self.dest.write(b'x' * 4096)
+        self.dest.flush()
+        self.addCleanup(self.dest.close)
+
+    def _stream(self):
+        return image_utils.stream_to_volume(self.ctxt, self.image_service,
+                                            'fake_id', self.image_meta,
+                                            self.dest.name)
+
+    def _pop_verified(self):
+        tmp_images = image_utils.TemporaryImages.for_image_service(
+            self.image_service)
+        return tmp_images.pop_verified(self.ctxt, 'fake_id')
+
+    def test_stream_to_volume(self, mock_chown):
+        self.assertTrue(self._stream())
+
+        self.image_service.download.assert_called_once_with(self.ctxt,
+                                                            'fake_id')
+        self.dest.seek(0)
+        self.assertEqual(self.image_data + b'x' * 2096, self.dest.read())
+        self.assertFalse(self._pop_verified())
+
+    def test_stream_to_volume_not_raw(self, mock_chown):
+        self.image_service.download.return_value = iter(
+            [b'QFI\xfb' + b'\x00' * 1000])
+
+        self.assertFalse(self._stream())
+
+        self.dest.seek(0)
+        self.assertEqual(b'x' * 4096, self.dest.read())
+
+    def test_stream_to_volume_bad_checksum(self, mock_chown):
+        self.image_meta['checksum'] = hashlib.md5(b'other').hexdigest()
+
+        self.assertRaises(exception.ImageDownloadFailed, self._stream)
+
+    @mock.patch('cursive.signature_utils.get_verifier')
+    def test_stream_to_volume_signature(self, mock_get, mock_chown):
+        self.image_meta['properties'] = {
+            'img_signature_certificate_uuid': 'fake_uuid',
+            'img_signature_hash_method': 'SHA-256',
+            'img_signature': 'signature',
+            'img_signature_key_type': 'RSA-PSS'}
+        verifier = mock_get.return_value
+
+        self.assertTrue(self._stream())
+
+        verifier.update.assert_has_calls([mock.call(self.image_data[:600]),
+                                          mock.call(self.image_data[600:])])
+        verifier.verify.assert_called_once_with()
+        self.assertTrue(self._pop_verified())
+        # Results are only returned once.
+        self.assertIsNone(self._pop_verified())
+
+    @mock.patch('cursive.signature_utils.get_verifier',
+                return_value=BadVerifier())
+    def test_stream_to_volume_bad_signature(self, mock_get, mock_chown):
+        self.image_meta['properties'] = {
+            'img_signature_certificate_uuid': 'fake_uuid',
+            'img_signature_hash_method': 'SHA-256',
+            'img_signature': 'signature',
+            'img_signature_key_type': 'RSA-PSS'}
+
+        self.assertRaises(exception.ImageSignatureVerificationException,
+                          self._stream)
+
+
 class TestVerifyImageSignature(test.TestCase):
 
     @mock.patch('cursive.signature_utils.get_verifier')
@@ -1613,6 +1699,85 @@ class TestFetchToVolumeFormat(test.TestCase):
             image_utils.get_qemu_data, image_id, has_meta, disk_format_raw,
             dest, run_as_root=run_as_root)
 
+    @mock.patch('cinder.image.image_utils.check_available_space')
+    @mock.patch('cinder.image.image_utils.convert_image')
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.stream_to_volume',
+                return_value=True)
+    def test_stream_raw_image(self, mock_stream, mock_fetch, mock_convert,
+                              mock_check_space):
+        self.override_config('image_stream_to_volume', True)
+        ctxt = mock.sentinel.context
+        ctxt.user_id = mock.sentinel.user_id
+        image_service = FakeImageService()
+        image_id = mock.sentinel.image_id
+        dest = mock.sentinel.dest
+
+        image_utils.fetch_to_volume_format(ctxt, image_service, image_id,
+                                           dest, 'raw', mock.sentinel.bs,
+                                           size=2)
+
+        mock_stream.assert_called_once_with(
+            ctxt, image_service, image_id,
+            image_service.show(ctxt, image_id), dest)
+        mock_fetch.assert_not_called()
+        mock_convert.assert_not_called()
+        mock_check_space.assert_not_called()
+
+    @mock.patch('cinder.image.image_utils.stream_to_volume')
+    def test_stream_raw_image_too_big(self, mock_stream):
+        self.override_config('image_stream_to_volume', True)
+        ctxt = mock.sentinel.context
+        ctxt.user_id = mock.sentinel.user_id
+
+        self.assertRaises(exception.ImageUnacceptable,
+                          image_utils.fetch_to_volume_format,
+                          ctxt, FakeImageService(), mock.sentinel.image_id,
+                          mock.sentinel.dest, 'raw', mock.sentinel.bs,
+                          size=1)
+        mock_stream.assert_not_called()
+
+    @mock.patch('cinder.image.image_utils.check_available_space')
+    @mock.patch('cinder.image.image_utils.verify_glance_image_signature')
+    @mock.patch('cinder.image.image_utils.convert_image')
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    @mock.patch('cinder.image.image_utils.temporary_file')
+    @mock.patch('cinder.image.image_utils.stream_to_volume',
+                return_value=False)
+    def test_stream_raw_image_fallback(self, mock_stream, mock_temp,
+                                       mock_info, mock_fetch, mock_convert,
+                                       mock_verify, mock_check_space):
+        self.override_config('image_stream_to_volume', True)
+        ctxt = mock.sentinel.context
+        ctxt.user_id = mock.sentinel.user_id
+        image_service = FakeImageService()
+        image_id = mock.sentinel.image_id
+        dest = mock.sentinel.dest
+        data = mock_info.return_value
+        data.file_format = 'raw'
+        data.backing_file = None
+        data.virtual_size = units.Gi
+        tmp = mock_temp.return_value.__enter__.return_value
+
+        image_utils.fetch_to_volume_format(ctxt, image_service, image_id,
+                                           dest, 'raw', mock.sentinel.bs)
+
+        # The image falls back to a temporary file, that needs space
+        mock_check_space.assert_called_once_with(
+            mock.ANY, image_service.show(ctxt, image_id)['size'], image_id)
+        mock_fetch.assert_called_once_with(ctxt, image_service, image_id,
+                                           tmp, None, None)
+        mock_verify.assert_called_once_with(ctxt, image_service, image_id,
+                                            tmp)
+        self.assertEqual(mock_verify.return_value,
+                         image_service.temp_images.pop_verified(ctxt,
+                                                                image_id))
+        mock_convert.assert_called_once_with(tmp, dest, 'raw',
+                                             out_subformat=None,
+                                             run_as_root=True,
+                                             src_format='raw')
+
 
 class TestXenserverUtils(test.TestCase):
     def test_is_xenserver_format(self):
@@ -55,3 +55,59 @@ class TestManager(test.TestCase):
 
         self.assertEqual(set(six.text_type(r) for r in result.objects),
                          set(six.text_type(e) for e in expected))
+
+
+class TestSchedulerDependentManager(test.TestCase):
+    def setUp(self):
+        super(TestSchedulerDependentManager, self).setUp()
+        self.manager = manager.SchedulerDependentManager(
+            host='host@backend', service_name='volume', cluster='cluster')
+        self.manager.scheduler_rpcapi = mock.Mock()
+        self.update_mock = (
+            self.manager.scheduler_rpcapi.update_service_capabilities)
+        self.capabilities = {'volume_backend_name': 'backend',
+                             'pools': [{'pool_name': 'pool1',
+                                        'free_capacity_gb': 10}]}
+
+    def _publish(self, free_capacity_gb, full_report=False):
+        self.capabilities['pools'][0]['free_capacity_gb'] = free_capacity_gb
+        self.manager.update_service_capabilities(self.capabilities)
+        self.manager._publish_service_capabilities(mock.sentinel.context,
+                                                   full_report=full_report)
+        return self.update_mock.call_args
+
+    def test_publish_service_capabilities_full_reports(self):
+        self._publish(10)
+        self._publish(5)
+
+        self.update_mock.assert_called_with(
+            mock.sentinel.context, 'volume', 'host@backend',
+            self.capabilities, 'cluster')
+        self.assertEqual(2, self.update_mock.call_count)
+
+    def test_publish_service_capabilities_delta_reports(self):
+        self.override_config('capabilities_delta_reports', 1)
+
+        self.assertIsNone(self._publish(10)[1]['delta'])
+        call = self._publish(5)
+        self.assertEqual(2, call[1]['sequence'])
+        self.assertEqual(
+            {'changed': {}, 'removed': [],
+             'pools': {'added': [], 'removed': [],
+                       'changed': {'pool1': {'changed': {
+                           'free_capacity_gb': 5}, 'removed': []}}}},
+            call[1]['delta'])
+
+        # After capabilities_delta_reports deltas we send a full report
+        call = self._publish(1)
+        self.assertEqual(3, call[1]['sequence'])
+        self.assertIsNone(call[1]['delta'])
+        self.assertEqual(self.capabilities, call[0][3])
+
+    def test_publish_service_capabilities_full_report_requested(self):
+        self.override_config('capabilities_delta_reports', 10)
+
+        self._publish(10)
+        call = self._publish(5, full_report=True)
+        self.assertEqual(2, call[1]['sequence'])
+        self.assertIsNone(call[1]['delta'])
@@ -1689,6 +1689,9 @@ class FakeSession(object):
     def query(self, *args, **kwargs):
         pass
 
+    def bulk_save_objects(self, objects):
+        pass
+
 
 class FakeUsage(sqa_models.QuotaUsage):
     def save(self, *args, **kwargs):
@@ -1707,7 +1710,8 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
 
         def make_sync(res_name):
             def fake_sync(context, project_id, volume_type_id=None,
-                          volume_type_name=None, session=None):
+                          volume_type_name=None, session=None,
+                          project_usages=None):
                 self.sync_called.add(res_name)
                 if res_name in self.usages:
                     if self.usages[res_name].in_use < 0:
@@ -1751,7 +1755,7 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
 
         def fake_reservation_create(context, uuid, usage_id, project_id,
                                     resource, delta, expire, session=None,
-                                    allocated_id=None):
+                                    allocated_id=None, save=True):
             reservation_ref = self._make_reservation(
                 uuid, usage_id, project_id, resource, delta, expire,
                 timeutils.utcnow(), timeutils.utcnow(), allocated_id)
@@ -13,6 +13,7 @@
 #    under the License.
 
 
+import copy
 import datetime
 import functools
 import json
@@ -1670,3 +1671,48 @@ class TestAutoMaxOversubscriptionRatio(test.TestCase):
         if result is not None:
             result = round(result, 2)
         self.assertEqual(expected_result, result)
+
+
+@ddt.ddt
+class TestCapabilitiesDelta(test.TestCase):
+    OLD = {'volume_backend_name': 'backend',
+           'driver_version': '1.0',
+           'pools': [{'pool_name': 'pool1', 'free_capacity_gb': 10,
+                      'QoS_support': True},
+                     {'pool_name': 'pool2', 'free_capacity_gb': 20}]}
+
+    @ddt.data(OLD,
+              {'volume_backend_name': 'backend',
+               'driver_version': '1.1',
+               'pools': [{'pool_name': 'pool1', 'free_capacity_gb': 5},
+                         {'pool_name': 'pool3', 'free_capacity_gb': 30}]},
+              {'volume_backend_name': 'backend',
+               'free_capacity_gb': 10},
+              {'volume_backend_name': 'backend',
+               'pools': [{'pool_name': 'pool1'}, {'pool_name': 'pool1'}]})
+    def test_apply_diff(self, new):
+        old = copy.deepcopy(self.OLD)
+
+        delta = utils.diff_capabilities(old, new)
+        result = utils.apply_capabilities_delta(old, delta)
+
+        self.assertEqual(new, result)
+        # The original capabilities are not modified
+        self.assertEqual(self.OLD, old)
+
+    def test_diff_only_changes(self):
+        new = copy.deepcopy(self.OLD)
+        new['pools'][1]['free_capacity_gb'] = 15
+        del new['pools'][0]['QoS_support']
+
+        delta = utils.diff_capabilities(self.OLD, new)
+
+        self.assertEqual(
+            {'changed': {}, 'removed': [],
+             'pools': {'added': [], 'removed': [],
+                       'changed': {
+                           'pool1': {'changed': {},
+                                     'removed': ['QoS_support']},
+                           'pool2': {'changed': {'free_capacity_gb': 15},
+                                     'removed': []}}}},
+            delta)
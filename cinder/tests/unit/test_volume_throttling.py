@@ -16,6 +16,7 @@
 """Tests for volume copy throttling helpers."""
 
 import mock
+from oslo_utils import units
 
 from cinder import test
 from cinder import utils
@@ -61,3 +62,26 @@ class ThrottleTestCase(test.TestCase):
             # a nested job ends; bps limit is resumed
             mock.call('fake_group', 'read', '253:0', 1024),
             mock.call('fake_group', 'write', '253:1', 1024)])
+
+    @mock.patch('eventlet.sleep')
+    @mock.patch('time.time')
+    def test_consume(self, mock_time, mock_sleep):
+        mock_time.return_value = 100.0
+        throttle = throttling.Throttle()
+        throttle.bps_limit = 1024
+        throttle.consume(512)
+        mock_sleep.assert_not_called()
+
+        throttle.consume(1024)
+        mock_sleep.assert_called_once_with(0.5)
+
+        # Tokens are refilled with time, up to the bucket size.
+        mock_sleep.reset_mock()
+        mock_time.return_value = 110.0
+        throttle.consume(1024)
+        mock_sleep.assert_not_called()
+
+    @mock.patch('eventlet.sleep')
+    def test_consume_no_limit(self, mock_sleep):
+        throttling.Throttle().consume(units.Gi)
+        mock_sleep.assert_not_called()
@@ -17,9 +17,12 @@
 
 
 import datetime
+import errno
 import io
 import mock
+import os
 import six
+import tempfile
 
 from castellan import key_manager
 import ddt
@@ -530,7 +533,8 @@ class ClearVolumeTestCase(test.TestCase):
         mock_copy.assert_called_once_with('/dev/zero', 'volume_path', 1024,
                                           '1M', sync=True,
                                           execute=utils.execute, ionice='-c3',
-                                          throttle=None, sparse=False)
+                                          throttle=None, sparse=False,
+                                          copy_method=None)
 
     @mock.patch('cinder.volume.utils.copy_volume', return_value=None)
     @mock.patch('cinder.volume.utils.CONF')
@@ -545,7 +549,8 @@ class ClearVolumeTestCase(test.TestCase):
         mock_copy.assert_called_once_with('/dev/zero', 'volume_path', 1,
                                           '1M', sync=True,
                                           execute=utils.execute, ionice='-c0',
-                                          throttle=None, sparse=False)
+                                          throttle=None, sparse=False,
+                                          copy_method=None)
 
     @mock.patch('cinder.volume.utils.CONF')
     def test_clear_volume_invalid_opt(self, mock_conf):
@@ -674,13 +679,101 @@ class CopyVolumeTestCase(test.TestCase):
                                           'oflag=direct', 'conv=sparse',
                                           run_as_root=True)
 
+    @mock.patch('cinder.volume.utils.check_for_odirect_support',
+                return_value=True)
+    @mock.patch('cinder.utils.execute')
+    def test_copy_volume_dd_range(self, mock_exec, mock_support):
+        volume_utils._copy_volume_with_path([], '/dev/src', '/dev/dest', 2,
+                                            '1M', execute=utils.execute,
+                                            offset_m=3)
+        mock_exec.assert_called_once_with(
+            'dd', 'if=/dev/src', 'of=/dev/dest', 'count=%s' % (2 * units.Mi),
+            'bs=1M', 'skip=%s' % (3 * units.Mi), 'seek=%s' % (3 * units.Mi),
+            'iflag=count_bytes,skip_bytes,direct', 'oflag=seek_bytes,direct',
+            'conv=notrunc', run_as_root=True)
+
+    @mock.patch('cinder.volume.utils._copy_volume_with_path')
+    def test_copy_volume_streams(self, mock_copy):
+        volume_utils.copy_volume('/dev/src', '/dev/dest', 10, '1M',
+                                 streams=3)
+        self.assertEqual(3, mock_copy.call_count)
+        ranges = sorted((c[1]['offset_m'], c[0][3])
+                        for c in mock_copy.call_args_list)
+        self.assertEqual([(0, 4), (4, 4), (8, 2)], ranges)
+
+    @mock.patch('cinder.volume.utils._copy_volume_with_path')
+    def test_copy_volume_streams_failure(self, mock_copy):
+        mock_copy.side_effect = [None, processutils.ProcessExecutionError,
+                                 None]
+        self.assertRaises(processutils.ProcessExecutionError,
+                          volume_utils.copy_volume, '/dev/src', '/dev/dest',
+                          3, '1M', streams=3)
+        # The other copies are not interrupted.
+        self.assertEqual(3, mock_copy.call_count)
+
+    @mock.patch('cinder.volume.utils._copy_volume_with_file')
+    def test_copy_volume_streams_handles(self, mock_copy):
+        handle = io.RawIOBase()
+        volume_utils.copy_volume('/dev/src', handle, 10, '1M', streams=3)
+        mock_copy.assert_called_once_with(
+            '/dev/src', handle, 10, sparse=False, throttle=mock.ANY,
+            sync=False, progress=None, offset_m=None, hashes=None,
+            previous_hashes=None)
+
+    @mock.patch('cinder.utils.temporary_chown')
+    def test_copy_volume_native_streams(self, mock_chown):
+        self.override_config('volume_copy_method', 'native')
+        data = os.urandom(3 * units.Mi)
+        with tempfile.NamedTemporaryFile() as src, \
+                tempfile.NamedTemporaryFile() as dest:
+            src.write(data)
+            src.flush()
+            volume_utils.copy_volume(src.name, dest.name, 3, '1M', streams=2)
+            self.assertEqual(data, dest.read())
+
+    @mock.patch('cinder.volume.utils._copy_volume_with_file')
+    def test_copy_volume_native(self, mock_copy):
+        progress = mock.sentinel.progress
+        output = volume_utils.copy_volume('/dev/zero', '/dev/null', 1024, '3M',
+                                          sync=True, sparse=True,
+                                          progress=progress,
+                                          copy_method='native')
+        self.assertIsNone(output)
+        mock_copy.assert_called_once_with('/dev/zero', '/dev/null', 1024,
+                                          sparse=True, throttle=mock.ANY,
+                                          sync=True, progress=progress,
+                                          offset_m=None, hashes=None,
+                                          previous_hashes=None)
+
+    @mock.patch('os.fsync')
+    @mock.patch('cinder.utils.temporary_chown')
+    def test_copy_volume_with_file_paths(self, mock_chown, mock_fsync):
+        with tempfile.NamedTemporaryFile() as src, \
+                tempfile.NamedTemporaryFile() as dest:
+            src.write(b'a' * units.Mi)
+            src.flush()
+            volume_utils._copy_volume_with_file(src.name, dest.name, 1,
+                                                sync=True)
+            self.assertEqual(b'a' * units.Mi, dest.read())
+        mock_fsync.assert_called_once_with(mock.ANY)
+
+    @mock.patch('os.open', side_effect=OSError(errno.EINVAL, 'Invalid'))
+    def test_open_direct_not_supported(self, mock_open):
+        self.assertIsNone(volume_utils._open_direct('/dev/zero', 'rb'))
+        mock_open.assert_called_once_with('/dev/zero',
+                                          os.O_DIRECT | os.O_RDONLY)
+
     @mock.patch('cinder.volume.utils._copy_volume_with_file')
     def test_copy_volume_handles(self, mock_copy):
         handle1 = io.RawIOBase()
         handle2 = io.RawIOBase()
         output = volume_utils.copy_volume(handle1, handle2, 1024, 1)
         self.assertIsNone(output)
-        mock_copy.assert_called_once_with(handle1, handle2, 1024)
+        mock_copy.assert_called_once_with(handle1, handle2, 1024,
+                                          sparse=False, throttle=mock.ANY,
+                                          sync=False, progress=None,
+                                          offset_m=None, hashes=None,
+                                          previous_hashes=None)
 
     @mock.patch('cinder.volume.utils._transfer_data')
     @mock.patch('cinder.volume.utils._open_volume_with_path')
@@ -689,7 +782,163 @@ class CopyVolumeTestCase(test.TestCase):
         output = volume_utils.copy_volume('/foo/bar', handle, 1024, 1)
         self.assertIsNone(output)
         mock_transfer.assert_called_once_with(mock.ANY, mock.ANY,
-                                              1073741824, mock.ANY)
+                                              1073741824, mock.ANY,
+                                              sparse=False, throttle=mock.ANY,
+                                              read_ahead=2, progress=None,
+                                              hashes=None,
+                                              previous_hashes=None)
+
+    def _transfer(self, src_data, sparse):
+        src = io.BytesIO(src_data)
+        dest = io.BytesIO(b'x' * len(src_data))
+        dest.write = mock.Mock(wraps=dest.write)
+        volume_utils._transfer_data(src, dest, len(src_data), 4,
+                                    sparse=sparse)
+        return dest
+
+    def test_transfer_data_sparse(self):
+        dest = self._transfer(b'abcd\0\0\0\0efgh', sparse=True)
+        self.assertEqual(b'abcdxxxxefgh', dest.getvalue())
+        self.assertEqual(2, dest.write.call_count)
+
+    def test_transfer_data_sparse_tail(self):
+        dest = self._transfer(b'abcd\0\0\0\0\0\0', sparse=True)
+        self.assertEqual(b'abcdxxxx\0\0', dest.getvalue())
+        dest.write.assert_called_with(b'\0\0')
+
+    def test_transfer_data_sparse_no_seekable(self):
+        # Like python 2 file objects
+        dest = mock.Mock(spec=['write', 'seek', 'flush'])
+        dest.write.return_value = None
+        volume_utils._transfer_data(io.BytesIO(b'\0' * 8), dest, 8, 4,
+                                    sparse=True)
+        dest.seek.assert_has_calls([mock.call(4, os.SEEK_CUR),
+                                    mock.call(4, os.SEEK_CUR),
+                                    mock.call(-4, os.SEEK_CUR)])
+        dest.write.assert_called_once_with(b'\0' * 4)
+
+    def test_transfer_data_not_sparse(self):
+        dest = self._transfer(b'abcd\0\0\0\0efgh', sparse=False)
+        self.assertEqual(b'abcd\0\0\0\0efgh', dest.getvalue())
+        self.assertEqual(3, dest.write.call_count)
+
+    def test_transfer_data_read_only_handle(self):
+        class ReadOnlyIO(io.RawIOBase):
+            def __init__(self, data):
+                self.data = io.BytesIO(data)
+
+            def read(self, size=-1):
+                return self.data.read(size)
+
+        throttle = mock.Mock()
+        dest = io.BytesIO()
+        volume_utils._transfer_data(ReadOnlyIO(b'abcdefghij'), dest, 10, 4,
+                                    throttle=throttle, read_ahead=3)
+        self.assertEqual(b'abcdefghij', dest.getvalue())
+        throttle.consume.assert_has_calls([mock.call(4), mock.call(4),
+                                           mock.call(2)])
+
+    @mock.patch('time.time')
+    def test_transfer_data_progress(self, mock_time):
+        mock_time.return_value = 100.0
+        callback = mock.Mock()
+        progress = volume_utils.CopyProgress(10, callback, interval=2)
+        times = iter([101.0, 103.0, 104.0])
+
+        def _update(nbytes):
+            mock_time.return_value = next(times)
+            volume_utils.CopyProgress.update(progress, nbytes)
+
+        with mock.patch.object(progress, 'update', side_effect=_update):
+            volume_utils._transfer_data(io.BytesIO(b'abcdefghij'),
+                                        io.BytesIO(), 10, 4,
+                                        progress=progress)
+
+        self.assertEqual(10, progress.copied)
+        # Only reported once the interval has elapsed.
+        callback.assert_called_once_with(progress)
+        self.assertEqual(2.5, progress.rate)
+        self.assertEqual(0, progress.eta)
+        self.assertEqual('10 of 10 bytes (0.00 MB/s, ETA 0s)', str(progress))
+
+    def test_transfer_data_changed_chunks(self):
+        src = io.BytesIO(b'aaaabbbbcc')
+        dest = io.BytesIO()
+        hashes = bytearray()
+        volume_utils._transfer_data(src, dest, 10, 4, hashes=hashes)
+        self.assertEqual(3 * 32, len(hashes))
+
+        src = io.BytesIO(b'aaaaBBBBcc')
+        dest.seek(0)
+        dest.write = mock.Mock(wraps=dest.write)
+        volume_utils._transfer_data(src, dest, 10, 4, previous_hashes=hashes)
+        self.assertEqual(b'aaaaBBBBcc', dest.getvalue())
+        dest.write.assert_called_once_with(b'BBBB')
+
+    def test_transfer_data_changed_chunks_to_zeros(self):
+        src = io.BytesIO(b'aaaabbbbcc')
+        dest = io.BytesIO()
+        hashes = bytearray()
+        volume_utils._transfer_data(src, dest, 10, 4, sparse=True,
+                                    hashes=hashes)
+
+        src = io.BytesIO(b'aaaa\0\0\0\0cc')
+        dest.seek(0)
+        volume_utils._transfer_data(src, dest, 10, 4, sparse=True,
+                                    previous_hashes=hashes)
+        self.assertEqual(b'aaaa\0\0\0\0cc', dest.getvalue())
+
+    @mock.patch('six.PY3', False)
+    def test_transfer_data_py2_buffers(self):
+        self.assertIsInstance(volume_utils._alloc_buffer(4), bytearray)
+        src = io.BytesIO(b'aaaa\0\0\0\0cc')
+        dest = io.BytesIO()
+        volume_utils._transfer_data(src, dest, 10, 4, sparse=True)
+        self.assertEqual(b'aaaa\0\0\0\0cc', dest.getvalue())
+
+    def test_transfer_data_read_failure(self):
+        src = mock.Mock()
+        src.readinto.side_effect = [0, IOError]
+        self.assertRaises(IOError, volume_utils._transfer_data, src,
+                          io.BytesIO(), 10, 4)
+
+    @staticmethod
+    def _sendfile(out_fd, in_fd, offset, count):
+        os.lseek(in_fd, offset, os.SEEK_SET)
+        return os.write(out_fd, os.read(in_fd, count))
+
+    @mock.patch('os.copy_file_range', None, create=True)
+    def test_transfer_data_in_kernel(self):
+        # Not available on python 2
+        self.mock_object(os, 'sendfile', self._sendfile, create=True)
+        with tempfile.TemporaryFile() as src, \
+                tempfile.TemporaryFile() as dest:
+            src.write(b'abcdefghij')
+            src.seek(2)
+            dest.write(b'x')
+            throttle = mock.Mock()
+            with mock.patch.object(volume_utils, '_get_reader') as reader:
+                volume_utils._transfer_data(src, dest, 6, 4,
+                                            throttle=throttle)
+            reader.assert_not_called()
+            throttle.consume.assert_has_calls([mock.call(4), mock.call(2)])
+            self.assertEqual(8, src.tell())
+            self.assertEqual(7, dest.tell())
+            dest.seek(0)
+            self.assertEqual(b'xcdefgh', dest.read())
+
+    @mock.patch('os.sendfile', create=True,
+                side_effect=OSError(errno.EINVAL, 'Invalid argument'))
+    @mock.patch('os.copy_file_range', None, create=True)
+    def test_transfer_data_in_kernel_unsupported(self, mock_sendfile):
+        with tempfile.TemporaryFile() as src, \
+                tempfile.TemporaryFile() as dest:
+            src.write(b'abcdefghij')
+            src.seek(0)
+            volume_utils._transfer_data(src, dest, 10, 4)
+            mock_sendfile.assert_called_once_with(mock.ANY, mock.ANY, 0, 4)
+            dest.seek(0)
+            self.assertEqual(b'abcdefghij', dest.read())
 
 
 @ddt.ddt
@@ -59,7 +59,8 @@ class MockConnector(object):
 
 class MockDriver(object):
     def __init__(self):
-        self.configuration = mock.Mock(volume_dd_blocksize='1M')
+        self.configuration = mock.Mock(volume_dd_blocksize='1M',
+                                       volume_copy_method='dd')
 
     @staticmethod
     def _connect_device(conn):
@@ -666,7 +667,7 @@ class CommonAdapterTest(test.TestCase):
                 adapter.VolumeParams(self.adapter, volume), src_snap,
                 src_lun=src_lun)
             copy_volume.assert_called_with('dev', 'dev', 6144, '1M',
-                                           sparse=True)
+                                           sparse=True, copy_method='dd')
             self.assertEqual(IdMatcher(test_client.MockResource(_id=lun_id)),
                              ret)
 
@@ -684,7 +685,7 @@ class CommonAdapterTest(test.TestCase):
             ret = self.adapter._dd_copy(
                 adapter.VolumeParams(self.adapter, volume), src_snap)
             copy_volume.assert_called_with('dev', 'dev', 5120, '1M',
-                                           sparse=True)
+                                           sparse=True, copy_method='dd')
             self.assertEqual(IdMatcher(test_client.MockResource(_id=lun_id)),
                              ret)
 
@@ -76,6 +76,7 @@ class InfiniboxDriverTestCaseBase(test.TestCase):
         self.configuration.san_password = 'pass'
         self.configuration.volume_backend_name = 'mock'
         self.configuration.volume_dd_blocksize = '1M'
+        self.configuration.volume_copy_method = 'dd'
         self.configuration.use_multipath_for_image_xfer = False
         self.configuration.enforce_multipath_for_image_xfer = False
         self.configuration.num_volume_device_scan_tries = 1
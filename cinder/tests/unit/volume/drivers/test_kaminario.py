@@ -141,6 +141,7 @@ class TestKaminarioCommon(test.TestCase):
         self.conf = mock.Mock(spec=configuration.Configuration)
         self.conf.kaminario_dedup_type_name = "dedup"
         self.conf.volume_dd_blocksize = 2
+        self.conf.volume_copy_method = 'dd'
         self.conf.unique_fqdn_network = True
         self.conf.disable_discovery = False
 
@@ -97,6 +97,117 @@ class LVMVolumeDriverTestCase(test_driver.BaseDriverTestCase):
                          'size': 123}
         lvm_driver._delete_volume(fake_snapshot, is_snapshot=True)
 
+    def _create_lazy_clear_driver(self):
+        vg_obj = fake_lvm.FakeBrickLVM('cinder-volumes', False, None,
+                                       'default')
+        self.configuration.volume_clear = 'zero'
+        self.configuration.volume_clear_size = 0
+        self.configuration.lvm_type = 'default'
+        self.configuration.lvm_lazy_volume_clear = True
+        return lvm.LVMVolumeDriver(configuration=self.configuration,
+                                   vg_obj=vg_obj, db=db)
+
+    @mock.patch.object(lvm.LVMVolumeDriver, '_queue_clear')
+    @mock.patch.object(lvm.LVMVolumeDriver, '_clear_volume')
+    def test_delete_volume_lazy_clear(self, mock_clear, mock_queue_clear):
+        lvm_driver = self._create_lazy_clear_driver()
+        volume = dict(self.FAKE_VOLUME, size=1)
+
+        with mock.patch.object(lvm_driver.vg,
+                               'rename_volume') as mock_rename, \
+                mock.patch.object(lvm_driver.vg, 'delete') as mock_delete:
+            lvm_driver._delete_volume(volume)
+
+        mock_rename.assert_called_once_with('test1', 'pending-clear-test1')
+        mock_queue_clear.assert_called_once_with('pending-clear-test1')
+        mock_clear.assert_not_called()
+        mock_delete.assert_not_called()
+
+        # Snapshots are still cleared right away
+        lvm_driver._delete_volume(volume, is_snapshot=True)
+        mock_clear.assert_called_once_with(volume, True)
+
+    @mock.patch.object(lvm.eventlet, 'spawn_after')
+    @mock.patch.object(lvm.eventlet, 'spawn', side_effect=lambda f: f())
+    @mock.patch.object(lvm.LVMVolumeDriver, '_clear_pending_volume')
+    def test_queue_clear(self, mock_clear_pending, mock_spawn,
+                         mock_spawn_after):
+        lvm_driver = self._create_lazy_clear_driver()
+        mock_clear_pending.side_effect = [exception.VolumeBackendAPIException(
+            data='error'), None]
+        lvm_driver._pending_clears.append('pending-clear-vol1')
+
+        lvm_driver._queue_clear('pending-clear-vol2')
+
+        # Failures don't stop the worker
+        self.assertEqual([mock.call('pending-clear-vol1'),
+                          mock.call('pending-clear-vol2')],
+                         mock_clear_pending.call_args_list)
+        self.assertEqual(0, len(lvm_driver._pending_clears))
+        self.assertIsNone(lvm_driver._clear_worker)
+        # The failed volume is cleared again later
+        mock_spawn_after.assert_called_once_with(
+            60, lvm_driver._queue_clear, 'pending-clear-vol1')
+
+        # Only one worker runs at a time
+        mock_spawn.reset_mock()
+        lvm_driver._clear_worker = mock.sentinel.worker
+        lvm_driver._queue_clear('pending-clear-vol3')
+        mock_spawn.assert_not_called()
+        self.assertEqual(['pending-clear-vol3'],
+                         list(lvm_driver._pending_clears))
+
+    @mock.patch.object(lvm.eventlet, 'spawn_after')
+    @mock.patch.object(lvm.LVMVolumeDriver, '_clear_pending_volume')
+    def test_run_pending_clears_backoff(self, mock_clear_pending,
+                                        mock_spawn_after):
+        lvm_driver = self._create_lazy_clear_driver()
+        mock_clear_pending.side_effect = [
+            exception.VolumeBackendAPIException(data='error')] * 7 + [None]
+
+        for i in range(8):
+            lvm_driver._pending_clears.append('pending-clear-vol1')
+            lvm_driver._run_pending_clears()
+
+        self.assertEqual([60, 120, 240, 480, 960, 1920, 3600],
+                         [c[0][0] for c in mock_spawn_after.call_args_list])
+        # Successes reset the delay
+        self.assertEqual({}, lvm_driver._clear_failures)
+
+    @mock.patch.object(lvm.LVMVolumeDriver, '_clear_volume')
+    def test_clear_pending_volume(self, mock_clear):
+        self.configuration.lvm_lazy_volume_clear_bps_limit = 1024
+        self.configuration.volume_copy_method = 'native'
+        lvm_driver = self._create_lazy_clear_driver()
+
+        with mock.patch.object(lvm_driver.vg, 'get_volume',
+                               return_value={'name': 'pending-clear-vol1',
+                                             'size': '2.00g'}), \
+                mock.patch.object(lvm_driver.vg, 'delete') as mock_delete:
+            lvm_driver._clear_pending_volume('pending-clear-vol1')
+
+        mock_clear.assert_called_once_with(
+            {'id': 'pending-clear-vol1', 'name': 'pending-clear-vol1',
+             'size': 2}, throttle=lvm_driver._clear_throttle)
+        self.assertEqual(1024, lvm_driver._clear_throttle.bps_limit)
+        mock_delete.assert_called_once_with('pending-clear-vol1')
+
+    @mock.patch.object(lvm.LVMVolumeDriver, '_queue_clear')
+    @mock.patch.object(volutils, 'get_all_volume_groups',
+                       return_value=[{'name': 'cinder-volumes'}])
+    def test_check_for_setup_error_pending_clears(self, vgs,
+                                                  mock_queue_clear):
+        lvm_driver = self._create_lazy_clear_driver()
+
+        with mock.patch.object(
+                lvm_driver.vg, 'get_volumes',
+                return_value=[{'name': 'volume-1', 'size': '1.00'},
+                              {'name': 'pending-clear-volume-2',
+                               'size': '2.00'}]):
+            lvm_driver.check_for_setup_error()
+
+        mock_queue_clear.assert_called_once_with('pending-clear-volume-2')
+
     @mock.patch.object(volutils, 'get_all_volume_groups',
                        return_value=[{'name': 'cinder-volumes'}])
     @mock.patch('cinder.brick.local_dev.lvm.LVM.get_lvm_version',
@@ -205,7 +316,8 @@ class LVMVolumeDriverTestCase(test_driver.BaseDriverTestCase):
                                          volume_size,
                                          block_size,
                                          execute=self.volume.driver._execute,
-                                         sparse=False)
+                                         sparse=False,
+                                         copy_method='dd')
 
     def test_create_volume_from_snapshot_sparse(self):
 
@@ -495,7 +607,8 @@ class LVMVolumeDriverTestCase(test_driver.BaseDriverTestCase):
                 2048,
                 '1M',
                 execute=mock_execute,
-                sparse=False)
+                sparse=False,
+                copy_method='dd')
 
     def test_lvm_migrate_volume_proceed_with_thin(self):
         hostname = socket.gethostname()
@@ -544,7 +657,8 @@ class LVMVolumeDriverTestCase(test_driver.BaseDriverTestCase):
                 2048,
                 '1M',
                 execute=mock_execute,
-                sparse=True)
+                sparse=True,
+                copy_method='dd')
 
     @staticmethod
     def _get_manage_existing_lvs(name):
@@ -952,8 +1066,18 @@ class LVMISCSITestCase(test_driver.BaseDriverTestCase):
             float('5.0'), stats['pools'][0]['provisioned_capacity_gb'])
         self.assertEqual(
             int('1'), stats['pools'][0]['total_volumes'])
+        self.assertEqual(0, stats['pools'][0]['pending_clear_capacity_gb'])
         self.assertFalse(stats['sparse_copy_volume'])
 
+        # Deleted volumes that are still being cleared aren't counted
+        mock_get_volumes.return_value.append(
+            {'vg': 'fake_vg', 'name': 'pending-clear-fake_vol2',
+             'size': '2.00g'})
+        self.volume.driver._update_volume_stats()
+        stats = self.volume.driver._stats
+        self.assertEqual(1, stats['pools'][0]['total_volumes'])
+        self.assertEqual(2.0, stats['pools'][0]['pending_clear_capacity_gb'])
+
         # Check value of sparse_copy_volume for thin enabled case.
         # This value is set in check_for_setup_error.
         self.configuration = conf.Configuration(None)
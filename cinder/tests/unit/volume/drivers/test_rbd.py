@@ -14,6 +14,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import math
 import os
 import tempfile
@@ -199,6 +200,9 @@ class RBDTestCase(test.TestCase):
         self.cfg.rados_connection_interval = 5
         self.cfg.backup_use_temp_snapshot = False
         self.cfg.enable_deferred_deletion = False
+        self.cfg.rados_connection_pool_size = 0
+        self.cfg.rados_connection_idle_timeout = 300
+        self.cfg.rbd_usage_refresh_batch_size = 0
 
         mock_exec = mock.Mock()
         mock_exec.return_value = ('', '')
@@ -1864,7 +1868,7 @@ class RBDTestCase(test.TestCase):
                 'vol_pool', None, None)
 
         mock_driver._disconnect_from_rados.assert_called_once_with(
-            'fake_cl', 'fake_io')
+            'fake_cl', 'fake_io', None)
 
     def test_rbd_volume_proxy_external_conn_error(self):
         mock_driver = mock.Mock(name='driver')
@@ -1901,7 +1905,7 @@ class RBDTestCase(test.TestCase):
         mock_driver._connect_to_rados.assert_called_once_with(
             'fake-volumes', None, None)
         mock_driver._disconnect_from_rados.assert_called_once_with(
-            'fake_client', 'fake_ioctx')
+            'fake_client', 'fake_ioctx', mock_driver.rbd.Image.side_effect)
 
     @common_mocks
     def test_connect_to_rados(self):
@@ -1951,6 +1955,115 @@ class RBDTestCase(test.TestCase):
         self.assertEqual(
             3, self.mock_rados.Rados.return_value.shutdown.call_count)
 
+    @common_mocks
+    def test_connect_to_rados_pool(self):
+        self.cfg.rados_connect_timeout = -1
+        self.cfg.rados_connection_pool_size = 1
+        self.driver._connection_pool = driver.RADOSConnectionPool(1, 300)
+        clients = [mock.Mock(state='connected') for __ in range(3)]
+        for client in clients:
+            client.open_ioctx.return_value = mock.Mock(state='open')
+        self.mock_rados.Rados.side_effect = clients
+
+        client1, ioctx1 = self.driver._connect_to_rados()
+        client2, ioctx2 = self.driver._connect_to_rados()
+        self.driver._disconnect_from_rados(client1, ioctx1)
+        self.driver._disconnect_from_rados(client2, ioctx2)
+
+        # Only one idle connection is kept
+        ioctx1.close.assert_not_called()
+        ioctx2.close.assert_called_once_with()
+        client2.shutdown.assert_called_once_with()
+
+        # It is reused for the same pool
+        self.assertEqual((client1, ioctx1), self.driver._connect_to_rados())
+        self.assertEqual(2, self.mock_rados.Rados.call_count)
+
+        # But not for other pools
+        client3, ioctx3 = self.driver._connect_to_rados('alt_pool')
+        self.assertIs(clients[2], client3)
+        client3.open_ioctx.assert_called_once_with('alt_pool')
+
+    @common_mocks
+    def test_connect_to_rados_pool_unhealthy(self):
+        self.cfg.rados_connect_timeout = -1
+        self.driver._connection_pool = driver.RADOSConnectionPool(2, 300)
+        clients = [mock.Mock(state='connected') for __ in range(2)]
+        for client in clients:
+            client.open_ioctx.return_value = mock.Mock(state='open')
+        self.mock_rados.Rados.side_effect = clients
+
+        client1, ioctx1 = self.driver._connect_to_rados()
+        self.driver._disconnect_from_rados(client1, ioctx1)
+        client1.state = 'shutdown'
+
+        # We reconnect instead of using the broken connection
+        self.assertEqual((clients[1], clients[1].open_ioctx.return_value),
+                         self.driver._connect_to_rados())
+        ioctx1.close.assert_called_once_with()
+
+    @common_mocks
+    def test_connect_to_rados_pool_error(self):
+        self.cfg.rados_connect_timeout = -1
+        self.driver._connection_pool = driver.RADOSConnectionPool(2, 300)
+        self.mock_rados.Error = MockException
+        self.mock_rbd.Error = MockException
+        clients = [mock.Mock(state='connected') for __ in range(2)]
+        for client in clients:
+            client.open_ioctx.return_value = mock.Mock(state='open')
+        self.mock_rados.Rados.side_effect = clients
+
+        # Other errors don't affect the connection
+        client1, ioctx1 = self.driver._connect_to_rados()
+        self.driver._disconnect_from_rados(client1, ioctx1, ValueError())
+        self.assertEqual((client1, ioctx1), self.driver._connect_to_rados())
+
+        # But the connection may be broken after a ceph error, although it
+        # is still in the connected state.
+        self.driver._disconnect_from_rados(client1, ioctx1,
+                                           self.mock_rbd.Error())
+        ioctx1.close.assert_called_once_with()
+        client1.shutdown.assert_called_once_with()
+        self.assertEqual((clients[1], clients[1].open_ioctx.return_value),
+                         self.driver._connect_to_rados())
+
+    def test_rados_client_exit_error(self):
+        mock_driver = mock.Mock(name='driver')
+        mock_driver._connect_to_rados.return_value = ('fake_cl', 'fake_io')
+        error = ValueError()
+
+        def _raise():
+            with driver.RADOSClient(mock_driver):
+                raise error
+
+        self.assertRaises(ValueError, _raise)
+        mock_driver._disconnect_from_rados.assert_called_once_with(
+            'fake_cl', 'fake_io', error)
+
+    @mock.patch('oslo_utils.timeutils.now')
+    def test_rados_connection_pool_idle_timeout(self, mock_now):
+        pool = driver.RADOSConnectionPool(2, 300)
+        client = mock.Mock(state='connected')
+        ioctx = mock.Mock(state='open')
+        mock_now.return_value = 1000
+        pool.add('key', client, ioctx)
+        pool.release(client, ioctx)
+
+        mock_now.return_value = 1301
+        self.assertIsNone(pool.get('key'))
+        ioctx.close.assert_called_once_with()
+        client.shutdown.assert_called_once_with()
+
+    def test_rados_connection_pool_release_unknown(self):
+        pool = driver.RADOSConnectionPool(2, 300)
+        client = mock.Mock(state='connected')
+        ioctx = mock.Mock(state='open')
+
+        pool.release(client, ioctx)
+
+        ioctx.close.assert_called_once_with()
+        client.shutdown.assert_called_once_with()
+
     @common_mocks
     def test_failover_host_no_replication(self):
         self.driver._is_replication_enabled = False
@@ -2250,6 +2363,105 @@ class RBDTestCase(test.TestCase):
         self.assertEqual(expected_volproxy_calls, volproxy_mock.mock_calls)
 
         self.assertEqual(3.00, total_provision)
+        self.assertIsNone(self.driver._image_sizes)
+
+    @mock.patch('cinder.volume.drivers.rbd.RBDVolumeProxy')
+    @mock.patch('cinder.volume.drivers.rbd.RADOSClient')
+    @mock.patch('cinder.volume.drivers.rbd.RBDDriver.RBDProxy')
+    def test__get_usage_info_batch(self, rbdproxy_mock, client_mock,
+                                   volproxy_mock):
+        self.cfg.rbd_usage_refresh_batch_size = 2
+        client = client_mock.return_value.__enter__.return_value
+        sizes = {'volume-1': 1, 'volume-2': 2, 'volume-3': 3, 'volume-4': 4}
+
+        def fake_volproxy(driver, name, **kwargs):
+            proxy = mock.MagicMock()
+            proxy.__enter__.return_value.size.return_value = (
+                sizes[name] * units.Gi)
+            return proxy
+
+        volproxy_mock.side_effect = fake_volproxy
+
+        # The first refresh opens all the images
+        rbdproxy_mock.return_value.list.return_value = [
+            'volume-1', 'volume-2', 'volume-3']
+        self.assertEqual(6, self.driver._get_usage_info())
+        self.assertEqual(3, volproxy_mock.call_count)
+
+        # Then the new images and the ones checked the longest ago
+        volproxy_mock.reset_mock()
+        sizes['volume-1'] = 5
+        rbdproxy_mock.return_value.list.return_value = [
+            'volume-1', 'volume-3', 'volume-4']
+        self.assertEqual(12, self.driver._get_usage_info())
+        self.assertEqual(
+            [mock.call(self.driver, name, read_only=True,
+                       client=client.cluster, ioctx=client.ioctx)
+             for name in ('volume-4', 'volume-1')],
+            volproxy_mock.call_args_list)
+        self.assertEqual(['volume-3', 'volume-4', 'volume-1'],
+                         list(self.driver._image_sizes))
+
+        # And the sizes kept up to date by the driver operations
+        volproxy_mock.reset_mock()
+        self.cfg.rbd_usage_refresh_batch_size = 1
+        self.driver._set_image_size('volume-4', 10 * units.Gi)
+        self.assertEqual(18, self.driver._get_usage_info())
+        volproxy_mock.assert_called_once_with(
+            self.driver, 'volume-3', read_only=True, client=client.cluster,
+            ioctx=client.ioctx)
+
+    @mock.patch('cinder.volume.drivers.rbd.RBDVolumeProxy')
+    @mock.patch('cinder.volume.drivers.rbd.RADOSClient')
+    @mock.patch('cinder.volume.drivers.rbd.RBDDriver.RBDProxy')
+    def test__get_usage_info_batch_concurrent_changes(self, rbdproxy_mock,
+                                                      client_mock,
+                                                      volproxy_mock):
+        self.cfg.rbd_usage_refresh_batch_size = 1
+        self.driver._image_sizes = collections.OrderedDict(
+            [('volume-1', units.Gi), ('volume-2', 2 * units.Gi)])
+        rbdproxy_mock.return_value.list.return_value = ['volume-1',
+                                                        'volume-2']
+
+        def fake_volproxy(driver, name, **kwargs):
+            # Other greenthreads run while the image is opened
+            self.driver._set_image_size('volume-2', 5 * units.Gi)
+            self.driver._set_image_size('volume-3', 3 * units.Gi)
+            proxy = mock.MagicMock()
+            proxy.__enter__.return_value.size.return_value = units.Gi
+            return proxy
+
+        volproxy_mock.side_effect = fake_volproxy
+
+        self.assertEqual(9, self.driver._get_usage_info())
+        self.assertEqual({'volume-1': units.Gi, 'volume-2': 5 * units.Gi,
+                          'volume-3': 3 * units.Gi},
+                         dict(self.driver._image_sizes))
+        self.assertIsNone(self.driver._image_size_changes)
+
+    def test__set_image_size(self):
+        self.driver._set_image_size('volume-1', units.Gi)
+        self.assertIsNone(self.driver._image_sizes)
+
+        self.driver._image_sizes = collections.OrderedDict(
+            [('volume-1', units.Gi), ('volume-2', 2 * units.Gi)])
+        self.driver._set_image_size('volume-1', 3 * units.Gi)
+        self.driver._set_image_size('volume-2', new_name='volume-2.deleted')
+        self.driver._set_image_size('volume-3', 4 * units.Gi)
+        self.driver._set_image_size('volume-3')
+        self.assertEqual({'volume-1': 3 * units.Gi,
+                          'volume-2.deleted': 2 * units.Gi},
+                         dict(self.driver._image_sizes))
+
+    @common_mocks
+    def test_extend_volume_image_size(self):
+        self.driver._image_sizes = collections.OrderedDict(
+            [(self.volume_a.name, units.Gi)])
+
+        self.driver.extend_volume(self.volume_a, 20)
+
+        self.assertEqual({self.volume_a.name: 20 * units.Gi},
+                         dict(self.driver._image_sizes))
 
     def test_migrate_volume_bad_volume_status(self):
         self.volume_a.status = 'in-use'
@@ -24,9 +24,11 @@ import mock
 from castellan.common import exception as castellan_exc
 from castellan.tests.unit.key_manager import mock_key_manager
 from oslo_utils import imageutils
+from oslo_utils import units
 
 from cinder import context
 from cinder import exception
+from cinder.image import image_utils
 from cinder.message import message_field
 from cinder import test
 from cinder.tests.unit.backup import fake_backup
@@ -1706,6 +1708,116 @@ class CreateVolumeFlowManagerImageCacheTestCase(test.TestCase):
             image_meta=image_meta
         )
 
+    @ddt.data((False, None), (True, True), (True, None))
+    @ddt.unpack
+    @mock.patch('cinder.image.image_utils.verify_glance_image_signature')
+    @mock.patch('cinder.image.image_utils.check_available_space')
+    def test_create_from_image_streamed(
+            self, signed, reported, mock_check_space, mock_verify,
+            mock_get_internal_context, mock_create_from_img_dl,
+            mock_create_from_src, mock_handle_bootable, mock_fetch_img):
+        self.flags(image_stream_to_volume=True)
+        self.mock_driver.clone_image.return_value = (None, False)
+        self.mock_image_service.temp_images = None
+        volume = fake_volume.fake_volume_obj(self.ctxt, size=10,
+                                             host='host@backend#pool')
+
+        image_location = 'someImageLocationStr'
+        image_id = fakes.IMAGE_ID
+        image_meta = {'id': image_id,
+                      'size': 2 * units.Gi,
+                      'disk_format': 'raw',
+                      'container_format': 'bare',
+                      'properties': {}}
+        if signed:
+            image_meta['properties'] = {
+                'img_signature_certificate_uuid': 'fake_uuid',
+                'img_signature_hash_method': 'SHA-256',
+                'img_signature': 'signature',
+                'img_signature_key_type': 'RSA-PSS'}
+
+        def _create_from_image_download(*args):
+            # The image_utils helpers report the signature verification.
+            if reported is not None:
+                image_utils.TemporaryImages.for_image_service(
+                    self.mock_image_service).set_verified(
+                        self.ctxt, image_id, reported)
+
+        mock_create_from_img_dl.side_effect = _create_from_image_download
+        mock_verify.return_value = True
+
+        manager = create_volume_manager.CreateVolumeFromSpecTask(
+            self.mock_volume_manager,
+            self.mock_db,
+            self.mock_driver,
+            image_volume_cache=None
+        )
+
+        manager._create_from_image(self.ctxt,
+                                   volume,
+                                   image_location,
+                                   image_id,
+                                   image_meta,
+                                   self.mock_image_service)
+
+        mock_create_from_img_dl.assert_called_once_with(
+            self.ctxt, volume, image_location, image_meta,
+            self.mock_image_service)
+        # Signed images are only downloaded again when the driver didn't
+        # verify them, which is the only time temporary space is needed.
+        if signed and reported is None:
+            mock_check_space.assert_called_once_with(
+                mock.ANY, image_meta['size'], image_id)
+            mock_fetch_img.assert_called_once_with(
+                self.mock_image_service, self.ctxt, image_id,
+                'host@backend')
+            mock_verify.assert_called_once_with(
+                self.ctxt, self.mock_image_service, image_id,
+                mock_fetch_img.return_value.__enter__.return_value)
+        else:
+            mock_check_space.assert_not_called()
+            mock_fetch_img.assert_not_called()
+            mock_verify.assert_not_called()
+        (self.mock_db.volume_glance_metadata_bulk_create.
+            assert_called_once_with(self.ctxt, volume.id,
+                                    {'signature_verified': signed}))
+
+    @mock.patch('cinder.image.image_utils.check_available_space')
+    def test_create_from_image_streamed_too_big(
+            self, mock_check_space, mock_get_internal_context,
+            mock_create_from_img_dl, mock_create_from_src,
+            mock_handle_bootable, mock_fetch_img):
+        self.flags(image_stream_to_volume=True)
+        self.mock_driver.clone_image.return_value = (None, False)
+        volume = fake_volume.fake_volume_obj(self.ctxt, size=10,
+                                             host='host@backend#pool')
+        image_id = fakes.IMAGE_ID
+        image_meta = {'id': image_id,
+                      'size': 2 * units.Gi,
+                      'disk_format': 'raw',
+                      'container_format': 'bare',
+                      'properties': {}}
+        mock_create_from_img_dl.side_effect = exception.ImageTooBig(
+            image_id=image_id, reason='fake')
+
+        manager = create_volume_manager.CreateVolumeFromSpecTask(
+            self.mock_volume_manager,
+            self.mock_db,
+            self.mock_driver,
+            image_volume_cache=None
+        )
+        manager.message = mock.Mock()
+
+        self.assertRaises(exception.ImageTooBig,
+                          manager._create_from_image,
+                          self.ctxt, volume, 'someImageLocationStr',
+                          image_id, image_meta, self.mock_image_service)
+        manager.message.create.assert_called_once_with(
+            self.ctxt, message_field.Action.COPY_IMAGE_TO_VOLUME,
+            resource_uuid=volume.id,
+            detail=message_field.Detail.NOT_ENOUGH_SPACE_FOR_IMAGE,
+            exception=mock.ANY)
+
     @mock.patch('cinder.db.volume_update')
     @mock.patch('cinder.objects.Volume.get_by_id')
     @mock.patch('cinder.image.image_utils.qemu_img_info')
@@ -14,13 +14,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import mock
+import datetime
 
+from eventlet import event
+import mock
 from oslo_serialization import jsonutils
 
 from cinder import exception
 from cinder.tests import fake_driver
 from cinder.tests.unit import volume as base
+from cinder.volume import configuration
 from cinder.volume import driver
 from cinder.volume import manager as vol_manager
 # import cinder.volume.targets.tgt
@@ -208,3 +211,106 @@ class VolumeCapabilitiesTestCase(base.BaseVolumeTestCase):
             mock_loads.side_effect = exception.CinderException('test')
             self.assertRaises(exception.CinderException,
                               vol_manager.VolumeManager)
+
+
+class DriverStatsTestCase(base.BaseVolumeTestCase):
+    def setUp(self):
+        super(DriverStatsTestCase, self).setUp()
+        self.override_config('driver_stats_max_age', 60,
+                             group=configuration.SHARED_CONF_GROUP)
+        self.manager = vol_manager.VolumeManager()
+        self.manager.stats = {'pools': {}}
+        self.stats = {'volume_backend_name': 'backend',
+                      'pools': [{'pool_name': 'pool1',
+                                 'free_capacity_gb': 10},
+                                {'pool_name': 'pool2',
+                                 'free_capacity_gb': 20}]}
+        self.get_stats_mock = self.patch(
+            'cinder.tests.fake_driver.FakeLoggingVolumeDriver.'
+            'get_volume_stats', return_value=self.stats)
+
+    def test_get_driver_stats_cached(self):
+        stats = self.manager._get_driver_stats()
+        self.assertEqual(self.stats, stats)
+        stats['pools'][0]['free_capacity_gb'] = 0
+
+        self.assertEqual(self.stats, self.manager._get_driver_stats())
+        self.get_stats_mock.assert_called_once_with(refresh=True)
+
+    def test_get_driver_stats_expired(self):
+        self.manager._get_driver_stats()
+        self.manager._driver_stats_time -= datetime.timedelta(seconds=61)
+
+        self.manager._get_driver_stats()
+
+        self.assertEqual(2, self.get_stats_mock.call_count)
+
+    def test_get_driver_stats_disabled(self):
+        self.override_config('driver_stats_max_age', 0,
+                             group=configuration.SHARED_CONF_GROUP)
+
+        self.assertIs(self.stats, self.manager._get_driver_stats())
+        self.manager._get_driver_stats()
+
+        self.assertEqual(2, self.get_stats_mock.call_count)
+
+    @mock.patch.object(fake_driver.FakeLoggingVolumeDriver, 'get_pools_stats',
+                       return_value=[{'pool_name': 'pool1',
+                                      'free_capacity_gb': 5}])
+    def test_get_driver_stats_stale_pools(self, get_pools_mock):
+        self.manager._get_driver_stats()
+        self.manager._update_allocated_capacity(
+            {'host': 'host@backend#pool1', 'size': 5})
+
+        stats = self.manager._get_driver_stats()
+
+        get_pools_mock.assert_called_once_with({'pool1'})
+        self.get_stats_mock.assert_called_once_with(refresh=True)
+        self.assertEqual([{'pool_name': 'pool1', 'free_capacity_gb': 5},
+                          {'pool_name': 'pool2', 'free_capacity_gb': 20}],
+                         stats['pools'])
+        self.assertEqual(set(), self.manager._stale_pools)
+
+    def test_get_driver_stats_stale_pools_not_supported(self):
+        self.manager._get_driver_stats()
+        self.manager._update_allocated_capacity(
+            {'host': 'host@backend#pool1', 'size': 5})
+
+        self.assertEqual(self.stats, self.manager._get_driver_stats())
+        self.assertFalse(self.manager._pools_stats_supported)
+
+        # We don't try again until the stats expire
+        self.manager._update_allocated_capacity(
+            {'host': 'host@backend#pool1', 'size': 5})
+        self.manager._get_driver_stats()
+        self.assertIsNone(self.manager._stats_collector)
+        self.get_stats_mock.assert_called_once_with(refresh=True)
+
+    def test_get_driver_stats_failure(self):
+        self.manager._get_driver_stats()
+        self.manager._driver_stats_time -= datetime.timedelta(seconds=61)
+        self.get_stats_mock.side_effect = exception.VolumeBackendAPIException(
+            data='error')
+
+        self.assertEqual(self.stats, self.manager._get_driver_stats())
+        self.assertEqual(2, self.get_stats_mock.call_count)
+
+    def test_get_driver_stats_timeout(self):
+        self.override_config('driver_stats_timeout', 0,
+                             group=configuration.SHARED_CONF_GROUP)
+        self.manager._get_driver_stats()
+        self.manager._driver_stats_time -= datetime.timedelta(seconds=61)
+        collected = event.Event()
+        new_stats = {'volume_backend_name': 'backend', 'pools': []}
+
+        def slow_get_volume_stats(refresh):
+            collected.wait()
+            return new_stats
+        self.get_stats_mock.side_effect = slow_get_volume_stats
+
+        # The collection is still running so we get the last stats
+        self.assertEqual(self.stats, self.manager._get_driver_stats())
+        collected.send()
+        self.manager._tp.waitall()
+        self.assertEqual(new_stats, self.manager._get_driver_stats())
+        self.assertEqual(2, self.get_stats_mock.call_count)
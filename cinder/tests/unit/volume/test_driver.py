@@ -22,6 +22,7 @@ import tempfile
 import os_brick
 from oslo_config import cfg
 from oslo_utils import importutils
+from oslo_utils import units
 
 from cinder.brick.local_dev import lvm as brick_lvm
 from cinder import context
@@ -44,6 +45,7 @@ from cinder.volume import driver
 from cinder.volume import manager
 from cinder.volume import rpcapi as volume_rpcapi
 import cinder.volume.targets.tgt
+from cinder.volume import throttling
 from cinder.volume import utils as volutils
 
 
@@ -135,6 +137,18 @@ class DriverTestCase(test.TestCase):
         self._get_driver(True, 'a/a')(configuration=config,
                                       cluster_name='mycluster')
 
+    def test_set_throttle_backend_copy_method(self):
+        config = conf.Configuration(driver.volume_opts,
+                                    config_group='backend1')
+        self.override_config('volume_copy_bps_limit', 1024, group='backend1')
+        self.override_config('volume_copy_method', 'native',
+                             group='backend1')
+        my_driver = self._get_driver(False, None)(configuration=config)
+        self.addCleanup(throttling.Throttle.set_default, None)
+        my_driver.set_throttle()
+        self.assertIs(throttling.Throttle, type(my_driver._throttle))
+        self.assertEqual(1024, my_driver._throttle.bps_limit)
+
     def test_failover(self):
         """Test default failover behavior of calling failover_host."""
         my_driver = self._get_driver(True, 'a/a')()
@@ -326,7 +340,10 @@ class GenericVolumeDriverTestCase(BaseDriverTestCase):
                                       dest_vol)
 
         self.assertEqual(attach_expected, mock_attach.mock_calls)
-        mock_copy.assert_called_with('foo', 'bar', 1024, '1M', sparse=False)
+        mock_copy.assert_called_with('foo', 'bar', 1024, '1M', sparse=False,
+                                     progress=mock.ANY, streams=1,
+                                     hashes=None, previous_hashes=None,
+                                     copy_method='dd')
         self.assertEqual(detach_expected, mock_detach.mock_calls)
 
         #  Test case for sparse_copy_volume = True
@@ -339,13 +356,55 @@ class GenericVolumeDriverTestCase(BaseDriverTestCase):
                                       dest_vol)
 
         self.assertEqual(attach_expected, mock_attach.mock_calls)
-        mock_copy.assert_called_with('foo', 'bar', 1024, '1M', sparse=True)
+        mock_copy.assert_called_with('foo', 'bar', 1024, '1M', sparse=True,
+                                     progress=mock.ANY, streams=1,
+                                     hashes=None, previous_hashes=None,
+                                     copy_method='dd')
         self.assertEqual(detach_expected, mock_detach.mock_calls)
 
         # cleanup resource
         db.volume_destroy(self.context, src_vol['id'])
         db.volume_destroy(self.context, dest_vol['id'])
 
+    @mock.patch.object(utils, 'brick_get_connector_properties',
+                       return_value={})
+    @mock.patch.object(cinder.volume.manager.VolumeManager, '_attach_volume',
+                       return_value={'device': {'path': 'foo'}})
+    @mock.patch.object(cinder.volume.manager.VolumeManager, '_detach_volume')
+    @mock.patch.object(volutils, 'copy_volume')
+    @mock.patch.object(volume_rpcapi.VolumeAPI, 'get_capabilities',
+                       return_value={})
+    def test_copy_volume_data_mgr_progress(self, mock_get_capabilities,
+                                           mock_copy, mock_detach,
+                                           mock_attach, mock_get_connector):
+        src_vol = tests_utils.create_volume(self.context, size=1,
+                                            host=CONF.host,
+                                            migration_status='migrating')
+        dest_vol = tests_utils.create_volume(self.context, size=1,
+                                             host=CONF.host)
+
+        def _copy_volume(*args, **kwargs):
+            progress = kwargs['progress']
+            self.assertEqual(units.Gi, progress.total)
+            progress.update(units.Gi // 2)
+            progress.callback(progress)
+            admin_metadata = db.volume_admin_metadata_get(self.context,
+                                                          src_vol.id)
+            self.assertIn('%d of %d bytes' % (units.Gi // 2, units.Gi),
+                          admin_metadata['migration_progress'])
+
+        mock_copy.side_effect = _copy_volume
+        self.volume._copy_volume_data(self.context, src_vol, dest_vol)
+
+        mock_copy.assert_called_once_with('foo', 'foo', 1024, '1M',
+                                          sparse=False, progress=mock.ANY,
+                                          streams=1, hashes=None,
+                                          previous_hashes=None,
+                                          copy_method='dd')
+        self.assertNotIn('migration_progress',
+                         db.volume_admin_metadata_get(self.context,
+                                                      src_vol.id))
+
     @mock.patch(driver_name + '.initialize_connection')
     @mock.patch(driver_name + '.create_export', return_value=None)
     @mock.patch(driver_name + '._connect_device')
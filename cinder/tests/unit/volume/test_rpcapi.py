@@ -404,7 +404,28 @@ class VolumeRPCAPITestCase(test.RPCAPITestCase):
                            discover=True,
                            retval={'foo': 'bar'})
 
-    def test_remove_export(self):
+    def test_publish_service_capabilities(self):
+        self._test_rpc_api('publish_service_capabilities',
+                           rpc_method='cast',
+                           fanout=True,
+                           version='3.17',
+                           expected_kwargs_diff={'full_report': True})
+
+    def test_publish_service_capabilities_host(self):
+        self._test_rpc_api('publish_service_capabilities',
+                           rpc_method='cast',
+                           server='fake_host@fake_backend',
+                           host='fake_host@fake_backend',
+                           version='3.17',
+                           expected_kwargs_diff={'full_report': True})
+
+    def test_publish_service_capabilities_capped(self):
+        self.can_send_version_mock.return_value = False
+        self._test_rpc_api('publish_service_capabilities',
+                           rpc_method='cast',
+                           fanout=True,
+                           version='3.0')
+
         self._test_rpc_api('remove_export',
                            rpc_method='cast',
                            server=self.fake_volume_obj.host,
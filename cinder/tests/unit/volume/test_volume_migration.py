@@ -38,6 +38,7 @@ from cinder.tests.unit import utils as tests_utils
 from cinder.tests.unit import volume as base
 import cinder.volume
 from cinder.volume import api as volume_api
+from cinder.volume import configuration
 from cinder.volume.flows.manager import create_volume as create_volume_manager
 from cinder.volume import rpcapi as volume_rpcapi
 from cinder.volume import utils as volutils
@@ -180,6 +181,80 @@ class VolumeMigrationTestCase(base.BaseVolumeTestCase):
                 self.context, volume, new_volume_obj, error=False)
             self.assertFalse(update_server_volume.called)
 
+    @mock.patch('cinder.volume.manager.VolumeManager.'
+                'migrate_volume_completion')
+    @mock.patch('cinder.db.sqlalchemy.api.volume_get')
+    def test_migrate_volume_generic_two_phases(self, volume_get,
+                                               migrate_volume_completion):
+        self.override_config('migration_delta_copy', True,
+                             group=configuration.SHARED_CONF_GROUP)
+        fake_db_new_volume = {'status': 'available', 'id': fake.VOLUME_ID}
+        volume_get.return_value = fake_volume.fake_db_volume(
+            **fake_db_new_volume)
+        host_obj = {'host': 'newhost', 'capabilities': {}}
+        volume = tests_utils.create_volume(self.context, size=1,
+                                           host=CONF.host)
+        statuses = []
+
+        def _copy_volume_data(ctxt, src_vol, dest_vol, remote=None,
+                              hashes=None, previous_hashes=None):
+            statuses.append(src_vol.status)
+            if hashes is not None:
+                hashes.extend(b'hash')
+
+        with mock.patch.object(self.volume, '_copy_volume_data',
+                               side_effect=_copy_volume_data) as mock_copy:
+            self.volume._migrate_volume_generic(self.context, volume,
+                                                host_obj, None)
+
+        self.assertEqual(2, mock_copy.call_count)
+        self.assertEqual(b'hash', mock_copy.call_args[1]['previous_hashes'])
+        self.assertEqual(['available', 'maintenance'], statuses)
+        migrate_volume_completion.assert_called_once_with(
+            self.context, volume, mock.ANY, error=False)
+
+        # Retyped volumes are usable during the first copy too
+        statuses = []
+        mock_copy.reset_mock()
+        volume.update({'status': 'retyping', 'previous_status': 'available'})
+        volume.save()
+        with mock.patch.object(self.volume, '_copy_volume_data',
+                               side_effect=_copy_volume_data) as mock_copy:
+            self.volume._migrate_volume_generic(self.context, volume,
+                                                host_obj, None)
+
+        self.assertEqual(2, mock_copy.call_count)
+        self.assertEqual(['available', 'retyping'], statuses)
+
+    @mock.patch('cinder.volume.manager.VolumeManager.'
+                '_clean_temporary_volume')
+    @mock.patch('cinder.db.sqlalchemy.api.volume_get')
+    def test_migrate_volume_generic_two_phases_attached(self, volume_get,
+                                                        mock_clean):
+        self.override_config('migration_delta_copy', True,
+                             group=configuration.SHARED_CONF_GROUP)
+        fake_db_new_volume = {'status': 'available', 'id': fake.VOLUME_ID}
+        volume_get.return_value = fake_volume.fake_db_volume(
+            **fake_db_new_volume)
+        host_obj = {'host': 'newhost', 'capabilities': {}}
+        volume = tests_utils.create_volume(self.context, size=1,
+                                           host=CONF.host)
+
+        def _copy_volume_data(ctxt, src_vol, dest_vol, remote=None,
+                              hashes=None, previous_hashes=None):
+            # The volume is attached while the volume is being copied.
+            db.volume_update(self.context, volume.id, {'status': 'in-use'})
+
+        with mock.patch.object(self.volume, '_copy_volume_data',
+                               side_effect=_copy_volume_data) as mock_copy:
+            self.assertRaises(exception.VolumeMigrationFailed,
+                              self.volume._migrate_volume_generic,
+                              self.context, volume, host_obj, None)
+
+        mock_copy.assert_called_once_with(self.context, volume, mock.ANY,
+                                          remote='dest', hashes=bytearray())
+        mock_clean.assert_called_once_with(self.context, volume, mock.ANY)
+
     @mock.patch('cinder.compute.API')
     @mock.patch('cinder.volume.manager.VolumeManager.'
                 'migrate_volume_completion')
@@ -581,7 +656,10 @@ class VolumeMigrationTestCase(base.BaseVolumeTestCase):
             self.assertEqual('error', volume['migration_status'])
             self.assertEqual('available', volume['status'])
             mock_copy.assert_called_once_with('foo', 'bar', 0, '1M',
-                                              sparse=True)
+                                              sparse=True, progress=mock.ANY,
+                                              streams=1, hashes=None,
+                                              previous_hashes=None,
+                                              copy_method='dd')
 
     def fake_attach_volume(self, ctxt, volume, instance_uuid, host_name,
                            mountpoint, mode):
@@ -1236,3 +1236,82 @@ def create_ordereddict(adict):
     """Given a dict, return a sorted OrderedDict."""
     return OrderedDict(sorted(adict.items(),
                               key=operator.itemgetter(0)))
+
+
+def _diff_dict(old, new, skip=()):
+    changed = {key: value for key, value in new.items()
+               if key not in skip and (key not in old or old[key] != value)}
+    removed = [key for key in old if key not in skip and key not in new]
+    return changed, removed
+
+
+def _get_pools_by_name(capabilities):
+    pools = capabilities.get('pools')
+    if not isinstance(pools, list):
+        return None
+
+    pools_by_name = OrderedDict()
+    for pool in pools:
+        name = pool.get('pool_name') if isinstance(pool, dict) else None
+        if name is None or name in pools_by_name:
+            return None
+        pools_by_name[name] = pool
+    return pools_by_name
+
+
+def diff_capabilities(old, new):
+    """Return the changes that turn the old capabilities into the new ones.
+
+    Pools are matched by their name, so the result only contains the pools,
+    and the fields within them, that were added, modified or removed.  The
+    returned delta can be applied with apply_capabilities_delta.
+    """
+    old_pools = _get_pools_by_name(old)
+    new_pools = _get_pools_by_name(new)
+    if old_pools is None or new_pools is None:
+        changed, removed = _diff_dict(old, new)
+        return {'changed': changed, 'removed': removed}
+
+    changed, removed = _diff_dict(old, new, skip=('pools',))
+    pools = {'added': [],
+             'changed': {},
+             'removed': [name for name in old_pools if name not in new_pools]}
+    for name, pool in new_pools.items():
+        if name not in old_pools:
+            pools['added'].append(pool)
+        elif pool != old_pools[name]:
+            pool_changed, pool_removed = _diff_dict(old_pools[name], pool)
+            pools['changed'][name] = {'changed': pool_changed,
+                                      'removed': pool_removed}
+    return {'changed': changed, 'removed': removed, 'pools': pools}
+
+
+def apply_capabilities_delta(capabilities, delta):
+    """Return the capabilities resulting from a diff_capabilities delta.
+
+    The passed capabilities are not modified, pools that changed are copied
+    and the ones that didn't are shared with the result.
+    """
+    result = dict(capabilities)
+    for key in delta['removed']:
+        result.pop(key, None)
+    result.update(delta['changed'])
+
+    pools_delta = delta.get('pools')
+    if pools_delta:
+        removed = set(pools_delta['removed'])
+        pools = []
+        for pool in capabilities['pools']:
+            name = pool['pool_name']
+            if name in removed:
+                continue
+            pool_delta = pools_delta['changed'].get(name)
+            if pool_delta:
+                pool = dict(pool)
+                for key in pool_delta['removed']:
+                    pool.pop(key, None)
+                pool.update(pool_delta['changed'])
+            pools.append(pool)
+        pools.extend(pools_delta['added'])
+        result['pools'] = pools
+    return result
@@ -127,6 +127,37 @@ volume_opts = [
                default=0,
                help='The upper limit of bandwidth of volume copy. '
                     '0 => unlimited'),
+    cfg.StrOpt('volume_copy_method',
+               default='dd',
+               choices=['dd', 'native'],
+               help='Method used to copy volumes available through local '
+                    'paths. dd runs a dd process for each copy, throttled '
+                    'with blkio cgroups. native copies the data in the '
+                    'volume service itself, throttled with a token bucket, '
+                    'reporting the progress of volume migrations.'),
+    cfg.IntOpt('volume_copy_streams',
+               default=1,
+               min=1,
+               help='Number of ranges of a volume copied concurrently when '
+                    'copying volume data for generic volume migrations and '
+                    'reverts to snapshots, when both volumes are available '
+                    'through local paths. Using several streams helps '
+                    'using all of the paths of multipath devices.'),
+    cfg.BoolOpt('migration_delta_copy',
+                default=False,
+                help='Copy the data of volumes that are migrated or retyped '
+                     'without locking them, and that are not attached, in '
+                     'two phases. The whole volume is copied while it can '
+                     'still be used, and then the volume is locked to copy '
+                     'the chunks that changed meanwhile, found by hashing '
+                     'them. Copies are done by cinder itself in this case.'),
+    cfg.IntOpt('volume_copy_read_ahead_chunks',
+               default=2,
+               min=1,
+               help='Number of 4 MiB chunks that reads may run ahead of '
+                    'writes when volumes are copied by cinder itself. One '
+                    'read and one write are in progress at a time, this '
+                    'only sets the number of buffers used.'),
     cfg.StrOpt('iscsi_write_cache',
                default='on',
                choices=['on', 'off'],
@@ -527,8 +558,13 @@ class BaseVD(object):
                         self.configuration.safe_get(
                             'volume_copy_blkio_cgroup_name')) or
                        CONF.volume_copy_blkio_cgroup_name)
+        copy_method = ((self.configuration and
+                        self.configuration.safe_get('volume_copy_method')) or
+                       CONF.volume_copy_method)
         self._throttle = None
-        if bps_limit:
+        if bps_limit and copy_method == 'native':
+            self._throttle = throttling.Throttle(bps_limit=int(bps_limit))
+        elif bps_limit:
             try:
                 self._throttle = throttling.BlkioCgroup(int(bps_limit),
                                                         cgroup_name)
@@ -595,6 +631,20 @@ class BaseVD(object):
         """
         return
 
+    def get_pools_stats(self, pool_names):
+        """Return the current state of some of the pools of the backend.
+
+        Drivers that can refresh the stats of a few pools faster than the
+        stats of the whole backend can implement this, so the volume manager
+        doesn't need a full refresh to report the pools its operations
+        changed.
+
+        :param pool_names: Names of the pools to refresh.
+        :returns: List of pool stats, in the same format as the pools
+                  returned by get_volume_stats.
+        """
+        raise NotImplementedError()
+
     def get_prefixed_property(self, property):
         """Return prefixed property name
 
@@ -653,7 +653,8 @@ class CommonAdapter(object):
                     dest_info['device']['path'],
                     size_in_m,
                     self.driver.configuration.volume_dd_blocksize,
-                    sparse=True)
+                    sparse=True,
+                    copy_method=self.driver.configuration.volume_copy_method)
         except Exception:
             with excutils.save_and_reraise_exception():
                 utils.ignore_exception(self.client.delete_lun,
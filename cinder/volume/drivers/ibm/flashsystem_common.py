@@ -248,7 +248,8 @@ class FlashSystemDriver(san.SanDriver,
                 src_map_device['path'],
                 dest_map_device['path'],
                 size_in_mb,
-                self.configuration.volume_dd_blocksize)
+                self.configuration.volume_dd_blocksize,
+                copy_method=self.configuration.volume_copy_method)
         except Exception:
             with excutils.save_and_reraise_exception():
                 LOG.error('Failed to copy %(src)s to %(dest)s.',
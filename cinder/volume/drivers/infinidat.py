@@ -623,11 +623,13 @@ class InfiniboxVolumeDriver(san.SanISCSIDriver):
                 dst_ctx = self._device_connect_context(volume)
                 with src_ctx as src_dev, dst_ctx as dst_dev:
                     dd_block_size = self.configuration.volume_dd_blocksize
+                    copy_method = self.configuration.volume_copy_method
                     vol_utils.copy_volume(src_dev['device']['path'],
                                           dst_dev['device']['path'],
                                           snapshot.volume.size * units.Ki,
                                           dd_block_size,
-                                          sparse=True)
+                                          sparse=True,
+                                          copy_method=copy_method)
             except Exception:
                 infinidat_volume.delete()
                 raise
@@ -676,11 +678,13 @@ class InfiniboxVolumeDriver(san.SanISCSIDriver):
             dst_ctx = self._device_connect_context(volume)
             with src_ctx as src_dev, dst_ctx as dst_dev:
                 dd_block_size = self.configuration.volume_dd_blocksize
+                copy_method = self.configuration.volume_copy_method
                 vol_utils.copy_volume(src_dev['device']['path'],
                                       dst_dev['device']['path'],
                                       src_vref.size * units.Ki,
                                       dd_block_size,
-                                      sparse=True)
+                                      sparse=True,
+                                      copy_method=copy_method)
         except Exception:
             infinidat_volume.delete()
             raise
@@ -578,7 +578,9 @@ class KaminarioCinderDriver(cinder.volume.driver.ISCSIDriver):
                                   dest_attach_info['device']['path'],
                                   snapshot.volume.size * units.Ki,
                                   self.configuration.volume_dd_blocksize,
-                                  sparse=True)
+                                  sparse=True,
+                                  copy_method=(
+                                      self.configuration.volume_copy_method))
             self._kaminario_disconnect_volume(src_attach_info,
                                               dest_attach_info)
             self.terminate_connection(volume, properties)
@@ -626,7 +628,9 @@ class KaminarioCinderDriver(cinder.volume.driver.ISCSIDriver):
                                   dest_attach_info['device']['path'],
                                   src_vref.size * units.Ki,
                                   self.configuration.volume_dd_blocksize,
-                                  sparse=True)
+                                  sparse=True,
+                                  copy_method=(
+                                      self.configuration.volume_copy_method))
             self._kaminario_disconnect_volume(src_attach_info,
                                               dest_attach_info)
             self.terminate_connection(volume, properties)
@@ -15,10 +15,12 @@ Driver for Linux servers running LVM.
 
 """
 
+import collections
 import math
 import os
 import socket
 
+import eventlet
 from oslo_concurrency import processutils
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -35,6 +37,7 @@ from cinder import interface
 from cinder import utils
 from cinder.volume import configuration
 from cinder.volume import driver
+from cinder.volume import throttling
 from cinder.volume import utils as volutils
 
 LOG = logging.getLogger(__name__)
@@ -67,7 +70,32 @@ volume_opts = [
     cfg.BoolOpt('lvm_suppress_fd_warnings',
                 default=False,
                 help='Suppress leaked file descriptor warnings in LVM '
-                     'commands.')
+                     'commands.'),
+    cfg.IntOpt('lvm_report_cache_ttl',
+               default=0,
+               min=0,
+               help='Time (in seconds) during which the lookups of logical '
+                    'volumes are answered from a single lvs report of the '
+                    'volume group instead of running an LVM command for '
+                    'each of them. The report is refreshed after the driver '
+                    'changes a logical volume. Requires LVM 2.02.158 or '
+                    'later. 0 disables the report cache.'),
+    cfg.BoolOpt('lvm_lazy_volume_clear',
+                default=False,
+                help='Clear deleted volumes in the background instead of '
+                     'during their deletion, when volume_clear is set and '
+                     'lvm_type is not thin. The logical volumes are renamed '
+                     'with a pending-clear- prefix until they are cleared '
+                     'and removed, also after a restart of the service. '
+                     'volume_clear_ionice is not used when '
+                     'volume_copy_method is native.'),
+    cfg.IntOpt('lvm_lazy_volume_clear_bps_limit',
+               default=0,
+               min=0,
+               help='The upper limit of bandwidth (in bytes per second) '
+                    'used to clear volumes in the background when '
+                    'lvm_lazy_volume_clear is set. 0 uses the limit of '
+                    'volume_copy_bps_limit.')
 ]
 
 CONF = cfg.CONF
@@ -80,6 +108,13 @@ class LVMVolumeDriver(driver.VolumeDriver):
 
     VERSION = '3.0.0'
 
+    # Prefix of the deleted volumes waiting to be cleared in the background
+    PENDING_CLEAR_PREFIX = 'pending-clear-'
+    # Seconds before clearing a volume again after a failure, doubled after
+    # every failure up to the maximum
+    CLEAR_RETRY_INTERVAL = 60
+    CLEAR_RETRY_MAX_INTERVAL = 3600
+
     # ThirdPartySystems wiki page
     CI_WIKI_NAME = "Cinder_Jenkins"
 
@@ -111,6 +146,10 @@ class LVMVolumeDriver(driver.VolumeDriver):
             executor=self._execute)
         self.protocol = self.target_driver.protocol
         self._sparse_copy_volume = False
+        self._pending_clears = collections.deque()
+        self._clear_worker = None
+        self._clear_throttle = None
+        self._clear_failures = {}
 
     def _sizestr(self, size_in_g):
         return '%sg' % size_in_g
@@ -122,6 +161,13 @@ class LVMVolumeDriver(driver.VolumeDriver):
         """Deletes a logical volume."""
         if self.configuration.volume_clear != 'none' and \
                 self.configuration.lvm_type != 'thin':
+            # Snapshots are still cleared right away, a pending snapshot
+            # would prevent the deletion of its origin.
+            if self.configuration.lvm_lazy_volume_clear and not is_snapshot:
+                pending_name = self.PENDING_CLEAR_PREFIX + volume['name']
+                self.vg.rename_volume(volume['name'], pending_name)
+                self._queue_clear(pending_name)
+                return
             self._clear_volume(volume, is_snapshot)
 
         name = volume['name']
@@ -129,9 +175,8 @@ class LVMVolumeDriver(driver.VolumeDriver):
             name = self._escape_snapshot(volume['name'])
         self.vg.delete(name)
 
-    def _clear_volume(self, volume, is_snapshot=False):
+    def _clear_volume(self, volume, is_snapshot=False, throttle=None):
         # zero out old volumes to prevent data leaking between users
-        # TODO(ja): reclaiming space should be done lazy and low priority
         if is_snapshot:
             # if the volume to be cleared is a snapshot of another volume
             # we need to clear out the volume using the -cow instead of the
@@ -166,7 +211,66 @@ class LVMVolumeDriver(driver.VolumeDriver):
         volutils.clear_volume(
             vol_sz_in_meg, dev_path,
             volume_clear=self.configuration.volume_clear,
-            volume_clear_size=self.configuration.volume_clear_size)
+            volume_clear_size=self.configuration.volume_clear_size,
+            throttle=throttle,
+            copy_method=self.configuration.volume_copy_method)
+
+    def _queue_clear(self, name):
+        """Clear and delete a pending logical volume in the background."""
+        self._pending_clears.append(name)
+        if self._clear_worker is None:
+            self._clear_worker = eventlet.spawn(self._run_pending_clears)
+
+    def _run_pending_clears(self):
+        try:
+            while self._pending_clears:
+                name = self._pending_clears.popleft()
+                try:
+                    self._clear_pending_volume(name)
+                except Exception:
+                    failures = self._clear_failures.get(name, 0)
+                    self._clear_failures[name] = failures + 1
+                    delay = min(self.CLEAR_RETRY_INTERVAL * 2 ** failures,
+                                self.CLEAR_RETRY_MAX_INTERVAL)
+                    LOG.exception('Failed to clear deleted volume %(name)s, '
+                                  'retrying in %(delay)d seconds.',
+                                  {'name': name, 'delay': delay})
+                    eventlet.spawn_after(delay, self._queue_clear, name)
+                else:
+                    self._clear_failures.pop(name, None)
+        finally:
+            self._clear_worker = None
+
+    def _clear_pending_volume(self, name):
+        lv = self.vg.get_volume(name)
+        if lv is None:
+            return
+
+        size = lv['size']
+        if not size[-1].isdigit():
+            size = size[:-1]
+        volume = {'id': name, 'name': name, 'size': int(round(float(size)))}
+
+        if self._clear_throttle is None:
+            self._clear_throttle = self._get_clear_throttle()
+        self._clear_volume(volume, throttle=self._clear_throttle)
+        self.vg.delete(name)
+        LOG.info('Successfully cleared deleted volume: %s', name)
+
+    def _get_clear_throttle(self):
+        """Return the throttle of the volumes cleared in the background."""
+        bps_limit = self.configuration.lvm_lazy_volume_clear_bps_limit
+        if not bps_limit:
+            return throttling.Throttle.get_default()
+        if self.configuration.volume_copy_method == 'native':
+            return throttling.Throttle(bps_limit=bps_limit)
+        try:
+            cgroup_name = self.configuration.volume_copy_blkio_cgroup_name
+            return throttling.BlkioCgroup(bps_limit, '%s-clear' % cgroup_name)
+        except processutils.ProcessExecutionError as err:
+            LOG.warning('Failed to activate volume clear throttling: '
+                        '%(err)s', {'err': err})
+            return throttling.Throttle.get_default()
 
     def _escape_snapshot(self, snapshot_name):
         # Linux LVM reserves name that starts with snapshot, so that
@@ -241,8 +345,18 @@ class LVMVolumeDriver(driver.VolumeDriver):
         thin_enabled = self.configuration.lvm_type == 'thin'
 
         # Calculate the total volumes used by the VG group.
-        # This includes volumes and snapshots.
-        total_volumes = len(self.vg.get_volumes())
+        # This includes volumes and snapshots, but not the deleted volumes
+        # that are still being cleared, whose space isn't free yet.
+        total_volumes = 0
+        pending_clear_capacity = 0.0
+        for lv in self.vg.get_volumes():
+            if lv['name'].startswith(self.PENDING_CLEAR_PREFIX):
+                size = lv['size']
+                if not size[-1].isdigit():
+                    size = size[:-1]
+                pending_clear_capacity += float(size)
+            else:
+                total_volumes += 1
 
         # Skip enabled_pools setting, treat the whole backend as one pool
         # XXX FIXME if multipool support is added to LVM driver.
@@ -260,6 +374,7 @@ class LVMVolumeDriver(driver.VolumeDriver):
             thin_provisioning_support=thin_enabled,
             thick_provisioning_support=not thin_enabled,
             total_volumes=total_volumes,
+            pending_clear_capacity_gb=round(pending_clear_capacity, 2),
             filter_function=self.get_filter_function(),
             goodness_function=self.get_goodness_function(),
             multiattach=True,
@@ -296,7 +411,9 @@ class LVMVolumeDriver(driver.VolumeDriver):
                     executor=self._execute,
                     lvm_conf=lvm_conf_file,
                     suppress_fd_warn=(
-                        self.configuration.lvm_suppress_fd_warnings))
+                        self.configuration.lvm_suppress_fd_warnings),
+                    report_cache_ttl=(
+                        self.configuration.lvm_report_cache_ttl))
 
             except exception.VolumeGroupNotFound:
                 message = (_("Volume Group %s does not exist") %
@@ -352,6 +469,12 @@ class LVMVolumeDriver(driver.VolumeDriver):
             # Enable sparse copy since lvm_type is 'thin'
             self._sparse_copy_volume = True
 
+        # Resume clearing the volumes deleted before the service stopped
+        for lv in self.vg.get_volumes():
+            if (lv['name'].startswith(self.PENDING_CLEAR_PREFIX) and
+                    lv['name'] not in self._pending_clears):
+                self._queue_clear(lv['name'])
+
     def create_volume(self, volume):
         """Creates a logical volume."""
         mirror_count = 0
@@ -429,7 +552,8 @@ class LVMVolumeDriver(driver.VolumeDriver):
                              snapshot['volume_size'] * units.Ki,
                              self.configuration.volume_dd_blocksize,
                              execute=self._execute,
-                             sparse=self._sparse_copy_volume)
+                             sparse=self._sparse_copy_volume,
+                             copy_method=self.configuration.volume_copy_method)
 
     def delete_volume(self, volume):
         """Deletes a logical volume."""
@@ -552,7 +676,8 @@ class LVMVolumeDriver(driver.VolumeDriver):
                 src_vref['size'] * units.Ki,
                 self.configuration.volume_dd_blocksize,
                 execute=self._execute,
-                sparse=self._sparse_copy_volume)
+                sparse=self._sparse_copy_volume,
+                copy_method=self.configuration.volume_copy_method)
         finally:
             self.delete_snapshot(temp_snapshot)
 
@@ -668,6 +793,9 @@ class LVMVolumeDriver(driver.VolumeDriver):
         cinder_ids = [resource['id'] for resource in cinder_resources]
 
         for lv in lvs:
+            if lv['name'].startswith(self.PENDING_CLEAR_PREFIX):
+                continue
+
             is_snap = self.vg.lv_is_snapshot(lv['name'])
             if ((resource_type == 'volume' and is_snap) or
                     (resource_type == 'snapshot' and not is_snap)):
@@ -787,7 +915,9 @@ class LVMVolumeDriver(driver.VolumeDriver):
                                  size_in_mb,
                                  self.configuration.volume_dd_blocksize,
                                  execute=self._execute,
-                                 sparse=self._sparse_copy_volume)
+                                 sparse=self._sparse_copy_volume,
+                                 copy_method=(
+                                     self.configuration.volume_copy_method))
         except Exception as e:
             with excutils.save_and_reraise_exception():
                 LOG.error("Volume migration failed due to "
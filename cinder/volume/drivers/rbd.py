@@ -15,11 +15,13 @@
 
 from __future__ import absolute_import
 import binascii
+import collections
 import errno
 import json
 import math
 import os
 import tempfile
+import threading
 
 from castellan import key_manager
 from eventlet import tpool
@@ -31,6 +33,7 @@ from oslo_service import loopingcall
 from oslo_utils import encodeutils
 from oslo_utils import excutils
 from oslo_utils import fileutils
+from oslo_utils import timeutils
 from oslo_utils import units
 import six
 from six.moves import urllib
@@ -97,6 +100,16 @@ RBD_OPTS = [
     cfg.IntOpt('rados_connection_interval', default=5,
                help='Interval value (in seconds) between connection '
                     'retries to ceph cluster.'),
+    cfg.IntOpt('rados_connection_pool_size', default=0, min=0,
+               help='Maximum number of idle connections to the ceph '
+                    'cluster that are kept open for each pool, so they can '
+                    'be reused instead of connecting to the monitors again '
+                    'for every operation. 0 disables the reuse of '
+                    'connections.'),
+    cfg.IntOpt('rados_connection_idle_timeout', default=300, min=1,
+               help='Time (in seconds) after which idle connections to the '
+                    'ceph cluster are closed, when rados_connection_pool_size '
+                    'is set.'),
     cfg.IntOpt('replication_connect_timeout', default=5,
                help='Timeout value (in seconds) used when connecting to '
                     'ceph cluster to do a demotion/promotion of volumes. '
@@ -114,6 +127,14 @@ RBD_OPTS = [
                      "Cinder core code for allocated_capacity_gb. This "
                      "reduces the load on the Ceph cluster as well as on the "
                      "volume service."),
+    cfg.IntOpt('rbd_usage_refresh_batch_size', default=0, min=0,
+               help='Maximum number of images opened to get their size on '
+                    'each stats refresh when rbd_exclusive_cinder_pool is '
+                    'False. The provisioned capacity is then kept up to '
+                    'date by the operations of the driver, new images are '
+                    'sized first and the sizes of the other images are '
+                    'checked again in turn. 0 opens every image of the pool '
+                    'on each refresh.'),
     cfg.BoolOpt('enable_deferred_deletion', default=False,
                 help='Enable deferred deletion. Upon deletion, volumes are '
                      'tagged for deletion but will only be removed '
@@ -162,9 +183,9 @@ class RBDVolumeProxy(object):
                                            snapshot=snapshot,
                                            read_only=read_only)
             self.volume = tpool.Proxy(self.volume)
-        except driver.rbd.Error:
+        except driver.rbd.Error as e:
             if self._close_conn:
-                driver._disconnect_from_rados(rados_client, rados_ioctx)
+                driver._disconnect_from_rados(rados_client, rados_ioctx, e)
             raise
         self.driver = driver
         self.client = rados_client
@@ -178,12 +199,99 @@ class RBDVolumeProxy(object):
             self.volume.close()
         finally:
             if self._close_conn:
-                self.driver._disconnect_from_rados(self.client, self.ioctx)
+                self.driver._disconnect_from_rados(self.client, self.ioctx,
+                                                   value)
 
     def __getattr__(self, attrib):
         return getattr(self.volume, attrib)
 
 
+class RADOSConnectionPool(object):
+    """Idle connections to ceph kept for reuse.
+
+    Connections are kept by key, and at most `size` idle connections are kept
+    for each key. Connections that have been idle for more than
+    `idle_timeout` seconds, that are no longer connected, or that were
+    released as unhealthy, are closed instead of being reused.
+    """
+
+    def __init__(self, size, idle_timeout):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        # Idle (client, ioctx, released at) tuples, by key
+        self._idle = collections.defaultdict(list)
+        # Keys of the connections made for the pool, by ioctx
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _is_healthy(client, ioctx):
+        return (getattr(client, 'state', 'connected') == 'connected' and
+                getattr(ioctx, 'state', 'open') == 'open')
+
+    @staticmethod
+    def _close(client, ioctx):
+        try:
+            ioctx.close()
+            client.shutdown()
+        except Exception as e:
+            LOG.debug('Failed to close a pooled ceph connection: %s', e)
+
+    def _pop_expired(self):
+        now = timeutils.now()
+        expired = []
+        for key, connections in self._idle.items():
+            alive = []
+            for connection in connections:
+                if now - connection[2] > self.idle_timeout:
+                    expired.append(connection)
+                else:
+                    alive.append(connection)
+            self._idle[key] = alive
+        for client, ioctx, __ in expired:
+            self._keys.pop(ioctx, None)
+        return expired
+
+    def get(self, key):
+        """Return an idle (client, ioctx) connection, or None."""
+        result = None
+        with self._lock:
+            closing = self._pop_expired()
+            connections = self._idle[key]
+            while connections:
+                client, ioctx, __ = connections.pop()
+                if self._is_healthy(client, ioctx):
+                    result = (client, ioctx)
+                    break
+                self._keys.pop(ioctx, None)
+                closing.append((client, ioctx, None))
+
+        for client, ioctx, __ in closing:
+            self._close(client, ioctx)
+        return result
+
+    def add(self, key, client, ioctx):
+        """Register a new connection so it is kept when released."""
+        with self._lock:
+            self._keys[ioctx] = key
+
+    def release(self, client, ioctx, healthy=True):
+        """Keep a connection for reuse, or close it."""
+        with self._lock:
+            closing = self._pop_expired()
+            key = self._keys.get(ioctx)
+            if (healthy and key is not None and
+                    len(self._idle[key]) < self.size and
+                    self._is_healthy(client, ioctx)):
+                self._idle[key].append((client, ioctx, timeutils.now()))
+            else:
+                self._keys.pop(ioctx, None)
+                closing.append((client, ioctx, None))
+
+        for client, ioctx, __ in closing:
+            self._close(client, ioctx)
+
+
 class RADOSClient(object):
     """Context manager to simplify error handling for connecting to ceph."""
     def __init__(self, driver, pool=None):
@@ -194,7 +302,7 @@ class RADOSClient(object):
         return self
 
     def __exit__(self, type_, value, traceback):
-        self.driver._disconnect_from_rados(self.cluster, self.ioctx)
+        self.driver._disconnect_from_rados(self.cluster, self.ioctx, value)
 
     @property
     def features(self):
@@ -242,6 +350,17 @@ class RBDDriver(driver.CloneableImageVD, driver.MigrateVD,
         self._is_replication_enabled = False
         self._replication_targets = []
         self._target_names = []
+        self._connection_pool = None
+        if self.configuration.rados_connection_pool_size:
+            self._connection_pool = RADOSConnectionPool(
+                self.configuration.rados_connection_pool_size,
+                self.configuration.rados_connection_idle_timeout)
+        # Provisioned size of the images of the pool, in the order they were
+        # last checked, once rbd_usage_refresh_batch_size has seeded it.
+        self._image_sizes = None
+        # Size changes made by the driver operations while the sizes are
+        # being refreshed, to apply them to the refreshed sizes.
+        self._image_size_changes = None
 
     def _get_target_config(self, target_id):
         """Get a replication target from known replication targets."""
@@ -417,9 +536,28 @@ class RBDDriver(driver.CloneableImageVD, driver.MigrateVD,
                 client.shutdown()
                 raise exception.VolumeBackendAPIException(data=msg)
 
-        return _do_conn(pool, remote, timeout)
-
-    def _disconnect_from_rados(self, client, ioctx):
+        if not self._connection_pool:
+            return _do_conn(pool, remote, timeout)
+
+        key = self._get_config_tuple(remote) + (
+            pool or self.configuration.rbd_pool, timeout)
+        connection = self._connection_pool.get(key)
+        if connection:
+            return connection
+        client, ioctx = _do_conn(pool, remote, timeout)
+        self._connection_pool.add(key, client, ioctx)
+        return client, ioctx
+
+    def _disconnect_from_rados(self, client, ioctx, error=None):
+        """Close or release a connection, after error if one was raised."""
+        if self._connection_pool:
+            # The state of a connection doesn't change when librados or librbd
+            # calls fail, so connections that raised are not reused in case
+            # they are broken.
+            healthy = error is None or not isinstance(
+                error, (self.rados.Error, self.rbd.Error))
+            self._connection_pool.release(client, ioctx, healthy)
+            return
         # closing an ioctx cannot raise an exception
         ioctx.close()
         client.shutdown()
@@ -464,23 +602,72 @@ class RBDDriver(driver.CloneableImageVD, driver.MigrateVD,
         We must include all volumes, not only Cinder created volumes, because
         Cinder created volumes are reported by the Cinder core code as
         allocated_capacity_gb.
+
+        When rbd_usage_refresh_batch_size is set, only the first call opens
+        every image. Later calls only list the images and open at most that
+        many of them, the ones we don't know the size of first, and rely on
+        the driver operations to keep the sizes of the others up to date.
         """
-        total_provisioned = 0
-        with RADOSClient(self) as client:
-            for t in self.RBDProxy().list(client.ioctx):
-                try:
-                    with RBDVolumeProxy(self, t, read_only=True,
-                                        client=client.cluster,
-                                        ioctx=client.ioctx) as v:
-                        size = v.size()
-                except (self.rbd.ImageNotFound, self.rbd.OSError):
-                    LOG.debug("Image %s is not found.", t)
+        batch_size = self.configuration.rbd_usage_refresh_batch_size
+        if batch_size:
+            # Opening the images yields to other greenthreads, record the
+            # changes they make from now on to not lose them.
+            self._image_size_changes = []
+        try:
+            with RADOSClient(self) as client:
+                images = self.RBDProxy().list(client.ioctx)
+                if not batch_size or self._image_sizes is None:
+                    sizes = collections.OrderedDict()
+                    to_check = images
                 else:
-                    total_provisioned += size
-
-        total_provisioned = math.ceil(float(total_provisioned) / units.Gi)
+                    listed = set(images)
+                    sizes = collections.OrderedDict(
+                        (name, size)
+                        for name, size in self._image_sizes.items()
+                        if name in listed)
+                    to_check = ([name for name in images
+                                 if name not in sizes] +
+                                list(sizes))[:batch_size]
+
+                for t in to_check:
+                    # Checked images go to the end to be checked again last
+                    sizes.pop(t, None)
+                    try:
+                        with RBDVolumeProxy(self, t, read_only=True,
+                                            client=client.cluster,
+                                            ioctx=client.ioctx) as v:
+                            sizes[t] = v.size()
+                    except (self.rbd.ImageNotFound, self.rbd.OSError):
+                        LOG.debug("Image %s is not found.", t)
+
+            if batch_size:
+                for change in self._image_size_changes:
+                    self._update_image_sizes(sizes, *change)
+                self._image_sizes = sizes
+        finally:
+            self._image_size_changes = None
+        total_provisioned = math.ceil(float(sum(sizes.values())) / units.Gi)
         return total_provisioned
 
+    def _set_image_size(self, name, size=None, new_name=None):
+        """Update the known size of an image.
+
+        Removes the image when size is None, unless new_name is set in which
+        case its size is kept under the new name.
+        """
+        if self._image_size_changes is not None:
+            self._image_size_changes.append((name, size, new_name))
+        if self._image_sizes is not None:
+            self._update_image_sizes(self._image_sizes, name, size, new_name)
+
+    @staticmethod
+    def _update_image_sizes(sizes, name, size, new_name):
+        old_size = sizes.pop(utils.convert_str(name), None)
+        if new_name:
+            name, size = new_name, old_size
+        if size is not None:
+            sizes[utils.convert_str(name)] = size
+
     def _get_pool_stats(self):
         """Gets pool free and total capacity in GiB.
 
@@ -891,6 +1078,7 @@ class RBDDriver(driver.CloneableImageVD, driver.MigrateVD,
                                    order,
                                    old_format=False,
                                    features=client.features)
+        self._set_image_size(vol_name, size)
 
         try:
             volume_update = self._setup_volume(volume)
@@ -943,6 +1131,7 @@ class RBDDriver(driver.CloneableImageVD, driver.MigrateVD,
 
         with RBDVolumeProxy(self, volume.name) as vol:
             vol.resize(size)
+        self._set_image_size(volume.name, size)
 
     def create_volume_from_snapshot(self, volume, snapshot):
         """Creates a volume from a snapshot."""
@@ -1111,7 +1300,9 @@ class RBDDriver(driver.CloneableImageVD, driver.MigrateVD,
                 except self.rbd.ImageNotFound:
                     LOG.info("RBD volume %s not found, allowing delete "
                              "operation to proceed.", volume_name)
+                    self._set_image_size(volume_name)
                     return
+                self._set_image_size(volume_name)
 
                 # If it is a clone, walk back up the parent chain deleting
                 # references.
@@ -1124,6 +1315,7 @@ class RBDDriver(driver.CloneableImageVD, driver.MigrateVD,
                 # will be deleted when it's snapshot and clones are deleted.
                 new_name = "%s.deleted" % (volume_name)
                 self.RBDProxy().rename(client.ioctx, volume_name, new_name)
+                self._set_image_size(volume_name, new_name=new_name)
 
     def create_snapshot(self, snapshot):
         """Creates an rbd snapshot."""
@@ -1623,6 +1815,7 @@ class RBDDriver(driver.CloneableImageVD, driver.MigrateVD,
             self.RBDProxy().rename(client.ioctx,
                                    utils.convert_str(rbd_name),
                                    utils.convert_str(volume.name))
+        self._set_image_size(rbd_name, new_name=volume.name)
 
     def manage_existing_get_size(self, volume, existing_ref):
         """Return size of an existing image for manage_existing.
@@ -1750,6 +1943,7 @@ class RBDDriver(driver.CloneableImageVD, driver.MigrateVD,
                 self.RBDProxy().rename(client.ioctx,
                                        utils.convert_str(existing_name),
                                        utils.convert_str(wanted_name))
+                self._set_image_size(existing_name, new_name=wanted_name)
             except (self.rbd.ImageNotFound, self.rbd.ImageExists):
                 LOG.error('Unable to rename the logical volume '
                           'for volume %s.', volume.id)
@@ -673,12 +673,16 @@ class CreateVolumeFromSpecTask(flow_utils.CinderTask):
         # NOTE(mnaser): This check *only* happens if the backend is not able
         #               to clone volumes and we have to resort to downloading
         #               the image from Glance and uploading it.
+        # Raw images streamed to the volume don't need any temporary space,
+        # unless they fall back to a temporary file, which is checked then.
+        streamed = image_utils.is_streamable_image(image_meta)
         if CONF.image_conversion_dir:
             fileutils.ensure_tree(CONF.image_conversion_dir)
         try:
-            image_utils.check_available_space(
-                CONF.image_conversion_dir,
-                image_meta['size'], image_id)
+            if not streamed:
+                image_utils.check_available_space(
+                    CONF.image_conversion_dir,
+                    image_meta['size'], image_id)
         except exception.ImageTooBig as err:
             with excutils.save_and_reraise_exception():
                 self.message.create(
@@ -718,7 +722,62 @@ class CreateVolumeFromSpecTask(flow_utils.CinderTask):
         original_size = volume.size
         backend_name = volume_utils.extract_host(volume.service_topic_queue)
         try:
-            if not cloned:
+            if not cloned and streamed:
+                try:
+                    # The image is verified while it is copied.
+                    virtual_size = image_utils.check_virtual_size(
+                        image_meta['size'], volume.size, image_id)
+                    if should_create_cache_entry:
+                        if virtual_size and virtual_size != original_size:
+                            volume.size = virtual_size
+                            volume.save()
+                    model_update = self._create_from_image_download(
+                        context,
+                        volume,
+                        image_location,
+                        image_meta,
+                        image_service
+                    )
+                    if CONF.verify_glance_signatures != 'disabled':
+                        tmp_images = (image_utils.TemporaryImages.
+                                      for_image_service(image_service))
+                        verified = tmp_images.pop_verified(context, image_id)
+                        if (verified is None and
+                                image_utils.is_signed_image(image_meta)):
+                            # The driver didn't copy the image with the
+                            # image_utils helpers, which verify it.
+                            image_utils.check_available_space(
+                                CONF.image_conversion_dir,
+                                image_meta['size'], image_id)
+                            with image_utils.TemporaryImages.fetch(
+                                    image_service, context, image_id,
+                                    backend_name) as tmp_image:
+                                verified = (
+                                    image_utils.verify_glance_image_signature(
+                                        context, image_service, image_id,
+                                        tmp_image))
+                        self.db.volume_glance_metadata_bulk_create(
+                            context, volume.id,
+                            {'signature_verified': bool(verified)})
+                except exception.ImageTooBig as e:
+                    with excutils.save_and_reraise_exception():
+                        self.message.create(
+                            context,
+                            message_field.Action.COPY_IMAGE_TO_VOLUME,
+                            resource_uuid=volume.id,
+                            detail=
+                            message_field.Detail.NOT_ENOUGH_SPACE_FOR_IMAGE,
+                            exception=e)
+                except exception.ImageSignatureVerificationException as err:
+                    with excutils.save_and_reraise_exception():
+                        self.message.create(
+                            context,
+                            message_field.Action.COPY_IMAGE_TO_VOLUME,
+                            resource_uuid=volume.id,
+                            detail=
+                            message_field.Detail.SIGNATURE_VERIFICATION_FAILED,
+                            exception=err)
+            elif not cloned:
                 try:
                     with image_utils.TemporaryImages.fetch(
                             image_service, context, image_id,
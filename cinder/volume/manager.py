@@ -36,10 +36,12 @@ intact.
 """
 
 
+import copy
 import requests
 import time
 
 from castellan import key_manager
+import eventlet
 from oslo_config import cfg
 from oslo_log import log as logging
 import oslo_messaging as messaging
@@ -162,6 +164,24 @@ volume_backend_opts = [
                help='Size of the native threads pool for the backend.  '
                     'Increase for backends that heavily rely on this, like '
                     'the RBD driver.'),
+    cfg.IntOpt('driver_stats_max_age',
+               default=0,
+               min=0,
+               help='Maximum age, in seconds, of the backend stats reported '
+                    'to the schedulers. When set, the stats are collected '
+                    'in the background and reused while they are younger '
+                    'than this, so reporting the capabilities does not wait '
+                    'for the backend. Pools changed by volume operations '
+                    'are refreshed before that on drivers that can refresh '
+                    'individual pools. 0 collects the stats from the '
+                    'backend every time they are reported.'),
+    cfg.IntOpt('driver_stats_timeout',
+               default=5,
+               min=0,
+               help='Time, in seconds, to wait for a background collection '
+                    'of the backend stats before reporting the last stats '
+                    'collected instead. Only used when driver_stats_max_age '
+                    'is set.'),
 ]
 
 CONF = cfg.CONF
@@ -223,6 +243,13 @@ class VolumeManager(manager.CleanableManager,
             self.configuration.backend_native_threads_pool_size)
         self.stats = {}
         self.service_uuid = None
+        # Last stats collected from the driver, when they were collected, the
+        # greenthread collecting them and the pools changed since then.
+        self._driver_stats = None
+        self._driver_stats_time = None
+        self._stats_collector = None
+        self._stale_pools = set()
+        self._pools_stats_supported = True
 
         if not volume_driver:
             # Get from configuration, which will get the default
@@ -2084,8 +2111,12 @@ class VolumeManager(manager.CleanableManager,
                     LOG.error('Unable to terminate volume connection: '
                               '%(err)s.', {'err': err})
 
-    def _copy_volume_data(self, ctxt, src_vol, dest_vol, remote=None):
-        """Copy data from src_vol to dest_vol."""
+    def _copy_volume_data(self, ctxt, src_vol, dest_vol, remote=None,
+                          hashes=None, previous_hashes=None):
+        """Copy data from src_vol to dest_vol.
+
+        See vol_utils.copy_volume for hashes and previous_hashes.
+        """
 
         LOG.debug('_copy_volume_data %(src)s -> %(dest)s.',
                   {'src': src_vol['name'], 'dest': dest_vol['name']})
@@ -2131,18 +2162,41 @@ class VolumeManager(manager.CleanableManager,
                                   capabilities.get('sparse_copy_volume',
                                                    False))
 
+        migrating = src_vol.get('migration_status') == 'migrating'
+
+        def _report_progress(progress):
+            LOG.info("Copying volume %(src)s to %(dest)s: %(progress)s.",
+                     {'src': src_vol['id'], 'dest': dest_vol['id'],
+                      'progress': progress})
+            if migrating:
+                self.db.volume_admin_metadata_update(
+                    ctxt.elevated(), src_vol['id'],
+                    {'migration_progress': six.text_type(progress)}, False)
+
         try:
             size_in_mb = int(src_vol['size']) * units.Ki    # vol size is in GB
+            progress = vol_utils.CopyProgress(size_in_mb * units.Mi,
+                                              _report_progress)
+            copy_streams = self.configuration.volume_copy_streams
             vol_utils.copy_volume(src_attach_info['device']['path'],
                                   dest_attach_info['device']['path'],
                                   size_in_mb,
                                   self.configuration.volume_dd_blocksize,
-                                  sparse=sparse_copy_volume)
+                                  sparse=sparse_copy_volume,
+                                  progress=progress,
+                                  streams=copy_streams,
+                                  hashes=hashes,
+                                  previous_hashes=previous_hashes,
+                                  copy_method=(
+                                      self.configuration.volume_copy_method))
         except Exception:
             with excutils.save_and_reraise_exception():
                 LOG.error("Failed to copy volume %(src)s to %(dest)s.",
                           {'src': src_vol['id'], 'dest': dest_vol['id']})
         finally:
+            if migrating:
+                self.db.volume_admin_metadata_delete(
+                    ctxt.elevated(), src_vol['id'], 'migration_progress')
             try:
                 self._detach_volume(ctxt, dest_attach_info, dest_vol,
                                     properties, force=True,
@@ -2220,13 +2274,22 @@ class VolumeManager(manager.CleanableManager,
             new_volume.save()
 
         # Copy the source volume to the destination volume
+        two_phases = (self.configuration.migration_delta_copy and
+                      (volume.status == 'available' or
+                       (volume.status == 'retyping' and
+                        volume.previous_status == 'available')))
         try:
             attachments = volume.volume_attachment
             if not attachments:
                 # Pre- and post-copy driver-specific actions
                 self.driver.before_volume_copy(ctxt, volume, new_volume,
                                                remote='dest')
-                self._copy_volume_data(ctxt, volume, new_volume, remote='dest')
+                if two_phases:
+                    self._copy_volume_data_in_two_phases(ctxt, volume,
+                                                         new_volume)
+                else:
+                    self._copy_volume_data(ctxt, volume, new_volume,
+                                           remote='dest')
                 self.driver.after_volume_copy(ctxt, volume, new_volume,
                                               remote='dest')
 
@@ -2247,9 +2310,46 @@ class VolumeManager(manager.CleanableManager,
                 LOG.exception(
                     "Failed to copy volume %(vol1)s to %(vol2)s", {
                         'vol1': volume.id, 'vol2': new_volume.id})
+                # Unlock the volume locked by the two phases copy.
+                if two_phases and volume.status == 'maintenance':
+                    volume.status = 'available'
+                    volume.save()
                 self._clean_temporary_volume(ctxt, volume,
                                              new_volume)
 
+    def _copy_volume_data_in_two_phases(self, ctxt, volume, new_volume):
+        """Copy the data of a volume that is being migrated unlocked.
+
+        The whole volume is copied while it can still be attached and used,
+        and then it's locked in maintenance, or retyping for a retype, until
+        the migration completes, to copy the parts of the volume that changed
+        in the meantime.
+        """
+        locked_status = 'maintenance'
+        if volume.status == 'retyping':
+            # Retyped volumes can be used during the first copy too.
+            locked_status = volume.status
+            volume.status = 'available'
+            volume.save()
+
+        hashes = bytearray()
+        self._copy_volume_data(ctxt, volume, new_volume, remote='dest',
+                               hashes=hashes)
+
+        # A volume attached during the copy is not migrated with a copy but
+        # with the help of Nova, so it can't be completed here.
+        if not volume.conditional_update(
+                {'status': locked_status},
+                {'status': 'available',
+                 'attach_status': fields.VolumeAttachStatus.DETACHED}):
+            msg = _("volume was attached during the migration")
+            raise exception.VolumeMigrationFailed(reason=msg)
+
+        LOG.info("Copying changes of volume %(vol1)s to %(vol2)s.",
+                 {'vol1': volume.id, 'vol2': new_volume.id})
+        self._copy_volume_data(ctxt, volume, new_volume, remote='dest',
+                               previous_hashes=hashes)
+
     def _clean_temporary_volume(self, ctxt, volume, new_volume,
                                 clean_db_only=False):
         # If we're in the migrating phase, we need to cleanup
@@ -2525,7 +2625,10 @@ class VolumeManager(manager.CleanableManager,
                         resource={'type': 'driver',
                                   'id': self.driver.__class__.__name__})
         else:
-            volume_stats = self.driver.get_volume_stats(refresh=True)
+            volume_stats = self._get_driver_stats()
+            if volume_stats is None:
+                LOG.debug('No stats collected from the backend yet.')
+                return
             if self.extra_capabilities:
                 volume_stats.update(self.extra_capabilities)
             if volume_stats:
@@ -2582,6 +2685,65 @@ class VolumeManager(manager.CleanableManager,
                 # queue it to be sent to the Schedulers.
                 self.update_service_capabilities(volume_stats)
 
+    def _get_driver_stats(self):
+        """Return the stats of the driver to report to the schedulers.
+
+        With driver_stats_max_age set the stats are collected by a background
+        greenthread, and we only wait driver_stats_timeout seconds for it
+        before returning the last stats that were collected, or None if there
+        are none yet.
+        """
+        max_age = self.configuration.driver_stats_max_age
+        if not max_age:
+            return self.driver.get_volume_stats(refresh=True)
+
+        if self._stats_collector is None:
+            if (self._driver_stats is None or
+                    timeutils.is_older_than(self._driver_stats_time,
+                                            max_age)):
+                self._stats_collector = self._tp.spawn(
+                    self._collect_driver_stats)
+            elif self._stale_pools and self._pools_stats_supported:
+                self._stats_collector = self._tp.spawn(
+                    self._collect_driver_stats, self._stale_pools)
+                self._stale_pools = set()
+
+        if self._stats_collector is not None:
+            with eventlet.Timeout(self.configuration.driver_stats_timeout,
+                                  False):
+                self._stats_collector.wait()
+
+        # The stats we report get modified, so keep the collected ones intact
+        return copy.deepcopy(self._driver_stats)
+
+    def _collect_driver_stats(self, pool_names=None):
+        """Collect the stats of the backend, or only those of some pools."""
+        start = timeutils.utcnow()
+        try:
+            if pool_names:
+                pools = {pool['pool_name']: pool
+                         for pool in self.driver.get_pools_stats(pool_names)}
+                stats = copy.deepcopy(self._driver_stats)
+                stats['pools'] = [pools.pop(pool['pool_name'], pool)
+                                  for pool in stats.get('pools', [])]
+                stats['pools'].extend(pools.values())
+            else:
+                self._stale_pools = set()
+                stats = copy.deepcopy(self.driver.get_volume_stats(
+                    refresh=True))
+                self._driver_stats_time = start
+            self._driver_stats = stats
+        except NotImplementedError:
+            LOG.debug('Driver cannot refresh the stats of individual pools.')
+            self._pools_stats_supported = False
+        except Exception:
+            LOG.exception('Failed to collect the stats of the backend, '
+                          'reporting the last ones collected.')
+            if pool_names:
+                self._stale_pools.update(pool_names)
+        finally:
+            self._stats_collector = None
+
     def _append_volume_stats(self, vol_stats):
         pools = vol_stats.get('pools', None)
         if pools:
@@ -2626,10 +2788,10 @@ class VolumeManager(manager.CleanableManager,
         return volume_stats
 
     @periodic_task.periodic_task
-    def publish_service_capabilities(self, context):
+    def publish_service_capabilities(self, context, full_report=False):
         """Collect driver status and then publish."""
         self._report_driver_status(context)
-        self._publish_service_capabilities(context)
+        self._publish_service_capabilities(context, full_report=full_report)
 
     def _notify_about_volume_usage(self,
                                    context,
@@ -3419,6 +3581,7 @@ class VolumeManager(manager.CleanableManager,
                                                                  True)
 
         vol_size = -vol['size'] if decrement else vol['size']
+        self._stale_pools.add(pool)
         try:
             self.stats['pools'][pool]['allocated_capacity_gb'] += vol_size
         except KeyError:
@@ -134,9 +134,10 @@ class VolumeAPI(rpc.RPCAPI):
                failover_replication, and list_replication_targets.
         3.15 - Add revert_to_snapshot method
         3.16 - Add no_snapshots to accept_transfer method
+        3.17 - Add full_report to publish_service_capabilities method
     """
 
-    RPC_API_VERSION = '3.16'
+    RPC_API_VERSION = '3.17'
     RPC_DEFAULT_VERSION = '3.0'
     TOPIC = constants.VOLUME_TOPIC
     BINARY = constants.VOLUME_BINARY
@@ -235,9 +236,19 @@ class VolumeAPI(rpc.RPCAPI):
         cctxt = self._get_cctxt(volume.service_topic_queue)
         cctxt.cast(ctxt, 'remove_export', volume_id=volume['id'])
 
-    def publish_service_capabilities(self, ctxt):
-        cctxt = self._get_cctxt(fanout=True)
-        cctxt.cast(ctxt, 'publish_service_capabilities')
+    def publish_service_capabilities(self, ctxt, host=None):
+        msg_args = {}
+        version = '3.17'
+        if self.client.can_send_version(version):
+            msg_args['full_report'] = True
+        else:
+            version = '3.0'
+
+        if host:
+            cctxt = self._get_cctxt(host, version=version)
+        else:
+            cctxt = self._get_cctxt(fanout=True, version=version)
+        cctxt.cast(ctxt, 'publish_service_capabilities', **msg_args)
 
     def accept_transfer(self, ctxt, volume, new_user, new_project,
                         no_snapshots=False):
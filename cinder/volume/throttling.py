@@ -17,7 +17,9 @@
 
 
 import contextlib
+import time
 
+import eventlet
 from oslo_concurrency import processutils
 from oslo_log import log as logging
 
@@ -29,10 +31,40 @@ from cinder import utils
 LOG = logging.getLogger(__name__)
 
 
+class TokenBucket(object):
+    """Token bucket limiting an amount per second, such as bytes per second.
+
+    The bucket holds up to one second worth of tokens, so short bursts are
+    allowed while the average rate is kept under the limit.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.timestamp = time.time()
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(self.rate,
+                          self.tokens + (now - self.timestamp) * self.rate)
+        self.timestamp = now
+
+    def consume(self, amount):
+        """Take amount tokens from the bucket, waiting until it has them."""
+        self._refill()
+        self.tokens -= amount
+        if self.tokens < 0:
+            # Requests larger than the bucket are allowed, they just leave it
+            # in debt for a while.
+            eventlet.sleep(-self.tokens / self.rate)
+
+
 class Throttle(object):
     """Base class for throttling disk I/O bandwidth"""
 
     DEFAULT = None
+    bps_limit = 0
+    _bucket = None
 
     @staticmethod
     def set_default(throttle):
@@ -42,8 +74,9 @@ class Throttle(object):
     def get_default():
         return Throttle.DEFAULT or Throttle()
 
-    def __init__(self, prefix=None):
+    def __init__(self, prefix=None, bps_limit=0):
         self.prefix = prefix or []
+        self.bps_limit = bps_limit
 
     @contextlib.contextmanager
     def subcommand(self, srcpath, dstpath):
@@ -55,6 +88,19 @@ class Throttle(object):
         """
         yield {'prefix': self.prefix}
 
+    def consume(self, nbytes):
+        """Throttle nbytes of I/O done by cinder itself.
+
+        Copies that don't run in a sub-command, like copies between file
+        handles, call this before transferring data. All of the copies using
+        the same throttle share its bandwidth limit.
+        """
+        if not self.bps_limit:
+            return
+        if self._bucket is None:
+            self._bucket = TokenBucket(self.bps_limit)
+        self._bucket.consume(nbytes)
+
 
 class BlkioCgroup(Throttle):
     """Throttle disk I/O bandwidth using blkio cgroups."""
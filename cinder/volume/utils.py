@@ -16,13 +16,18 @@
 
 
 import ast
+import errno
 import functools
+import hashlib
+import io
 import json
 import math
+import mmap
 import operator
 import os
 from os import urandom
 import re
+import sys
 import tempfile
 import time
 import uuid
@@ -63,6 +68,8 @@ CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
 GB = units.Gi
+# Size of the chunk digests used to find the chunks changed between copies.
+_HASH_SIZE = hashlib.sha256().digest_size
 # These attributes we will attempt to save for the volume if they exist
 # in the source image metadata.
 IMAGE_ATTRIBUTES = (
@@ -451,7 +458,12 @@ def check_for_odirect_support(src, dest, flag='oflag=direct'):
 
 def _copy_volume_with_path(prefix, srcstr, deststr, size_in_m, blocksize,
                            sync=False, execute=utils.execute, ionice=None,
-                           sparse=False):
+                           sparse=False, offset_m=None):
+    """Copy a volume with dd.
+
+    If offset_m is set only size_in_m MB of the volume starting at offset_m
+    are copied, without truncating the destination.
+    """
     cmd = prefix[:]
 
     if ionice:
@@ -463,15 +475,28 @@ def _copy_volume_with_path(prefix, srcstr, deststr, size_in_m, blocksize,
     cmd.extend(('dd', 'if=%s' % srcstr, 'of=%s' % deststr,
                 'count=%d' % size_in_bytes, 'bs=%s' % blocksize))
 
+    iflag = ['count_bytes']
+    oflag = []
+    if offset_m is not None:
+        cmd.extend(('skip=%d' % (offset_m * units.Mi),
+                    'seek=%d' % (offset_m * units.Mi)))
+        iflag.append('skip_bytes')
+        oflag.append('seek_bytes')
+
     # Use O_DIRECT to avoid thrashing the system buffer cache
     odirect = check_for_odirect_support(srcstr, deststr, 'iflag=direct')
+    if odirect:
+        iflag.append('direct')
 
-    cmd.append('iflag=count_bytes,direct' if odirect else 'iflag=count_bytes')
+    cmd.append('iflag=%s' % ','.join(iflag))
 
     if check_for_odirect_support(srcstr, deststr, 'oflag=direct'):
-        cmd.append('oflag=direct')
+        oflag.append('direct')
         odirect = True
 
+    if oflag:
+        cmd.append('oflag=%s' % ','.join(oflag))
+
     # If the volume is being unprovisioned then
     # request the data is persisted before returning,
     # so that it's not discarded from the cache.
@@ -480,6 +505,8 @@ def _copy_volume_with_path(prefix, srcstr, deststr, size_in_m, blocksize,
         conv.append('fdatasync')
     if sparse:
         conv.append('sparse')
+    if offset_m is not None:
+        conv.append('notrunc')
     if conv:
         conv_options = 'conv=' + ",".join(conv)
         cmd.append(conv_options)
@@ -504,54 +531,302 @@ def _copy_volume_with_path(prefix, srcstr, deststr, size_in_m, blocksize,
              {'size_in_m': size_in_m, 'mbps': mbps})
 
 
-def _open_volume_with_path(path, mode):
+def _open_direct(path, mode):
+    """Open a file with O_DIRECT, returning None if it isn't supported."""
+    flags = os.O_DIRECT
+    if '+' in mode:
+        flags |= os.O_RDWR
+    elif 'r' in mode:
+        flags |= os.O_RDONLY
+    else:
+        flags |= os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+    try:
+        fd = os.open(path, flags)
+    except OSError as e:
+        if e.errno == errno.EINVAL:
+            return None
+        raise
+    return io.FileIO(fd, mode.replace('b', ''))
+
+
+def _open_volume_with_path(path, mode, direct=False):
     try:
         with utils.temporary_chown(path):
+            # O_DIRECT requires aligned buffers, which can't be used with
+            # memoryview on python 2.
+            if direct and six.PY3 and hasattr(os, 'O_DIRECT'):
+                handle = _open_direct(path, mode)
+                if handle:
+                    return handle
             handle = open(path, mode)
             return handle
     except Exception:
         LOG.error("Failed to open volume from %(path)s.", {'path': path})
 
 
-def _transfer_data(src, dest, length, chunk_size):
-    """Transfer data between files (Python IO objects)."""
+def _get_fileno(handle):
+    try:
+        return handle.fileno()
+    except (AttributeError, EnvironmentError, ValueError):
+        # io.UnsupportedOperation or a closed file
+        return None
 
-    chunks = int(math.ceil(length / chunk_size))
-    remaining_length = length
 
-    LOG.debug("%(chunks)s chunks of %(bytes)s bytes to be transferred.",
-              {'chunks': chunks, 'bytes': chunk_size})
+def _transfer_data_in_kernel(src, dest, length, chunk_size, throttle,
+                             progress=None):
+    """Transfer data between files without copying it to user space.
 
-    for chunk in range(0, chunks):
-        before = time.time()
-        data = tpool.execute(src.read, min(chunk_size, remaining_length))
+    Uses copy_file_range, or sendfile, on the file descriptors of the files.
+    Returns False, without transferring anything, when the files or the
+    platform don't support it.
+    """
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    sendfile = getattr(os, 'sendfile', None)
+    src_fd = _get_fileno(src)
+    dest_fd = _get_fileno(dest)
+    if ((not copy_file_range and not sendfile) or
+            src_fd is None or dest_fd is None):
+        return False
 
-        # If we have reached end of source, discard any extraneous bytes from
-        # destination volume if trim is enabled and stop writing.
-        if data == b'':
+    src_offset = src.tell()
+    tpool.execute(dest.flush)
+    dest_offset = dest.tell()
+    if not copy_file_range:
+        os.lseek(dest_fd, dest_offset, os.SEEK_SET)
+
+    copied = 0
+    while copied < length:
+        count = min(chunk_size, length - copied)
+        throttle.consume(count)
+        try:
+            if copy_file_range:
+                transferred = tpool.execute(copy_file_range, src_fd, dest_fd,
+                                            count, src_offset + copied,
+                                            dest_offset + copied)
+            else:
+                transferred = tpool.execute(sendfile, dest_fd, src_fd,
+                                            src_offset + copied, count)
+        except OSError as e:
+            if not copied and e.errno in (errno.EINVAL, errno.ENOSYS,
+                                          errno.EXDEV, errno.EBADF,
+                                          errno.EOPNOTSUPP):
+                return False
+            raise
+        # End of source
+        if not transferred:
             break
-
-        tpool.execute(dest.write, data)
-        remaining_length -= len(data)
-        delta = (time.time() - before)
-        rate = (chunk_size / delta) / units.Ki
-        LOG.debug("Transferred chunk %(chunk)s of %(chunks)s (%(rate)dK/s).",
-                  {'chunk': chunk + 1, 'chunks': chunks, 'rate': rate})
-
+        copied += transferred
+        if progress:
+            progress.update(transferred)
         # yield to any other pending operations
         eventlet.sleep(0)
 
+    src.seek(src_offset + copied)
+    dest.seek(dest_offset + copied)
+    return True
+
+
+class CopyProgress(object):
+    """Progress of a volume copy done by cinder.
+
+    The callback is called with this object at most once every interval
+    seconds while the copy progresses.
+    """
+
+    def __init__(self, total, callback=None, interval=30):
+        self.total = total
+        self.copied = 0
+        self.callback = callback
+        self.interval = interval
+        self.start_time = self.last_report = time.time()
+
+    @property
+    def rate(self):
+        """Bytes copied per second."""
+        return self.copied / max(time.time() - self.start_time, 0.001)
+
+    @property
+    def eta(self):
+        """Seconds left to finish the copy, None if unknown."""
+        rate = self.rate
+        if not rate:
+            return None
+        return (self.total - self.copied) / rate
+
+    def update(self, nbytes):
+        self.copied += nbytes
+        now = time.time()
+        if self.callback and now - self.last_report >= self.interval:
+            self.last_report = now
+            self.callback(self)
+
+    def __str__(self):
+        eta = self.eta
+        return ('%(copied)d of %(total)d bytes (%(rate).2f MB/s, ETA '
+                '%(eta)s)' % {'copied': self.copied, 'total': self.total,
+                              'rate': self.rate / units.Mi,
+                              'eta': '%ds' % eta if eta is not None
+                              else 'unknown'})
+
+
+def _write_all(dest, data):
+    # Raw files may write less than requested.
+    while data:
+        written = dest.write(data)
+        if written is None or written >= len(data):
+            return
+        data = data[written:]
+
+
+def _get_reader(src):
+    """Return a function reading from src into a memoryview."""
+    try:
+        # RawIOBase subclasses that only implement read inherit a readinto
+        # that doesn't work.
+        src.readinto(memoryview(bytearray(0)))
+        return src.readinto
+    except (AttributeError, NotImplementedError, EnvironmentError,
+            ValueError):
+        pass
+
+    def _readinto(view):
+        data = src.read(len(view))
+        view[:len(data)] = data
+        return len(data)
+    return _readinto
+
+
+def _alloc_buffer(size):
+    """Return a zeroed writable buffer of size bytes.
+
+    Anonymous maps are page aligned, as O_DIRECT requires, but memoryview
+    can't be used on them on python 2, where bytearray is used instead.
+    """
+    if six.PY3:
+        return mmap.mmap(-1, size)
+    return bytearray(size)
+
+
+def _transfer_data(src, dest, length, chunk_size, sparse=False,
+                   throttle=None, read_ahead=1, progress=None, hashes=None,
+                   previous_hashes=None):
+    """Transfer data between files (Python IO objects).
+
+    Data is read into a pool of read_ahead preallocated page aligned
+    buffers, usable with O_DIRECT, by a separate greenthread, so reads can
+    run ahead of writes by that many chunks. When both files have a file
+    descriptor the data is transferred by the kernel instead.
+
+    When sparse is set, chunks that only contain zeros are skipped by seeking
+    the destination forward instead of writing them, like dd's conv=sparse.
+    This is ignored when previous_hashes are given.
+
+    The sha256 digest of every chunk is appended to the hashes bytearray when
+    given, and chunks whose digest is the same in previous_hashes are not
+    written, so only the chunks that changed since a previous transfer are.
+    """
+
+    throttle = throttle or throttling.Throttle()
+    LOG.debug("%(length)s bytes to be transferred in chunks of %(bytes)s "
+              "bytes.", {'length': length, 'bytes': chunk_size})
+
+    hashing = hashes is not None or previous_hashes is not None
+    if not sparse and not hashing and _transfer_data_in_kernel(
+            src, dest, length, chunk_size, throttle, progress):
+        tpool.execute(dest.flush)
+        return
+
+    # A chunk that changed to zeros since previous_hashes were taken must be
+    # written, the destination still has the old data there.
+    # Python 2 file objects have no seekable() but always are.
+    sparse = (sparse and not previous_hashes and
+              getattr(dest, 'seekable', lambda: True)())
+    zeros = memoryview(_alloc_buffer(chunk_size)) if sparse else None
+    readinto = _get_reader(src)
+    # Handles of connectors may only accept bytes.
+    to_bytes = _get_fileno(dest) is None
+    free = eventlet.queue.LightQueue()
+    filled = eventlet.queue.LightQueue()
+    for i in range(read_ahead):
+        free.put(_alloc_buffer(chunk_size))
+
+    def _read():
+        remaining_length = length
+        try:
+            while remaining_length > 0:
+                buf = free.get()
+                view = memoryview(buf)[:min(chunk_size, remaining_length)]
+                read = tpool.execute(readinto, view)
+                # If we have reached end of source, stop writing.
+                if not read:
+                    break
+                throttle.consume(read)
+                digest = None
+                if hashing:
+                    digest = tpool.execute(
+                        lambda: hashlib.sha256(view[:read]).digest())
+                filled.put((buf, read, digest))
+                remaining_length -= read
+        finally:
+            filled.put(None)
+
+    reader = eventlet.spawn(_read)
+    skipped = False
+    try:
+        for index, (buf, read, digest) in enumerate(iter(filled.get, None)):
+            view = memoryview(buf)[:read]
+            skipped = sparse and view == zeros[:read]
+            if hashes is not None:
+                hashes.extend(digest)
+            if (previous_hashes and
+                    previous_hashes[index * _HASH_SIZE:
+                                    (index + 1) * _HASH_SIZE] == digest):
+                # Unchanged, so the destination already has it.
+                dest.seek(read, os.SEEK_CUR)
+                skipped = False
+            elif skipped:
+                dest.seek(read, os.SEEK_CUR)
+            else:
+                tpool.execute(_write_all, dest,
+                              view.tobytes() if to_bytes else view)
+            free.put(buf)
+            if progress:
+                progress.update(read)
+        reader.wait()
+    finally:
+        reader.kill()
+
+    # Write the last block so that the destination gets its full length,
+    # writing a single byte wouldn't work with O_DIRECT.
+    if skipped:
+        tail = zeros[:min(read, 4 * units.Ki)]
+        dest.seek(-len(tail), os.SEEK_CUR)
+        tpool.execute(_write_all, dest, tail.tobytes() if to_bytes else tail)
+
     tpool.execute(dest.flush)
 
 
-def _copy_volume_with_file(src, dest, size_in_m):
+def _copy_volume_with_file(src, dest, size_in_m, sparse=False,
+                           throttle=None, sync=False, progress=None,
+                           offset_m=None, hashes=None, previous_hashes=None):
+    """Copy a volume between file handles or paths, in cinder itself.
+
+    If offset_m is set only size_in_m MB of the volume starting at offset_m
+    are copied, without truncating the destination. This requires src and
+    dest to be paths.
+
+    See _transfer_data for hashes and previous_hashes.
+    """
+    # Use O_DIRECT to avoid thrashing the system buffer cache, like dd.
     src_handle = src
     if isinstance(src, six.string_types):
-        src_handle = _open_volume_with_path(src, 'rb')
+        src_handle = _open_volume_with_path(src, 'rb', direct=True)
 
     dest_handle = dest
     if isinstance(dest, six.string_types):
-        dest_handle = _open_volume_with_path(dest, 'wb')
+        truncate = offset_m is None and previous_hashes is None
+        dest_handle = _open_volume_with_path(
+            dest, 'wb' if truncate else 'r+b', direct=True)
 
     if not src_handle:
         raise exception.DeviceUnavailable(
@@ -561,9 +836,23 @@ def _copy_volume_with_file(src, dest, size_in_m):
         raise exception.DeviceUnavailable(
             _("Failed to copy volume, destination device unavailable."))
 
+    if offset_m is not None:
+        src_handle.seek(offset_m * units.Mi)
+        dest_handle.seek(offset_m * units.Mi)
+
     start_time = timeutils.utcnow()
 
-    _transfer_data(src_handle, dest_handle, size_in_m * units.Mi, units.Mi * 4)
+    _transfer_data(src_handle, dest_handle, size_in_m * units.Mi, units.Mi * 4,
+                   sparse=sparse, throttle=throttle,
+                   read_ahead=CONF.volume_copy_read_ahead_chunks,
+                   progress=progress, hashes=hashes,
+                   previous_hashes=previous_hashes)
+
+    # If the volume is being unprovisioned then request the data is
+    # persisted before returning, so that it's not discarded from the cache.
+    dest_fd = _get_fileno(dest_handle)
+    if sync and dest_fd is not None:
+        tpool.execute(os.fsync, dest_fd)
 
     duration = max(1, timeutils.delta_seconds(start_time, timeutils.utcnow()))
 
@@ -578,9 +867,31 @@ def _copy_volume_with_file(src, dest, size_in_m):
              {'size_in_m': size_in_m, 'mbps': mbps})
 
 
+def _copy_volume(src, dest, size_in_m, blocksize, sync, execute, ionice,
+                 throttle, sparse, progress, copy_method, offset_m=None,
+                 hashes=None, previous_hashes=None):
+    # dd can't compute hashes.
+    if (isinstance(src, six.string_types) and
+            isinstance(dest, six.string_types) and
+            copy_method != 'native' and
+            hashes is None and previous_hashes is None):
+        with throttle.subcommand(src, dest) as throttle_cmd:
+            _copy_volume_with_path(throttle_cmd['prefix'], src, dest,
+                                   size_in_m, blocksize, sync=sync,
+                                   execute=execute, ionice=ionice,
+                                   sparse=sparse, offset_m=offset_m)
+    else:
+        _copy_volume_with_file(src, dest, size_in_m, sparse=sparse,
+                               throttle=throttle, sync=sync,
+                               progress=progress, offset_m=offset_m,
+                               hashes=hashes,
+                               previous_hashes=previous_hashes)
+
+
 def copy_volume(src, dest, size_in_m, blocksize, sync=False,
                 execute=utils.execute, ionice=None, throttle=None,
-                sparse=False):
+                sparse=False, progress=None, streams=1, hashes=None,
+                previous_hashes=None, copy_method=None):
     """Copy data from the source volume to the destination volume.
 
     The parameters 'src' and 'dest' are both typically of type str, which
@@ -591,25 +902,65 @@ def copy_volume(src, dest, size_in_m, blocksize, sync=False,
     If either 'src' or 'dest' are not of type str, then they are assumed to be
     of type RawIOBase or any derivative that supports file operations such as
     read and write.  In this case, the handles are treated as file handles
-    instead of file paths and, at present moment, throttling is unavailable.
+    instead of file paths, and the copy is done by cinder itself, throttled
+    by the bandwidth limit of the throttle. Paths are also copied by cinder
+    itself when copy_method, volume_copy_method by default, is native, in
+    which case ionice is not used.
+
+    Copies between paths can be split in up to 'streams' ranges of the
+    volume, copied concurrently.
+
+    The sha256 digest of every 4 MB chunk of the volume is appended to the
+    hashes bytearray when given. When previous_hashes, the hashes of a
+    previous copy to the same destination, are given only the chunks that
+    changed since then are copied. Both are done by cinder itself, in a
+    single stream.
+
+    The progress of copies done by cinder is reported to the optional
+    CopyProgress object.
     """
 
-    if (isinstance(src, six.string_types) and
-            isinstance(dest, six.string_types)):
-        if not throttle:
-            throttle = throttling.Throttle.get_default()
-        with throttle.subcommand(src, dest) as throttle_cmd:
-            _copy_volume_with_path(throttle_cmd['prefix'], src, dest,
-                                   size_in_m, blocksize, sync=sync,
-                                   execute=execute, ionice=ionice,
-                                   sparse=sparse)
-    else:
-        _copy_volume_with_file(src, dest, size_in_m)
+    if not throttle:
+        throttle = throttling.Throttle.get_default()
+
+    if copy_method is None:
+        copy_method = CONF.volume_copy_method
+
+    if (not isinstance(src, six.string_types) or
+            not isinstance(dest, six.string_types) or
+            hashes is not None or previous_hashes is not None):
+        streams = 1
+    streams = max(1, min(streams, size_in_m))
+    if streams == 1:
+        _copy_volume(src, dest, size_in_m, blocksize, sync, execute, ionice,
+                     throttle, sparse, progress, copy_method, hashes=hashes,
+                     previous_hashes=previous_hashes)
+        return
+
+    range_size = int(math.ceil(float(size_in_m) / streams))
+    LOG.debug("Copying volume in %(streams)d streams of %(size)d MB.",
+              {'streams': streams, 'size': range_size})
+    copies = [eventlet.spawn(_copy_volume, src, dest,
+                             min(range_size, size_in_m - offset), blocksize,
+                             sync, execute, ionice, throttle, sparse,
+                             progress, copy_method, offset)
+              for offset in range(0, size_in_m, range_size)]
+    # Wait for all of the copies before raising any error, so no copy is
+    # left running.
+    failure = None
+    for copy in copies:
+        try:
+            copy.wait()
+        except Exception:
+            if failure is None:
+                failure = sys.exc_info()
+    if failure:
+        six.reraise(*failure)
 
 
 def clear_volume(volume_size, volume_path, volume_clear=None,
                  volume_clear_size=None, volume_clear_ionice=None,
-                 throttle=None):
+                 throttle=None, copy_method=None):
     """Unprovision old volumes to prevent data leaking between users."""
     if volume_clear is None:
         volume_clear = CONF.volume_clear
@@ -632,7 +983,8 @@ def clear_volume(volume_size, volume_path, volume_clear=None,
                            CONF.volume_dd_blocksize,
                            sync=True, execute=utils.execute,
                            ionice=volume_clear_ionice,
-                           throttle=throttle, sparse=False)
+                           throttle=throttle, sparse=False,
+                           copy_method=copy_method)
     else:
         raise exception.InvalidConfigurationValue(
             option='volume_clear',